@@ -30,6 +30,7 @@ import logging
 from pyglossary import core  # essential
 from pyglossary import VERSION
 from pyglossary.text_utils import startRed, endFormat
+from pyglossary.conversion_plan import parseByteSize
 
 # the first thing to do is to set up logger.
 # other modules also using logger 'root', so it's essential to set it up prior
@@ -138,6 +139,36 @@ parser.add_argument(
 	action='store_false',
 	default=None,
 )
+parser.add_argument(
+	'--progress-json-fd',
+	dest='progressJsonFd',
+	type=int,
+	default=None,
+	help='write progress (entries/s, MB/s, ETA, stage) as JSON lines'
+		 ' into this file descriptor',
+)
+parser.add_argument(
+	'--checkpoint',
+	dest='checkpoint',
+	action='store_true',
+	default=None,
+	help='periodically save the state of conversion into'
+		 ' OUTPUT_FILE.checkpoint, so it can be resumed with --resume',
+)
+parser.add_argument(
+	'--resume',
+	dest='resume',
+	action='store_true',
+	default=None,
+	help='resume an interrupted conversion from OUTPUT_FILE.checkpoint',
+)
+parser.add_argument(
+	'--checkpoint-interval',
+	dest='checkpointInterval',
+	type=float,
+	default=None,
+	help='minimum seconds between two checkpoints, default: 300',
+)
 parser.add_argument(
 	'--sort',
 	dest='sort',
@@ -155,6 +186,17 @@ parser.add_argument(
 	dest='sortCacheSize',
 	type=int,
 	default=None,
+	help='use heap-based stream sort with this cache size in direct mode'
+		 ', instead of external sort',
+)
+parser.add_argument(
+	'--memory-budget',
+	dest='memoryBudget',
+	type=parseByteSize,
+	default=None,
+	help='maximum memory to use (like 512M or 2G) for choosing between'
+		 ' direct, indirect and external sort modes'
+		 ', default: half of available memory',
 )
 
 parser.add_argument(
@@ -282,8 +324,13 @@ prefOptionsKeys = (
 convertOptionsKeys = (
 	'direct',
 	'progressbar',
+	'progressJsonFd',
+	'checkpoint',
+	'resume',
+	'checkpointInterval',
 	'sort',
 	'sortCacheSize',
+	'memoryBudget',
 	# 'sortKey',# or sortAlg FIXME
 )
 
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import os
+from os.path import isfile
+from time import time as now
+
+from .json_utils import dataToPrettyJson, jsonToData
+
+import logging
+log = logging.getLogger("root")
+
+
+class Checkpoint(object):
+	"""
+	Saves the state of a long running conversion into a JSON file
+	(periodically), so that it can be resumed if it dies.
+
+	Saved data is a dict:
+		"header": a dict that identifies the conversion
+			(input and output files and formats)
+		"entryIndex": number of entries that are written
+		"reader": state of reader, or None
+			returned by `reader.checkpointState()`
+			which can be passed to `reader.resumeFrom(state)`
+		"writer": state of writer, returned by the function that the
+			writer has passed to `glos.setCheckpointWriter`
+	"""
+	def __init__(self, filename, header, interval=300):
+		"""
+		filename (str): path of checkpoint file
+		header (dict): identifies the conversion, must be JSON-serializable
+		interval (int or float): minimum seconds between two checkpoints
+		"""
+		self.filename = filename
+		self.header = header
+		self.interval = interval
+		self._lastTime = now()
+
+	def isDue(self):
+		return now() - self._lastTime >= self.interval
+
+	def load(self):
+		"""
+		returns saved data (dict), or None if there is no valid checkpoint
+		"""
+		if not isfile(self.filename):
+			return
+		try:
+			with open(self.filename, encoding="utf-8") as fp:
+				data = jsonToData(fp.read())
+		except Exception:
+			log.exception(
+				"error while loading checkpoint file %r" % self.filename
+			)
+			return
+		if data.get("header") != self.header:
+			log.error(
+				"checkpoint file %r belongs to another conversion" %
+				self.filename
+			)
+			log.pretty(data.get("header"), "checkpoint header: ")
+			return
+		return data
+
+	def save(self, entryIndex, readerState, writerState):
+		"""
+		writes checkpoint file atomically
+		"""
+		data = {
+			"header": self.header,
+			"entryIndex": entryIndex,
+			"reader": readerState,
+			"writer": writerState,
+		}
+		tmpFilename = self.filename + ".tmp"
+		with open(tmpFilename, "w", encoding="utf-8") as fp:
+			fp.write(dataToPrettyJson(data))
+			fp.flush()
+			os.fsync(fp.fileno())
+		os.replace(tmpFilename, self.filename)
+		self._lastTime = now()
+		log.debug("Saved checkpoint at entry %s" % entryIndex)
+
+	def invalidate(self):
+		"""
+		removes the last checkpoint, that does not match the output files
+		anymore, and makes the next checkpoint due
+		"""
+		self.remove()
+		self._lastTime = 0
+
+	def remove(self):
+		try:
+			os.remove(self.filename)
+		except OSError:
+			pass
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+import os
+from os.path import (
+	isfile,
+	splitext,
+	dirname,
+	basename,
+	join,
+)
+
+from .flags import *
+from .os_utils import getAvailableMemory
+
+import logging
+log = logging.getLogger("root")
+
+MB = 1024 ** 2
+
+byteSizeUnits = {
+	"": 1,
+	"k": 1024,
+	"m": 1024 ** 2,
+	"g": 1024 ** 3,
+	"t": 1024 ** 4,
+}
+
+# input files with these extensions are compressed, we assume
+# the uncompressed size is `compressionFactor` times bigger
+compressedExtensions = (".gz", ".bz2", ".zip", ".dz", ".xz")
+compressionFactor = 4
+
+
+def parseByteSize(text):
+	"""
+	parses a size like "512M", "2G", "2gb" or "1048576"
+	returns size in bytes (int)
+	"""
+	text = text.strip().lower()
+	if text.endswith("b"):
+		text = text[:-1]
+	unit = ""
+	if text and text[-1] in byteSizeUnits:
+		unit = text[-1]
+		text = text[:-1]
+	return int(float(text) * byteSizeUnits[unit])
+
+
+def estimateInputSize(filename):
+	"""
+	returns estimated (uncompressed) size of input glossary in bytes,
+	or 0 if not known
+
+	for multi-file formats like StarDict (.ifo, .idx, .dict.dz, .syn)
+	or Octopus MDict (.mdx, .mdd), the files that have the same name
+	(without extension) in the same directory are counted too
+	"""
+	if not isfile(filename):
+		# directory formats (Edlin, Wikipedia dump) may have millions
+		# of files, walking them is too slow
+		return 0
+	direc = dirname(filename)
+	prefix = basename(filename).split(os.extsep)[0] + os.extsep
+	size = 0
+	for fname in os.listdir(direc or os.curdir):
+		if not fname.startswith(prefix):
+			continue
+		fpath = join(direc, fname)
+		if not isfile(fpath):
+			continue
+		fsize = os.path.getsize(fpath)
+		if splitext(fname)[1].lower() in compressedExtensions:
+			fsize *= compressionFactor
+		size += fsize
+	return size
+
+
+class ConversionPlan(object):
+	"""
+	Decides how to convert a glossary, based on the (estimated) size of
+	input, whether or not output format requires sorting, and the amount
+	of memory we are allowed to use.
+
+	Possible modes:
+		"direct": stream entries from reader to writer, no sort
+		"indirect": load all entries into memory, sort them in memory
+		"external": stream entries and sort them with bounded memory,
+			using sorted chunks in temporary files (external merge sort)
+
+	`memoryBudget` (bytes) defaults to half of available memory,
+	or None (unlimited) if available memory is not known.
+	"""
+	# memory used by loaded entries (python objects),
+	# relative to the size of their text in input file
+	memoryFactor = 4
+	minChunkBytes = 16 * MB
+
+	def __init__(
+		self,
+		inputSize,
+		sortOnWrite,
+		sort=None,
+		direct=None,
+		sortCacheSize=None,
+		memoryBudget=None,
+	):
+		"""
+		inputSize (int): estimated size of input in bytes, or 0 if not known
+		sortOnWrite (str): `sortOnWrite` of output plugin
+		sort, direct, sortCacheSize: options given by user, or None
+		memoryBudget (int or None): maximum memory in bytes
+		"""
+		self.inputSize = inputSize
+		self.memoryBudget = memoryBudget
+		self.mode = ""
+		self.direct = direct
+		self.sortCacheSize = sortCacheSize
+		self.sortChunkBytes = 0  # 0 means no external sort
+		self.reason = ""
+
+		if self.memoryBudget is None:
+			available = getAvailableMemory()
+			if available:
+				self.memoryBudget = available // 2
+
+		needSort = {
+			ALWAYS: True,
+			DEFAULT_YES: sort is not False,
+			DEFAULT_NO: sort is True,
+			NEVER: False,
+		}.get(sortOnWrite, bool(sort))
+
+		if not needSort:
+			if direct is False:
+				self._setMode("indirect", "chosen by user")
+			else:
+				self._setMode("direct", "no sort is needed")
+			return
+
+		if sortCacheSize and direct is not False:
+			# user asked for (approximate) heap-based stream sort
+			if sortOnWrite == ALWAYS:
+				self._setMode("indirect", "output format requires full sort")
+			else:
+				self._setMode(
+					"direct",
+					"stream sort with cache size %s" % sortCacheSize,
+				)
+			return
+
+		if direct is False:
+			self._setMode("indirect", "chosen by user")
+			return
+
+		if direct is None:
+			if not self.memoryBudget:
+				self._setMode("indirect", "available memory is not known")
+				return
+			if not self.inputSize:
+				self._setMode("indirect", "input size is not known")
+				return
+			estimatedMemory = self.inputSize * self.memoryFactor
+			if estimatedMemory <= self.memoryBudget:
+				self._setMode(
+					"indirect",
+					"estimated memory %d MB <= budget %d MB" % (
+						estimatedMemory // MB,
+						self.memoryBudget // MB,
+					),
+				)
+				return
+			reason = "estimated memory %d MB > budget %d MB" % (
+				estimatedMemory // MB,
+				self.memoryBudget // MB,
+			)
+		else:
+			reason = "direct mode chosen by user"
+
+		self.sortChunkBytes = self.getSortChunkBytes(self.memoryBudget)
+		self._setMode("external", reason)
+
+	@classmethod
+	def getSortChunkBytes(cls, memoryBudget):
+		"""
+		returns size of external sort chunks in bytes
+		memoryBudget: bytes, or None if not known
+		"""
+		chunkBytes = cls.minChunkBytes
+		if memoryBudget:
+			# half of budget for sort chunk, the rest for reader, writer
+			# and merge buffers
+			chunkBytes = max(
+				chunkBytes,
+				memoryBudget // (2 * cls.memoryFactor),
+			)
+		return chunkBytes
+
+	def _setMode(self, mode, reason):
+		self.mode = mode
+		self.reason = reason
+		if mode != "indirect":
+			self.direct = True
+		else:
+			self.direct = False
+
+	def log(self):
+		if self.mode == "external":
+			log.info(
+				"Conversion plan: external sort with chunks of %d MB (%s)" % (
+					self.sortChunkBytes // MB,
+					self.reason,
+				)
+			)
+		else:
+			log.info("Conversion plan: %s mode (%s)" % (self.mode, self.reason))
+		log.debug(
+			"Input size: %d MB, memory budget: %s" % (
+				self.inputSize // MB,
+				"%d MB" % (self.memoryBudget // MB)
+				if self.memoryBudget else "unlimited",
+			)
+		)
@@ -33,6 +33,20 @@ class DataEntry(object): # or Resource? FIXME
 	def getFileName(self):
 		return self._fname
 
+	def getSize(self):
+		"""
+			returns (approximate) size of entry in memory, in bytes
+		"""
+		return len(self._fname) + len(self._data)
+
+	def getDataSize(self):
+		"""
+			returns size of data in bytes, without reading temp file
+		"""
+		if self._tmpPath:
+			return os.path.getsize(self._tmpPath)
+		return len(self._data)
+
 	def getData(self):
 		if self._tmpPath:
 			with open(self._tmpPath, "rb") as fromFile:
@@ -172,6 +186,18 @@ class Entry(object):
 		self._defi = defi
 		self._defiFormat = defiFormat
 
+	def getSize(self):
+		"""
+			returns (approximate) size of entry text, in characters
+		"""
+		size = 0
+		for part in (self._word, self._defi):
+			if isinstance(part, str):
+				size += len(part)
+			else:
+				size += sum(len(item) for item in part)
+		return size
+
 	def getWord(self):
 		"""
 			returns string of word,
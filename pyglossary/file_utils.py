@@ -19,6 +19,17 @@ def fileCountLines(filename, newline='\n'):
 	)
 
 
+def openTruncated(filename, size):
+	"""
+	opens binary file for writing, after truncating it to `size` bytes
+	used to resume writing a file from a checkpoint
+	"""
+	f = open(filename, 'r+b')
+	f.truncate(size)
+	f.seek(size)
+	return f
+
+
 class FileLineWrapper(object):
 	def __init__(self, f):
 		self.f = f
@@ -39,8 +39,8 @@ import subprocess
 import re
 
 import pkgutil
-from collections import Counter
 from collections import OrderedDict as odict
+from itertools import islice
 
 import io
 
@@ -49,12 +49,17 @@ from . import core
 from .core import VERSION, userPluginsDir
 from .entry import Entry, DataEntry
 from .entry_filters import *
-from .sort_stream import hsortStreamList
+from .sort_stream import hsortStreamList, externalSortStream
+from .progress_reporter import ProgressReporter
+from .checkpoint import Checkpoint
+from .conversion_plan import ConversionPlan, estimateInputSize
+from .glossary_stats import GlossaryStats
 
 from .text_utils import (
 	fixUtf8,
 )
-from .os_utils import indir
+from .os_utils import indir, getProcessMemory
+from .file_utils import openTruncated
 
 
 homePage = "https://github.com/ilius/pyglossary"
@@ -72,6 +77,30 @@ def get_ext(path):
 	return splitext(path)[1].lower()
 
 
+class SpilledReader(object):
+	"""
+	a reader that is partially loaded into memory, and then moved to
+	direct mode because memory budget is exceeded
+	(see Glossary._spillToDirectMode)
+	"""
+	def __init__(self, entries, gen, reader):
+		"""
+		entries: generator of loaded entries, and then the rest of `gen`
+		gen: partially consumed generator of `reader`
+		"""
+		self._entries = entries
+		self._gen = gen
+		self._reader = reader
+
+	def __iter__(self):
+		return self._entries
+
+	def close(self):
+		self._entries.close()
+		self._gen.close()
+		self._reader.close()
+
+
 class Glossary(object):
 	"""
 	Direct access to glos.data is droped
@@ -100,6 +129,9 @@ class Glossary(object):
 		##
 		"license": "copyright",
 	}
+	# seconds between progress updates (UI and JSON stream)
+	progressInterval = 0.5
+
 	plugins = {}  # format => pluginModule
 	readFormats = []
 	writeFormats = []
@@ -240,10 +272,22 @@ class Glossary(object):
 		self._entryFilters = []
 		self._sortKey = None
 		self._sortCacheSize = 1000
+		# if non-zero, sort in direct mode with external merge sort
+		# keeping at most this many bytes of entries in memory
+		self._sortChunkBytes = 0
+		self._memoryBudget = None  # bytes, or None
 
 		self._filename = ""
 		self._defaultDefiFormat = "m"
 		self._progressbar = True
+		self._progressJsonFile = None
+		self._readerInputSize = {}  # reader => size of input file in bytes
+
+		self._checkpoint = None  # Checkpoint instance, or None
+		self._resumeData = None  # data loaded from checkpoint, or None
+		self._checkpointWriterFunc = None
+
+		self._stats = GlossaryStats()
 
 	def __init__(self, info=None, ui=None):
 		"""
@@ -301,6 +345,7 @@ class Glossary(object):
 
 	def addEntryObj(self, entry):
 		self._data.append(entry.getRaw())
+		self._stats.update(entry)
 
 	def newEntry(self, word, defi, defiFormat=None):
 		"""
@@ -317,43 +362,116 @@ class Glossary(object):
 		"""
 		self.addEntryObj(self.newEntry(word, defi, defiFormat))
 
+	def _progressEnabled(self):
+		return bool(
+			(self.ui and self._progressbar) or
+			self._progressJsonFile
+		)
+
+	def _progressGen(
+		self,
+		entries,
+		title,
+		wordCount=0,
+		fractionFunc=None,
+		inputSize=0,
+	):
+		"""
+		iterates over `entries`, while a ProgressReporter thread
+		reports the progress, so we only update a counter per entry
+		"""
+		reporter = ProgressReporter(
+			ui=self.ui if self._progressbar else None,
+			jsonFile=self._progressJsonFile,
+			interval=self.progressInterval,
+		)
+		reporter.start(
+			title,
+			total=wordCount,
+			fractionFunc=fractionFunc,
+			totalBytes=inputSize,
+		)
+		try:
+			for index, entry in enumerate(entries):
+				yield entry
+				reporter.count = index + 1
+				if reporter.pending:
+					reporter.flush()
+		finally:
+			reporter.stop()
+
 	def _loadedEntryGen(self):
-		wordCount = len(self._data)
-		progressbar = self.ui and self._progressbar
-		if progressbar:
-			self.progressInit("Writing")
-		for index, rawEntry in enumerate(self._data):
-			yield Entry.fromRaw(
+		entries = (
+			Entry.fromRaw(
 				rawEntry,
 				defaultDefiFormat=self._defaultDefiFormat
 			)
-			if progressbar:
-				self.progress(index, wordCount)
-		if progressbar:
-			self.progressEnd()
+			for rawEntry in self._data
+		)
+		if not self._progressEnabled():
+			return entries
+		return self._progressGen(
+			entries,
+			"Writing",
+			wordCount=len(self._data),
+		)
+
+	def _readerProgressGen(self, reader, title):
+		"""
+		iterates over `reader` and reports the progress, if enabled
+		does not close `reader`
+
+		if reader has a `progressFraction` method (which returns a float
+		between 0 and 1, based on consumed input bytes), it is used instead
+		of `len(reader)`, because for many formats computing the length
+		takes a full extra pass over the input
+		"""
+		if not self._progressEnabled():
+			for entry in reader:
+				yield entry
+			return
+
+		fractionFunc = getattr(reader, "progressFraction", None)
+		wordCount = 0
+		if fractionFunc is None:
+			try:
+				wordCount = len(reader)
+			except Exception:
+				log.exception("")
+
+		for entry in self._progressGen(
+			reader,
+			title,
+			wordCount=wordCount,
+			fractionFunc=fractionFunc,
+			inputSize=self._readerInputSize.get(reader, 0),
+		):
+			yield entry
 
 	def _readersEntryGen(self):
 		for reader in self._readers:
-			wordCount = 0
-			progressbar = False
-			if self.ui and self._progressbar:
-				try:
-					wordCount = len(reader)
-				except Exception:
-					log.exception("")
-				if wordCount:
-					progressbar = True
-			if progressbar:
-				self.progressInit("Converting")
+			if isinstance(reader, SpilledReader):
+				# progress of reader is already reported while loading
+				gen = iter(reader)
+			else:
+				gen = self._readerProgressGen(reader, "Converting")
 			try:
-				for index, entry in enumerate(reader):
+				for entry in gen:
 					yield entry
-					if progressbar:
-						self.progress(index, wordCount)
 			finally:
+				gen.close()
 				reader.close()
-			if progressbar:
-				self.progressEnd()
+
+	def _statsGen(self, gen):
+		"""
+		collects statistics of entries in direct mode
+		"""
+		stats = self._stats
+		for entry in gen:
+			if entry:
+				stats.update(entry)
+			yield entry
+		stats.complete = True
 
 	def _applyEntryFiltersGen(self, gen):
 		for entry in gen:
@@ -366,6 +484,74 @@ class Glossary(object):
 			else:
 				yield entry
 
+	def setCheckpointWriter(self, stateFunc):
+		"""
+		must be called by writers that support checkpoints
+			(plugins with `supportsCheckpoint = True`)
+			after they have started iterating over glossary
+
+		stateFunc: a function with no arguments that flushes output files
+			and returns a JSON-serializable state of the writer,
+			that will be given back to writer by `getResumeWriterState`
+			when the conversion is resumed
+		"""
+		self._checkpointWriterFunc = stateFunc
+
+	def invalidateCheckpoint(self):
+		"""
+		must be called by writers (that support checkpoints) before they
+		rewrite the files that are written so far, in a way that the last
+		checkpoint can not be resumed from
+		the last checkpoint is removed, and the next one is saved as soon
+		as the current entry is written
+		"""
+		if self._checkpoint:
+			self._checkpoint.invalidate()
+
+	def getResumeWriterState(self):
+		"""
+		returns the saved state of writer if we are resuming a conversion
+		from a checkpoint, or None
+		writer must continue from that state, entries that are already
+		written are not given to writer again
+		"""
+		if not self._resumeData:
+			return
+		return self._resumeData["writer"]
+
+	def _checkpointGen(self, gen, reader=None):
+		"""
+		reader: the reader to save (and resume) its position, or None
+			only possible in direct mode with one reader and without sort
+			if None, we skip the entries that are already written
+			(when resuming)
+		"""
+		gen = iter(gen)
+		checkpoint = self._checkpoint
+		entryIndex = 0
+		if self._resumeData:
+			entryIndex = self._resumeData["entryIndex"]
+			readerState = self._resumeData["reader"]
+			if reader and readerState is not None:
+				log.info("Resuming reader from checkpoint")
+				reader.resumeFrom(readerState)
+			else:
+				log.info(
+					"Skipping %s entries that are already written" %
+					entryIndex
+				)
+				for _ in islice(gen, entryIndex):
+					pass
+		for entry in gen:
+			yield entry
+			entryIndex += 1
+			if self._checkpointWriterFunc and checkpoint.isDue():
+				checkpoint.save(
+					entryIndex,
+					reader.checkpointState() if reader else None,
+					self._checkpointWriterFunc(),
+				)
+
 	def __iter__(self):
 		if self._iter is None:
 			log.error(
@@ -407,11 +593,29 @@ class Glossary(object):
 	def infoKeys(self):
 		return list(self._info.keys())
 
+	def getStats(self):
+		"""
+		returns GlossaryStats instance
+		in indirect mode, statistics are complete after reading
+		in direct mode, they are complete after writer has iterated over
+		all entries, unless the reader knows them (`stats.get(key)` is not None)
+		"""
+		return self._stats
+
 	def getMostUsedDefiFormats(self, count=None):
-		return Counter([
-			entry.getDefiFormat()
-			for entry in self
-		]).most_common(count)
+		"""
+		returns a list of (defiFormat, count) tuples
+		does not iterate over glossary, statistics are collected while
+		loading (indirect mode), or given by reader (direct mode)
+		"""
+		mostUsed = self._stats.getMostUsedDefiFormats(count)
+		if mostUsed is None:
+			log.error(
+				"Definition formats are not known before iterating"
+				" over glossary in direct mode"
+			)
+			return []
+		return mostUsed
 
 	# def formatInfoKeys(self, format):# FIXME
 
@@ -484,6 +688,7 @@ class Glossary(object):
 		format="",
 		direct=False,
 		progressbar=True,
+		progressJsonFd=None,
 		**options
 	):
 		"""
@@ -491,6 +696,8 @@ class Glossary(object):
 		format (str): name of input format,
 					  or "" to detect from file extention
 		direct (bool): enable direct mode
+		progressJsonFd (int or None): file descriptor to write progress
+			into, as JSON lines (one JSON object per line)
 		"""
 		filename = abspath(filename)
 
@@ -506,7 +713,19 @@ class Glossary(object):
 		###
 		delFile = False
 		ext = get_ext(filename)
-		if ext in (".gz", ".bz2", ".zip"):
+		# some formats (like WikipediaXml with .xml.bz2) read compressed
+		# files themselves, their compound extensions are checked before
+		# decompressing the file
+		if not format:
+			filenameLower = filename.lower()
+			for key, extList in Glossary.formatsExt.items():
+				for fext in extList:
+					if fext.count(".") > 1 and filenameLower.endswith(fext):
+						format = key
+		if ext in (".gz", ".bz2", ".zip") and not (
+			format and
+			filename.lower().endswith(tuple(self.formatsExt[format]))
+		):
 			if ext == ".bz2":
 				output, error = subprocess.Popen(
 					["bzip2", "-dk", filename],
@@ -583,11 +802,24 @@ class Glossary(object):
 		if not self.getInfo("name"):
 			self.setInfo("name", split(filename)[1])
 		self._progressbar = progressbar
+		if progressJsonFd is not None:
+			self._progressJsonFile = os.fdopen(
+				progressJsonFd,
+				"w",
+				buffering=1,
+				closefd=False,
+			)
 
 		if format in self.readerClasses:
 			Reader = self.readerClasses[format]
 			reader = Reader(self)
 			reader.open(filename, **options)
+			if isfile(filename):
+				self._readerInputSize[reader] = os.path.getsize(filename)
+			if hasattr(reader, "knownStats"):
+				self._stats.seed(reader.knownStats())
+			else:
+				self._stats.seed(None)
 			if direct:
 				self._readers.append(reader)
 				log.info(
@@ -612,6 +844,9 @@ class Glossary(object):
 			if delFile:
 				os.remove(filename)
 
+		if not self._readers:
+			self._stats.complete = True
+
 		self._updateIter()
 
 		return True
@@ -620,40 +855,85 @@ class Glossary(object):
 		"""
 		iterates over `reader` object and loads the whole data into self._data
 		must call `reader.open(filename)` before calling this function
+
+		if memory usage exceeds self._memoryBudget, loading is stopped and
+		we switch to direct mode (see `_spillToDirectMode`), and return False
+		otherwise closes `reader` and returns True
 		"""
-		wordCount = 0
-		progressbar = False
-		if self.ui and self._progressbar:
-			try:
-				wordCount = len(reader)
-			except Exception:
-				log.exception("")
-			if wordCount:
-				progressbar = True
-		if progressbar:
-			self.progressInit("Reading")
+		memoryBudget = self._memoryBudget
+		gen = self._readerProgressGen(reader, "Reading")
+		spilled = False
 		try:
-			for index, entry in enumerate(reader):
+			for index, entry in enumerate(gen):
 				if entry:
 					self.addEntryObj(entry)
-				if progressbar:
-					self.progress(index, wordCount)
+				if memoryBudget and index and index % 10000 == 0:
+					rss = getProcessMemory()
+					if rss and rss > memoryBudget:
+						log.warning(
+							"Memory usage (%d MB) exceeded the budget" %
+							(rss // 1024 ** 2) +
+							" (%d MB) after loading %d entries" % (
+								memoryBudget // 1024 ** 2,
+								len(self._data),
+							) +
+							", switching to direct mode"
+						)
+						self._spillToDirectMode(reader, gen)
+						spilled = True
+						return False
 		finally:
-			reader.close()
-		if progressbar:
-			self.progressEnd()
+			if not spilled:
+				gen.close()
+				reader.close()
 
 		return True
 
+	def _spillToDirectMode(self, reader, gen):
+		"""
+		moves entries of `self._data` and the rest of `reader` (`gen` is
+		its partially consumed generator) into a direct mode reader,
+		and enables external sort, so they are sorted (if needed)
+		without loading them all into memory again
+		"""
+		data = self._data
+		self._data = []
+		# loaded entries are counted again in direct mode
+		self._stats.clearCounts()
+
+		def entryGen():
+			# free loaded entries as they are converted
+			data.reverse()
+			while data:
+				yield Entry.fromRaw(
+					data.pop(),
+					defaultDefiFormat=self._defaultDefiFormat,
+				)
+			for entry in gen:
+				yield entry
+
+		self._readers.append(SpilledReader(entryGen(), gen, reader))
+		if not self._sortChunkBytes:
+			self._sortChunkBytes = ConversionPlan.getSortChunkBytes(
+				self._memoryBudget
+			)
+
 	def _inactivateDirectMode(self):
 		"""
 		loads all of `self._readers` into `self._data`
 		closes readers
 		and sets self._readers to []
+
+		if memory budget is exceeded while loading, the loaded entries
+		and the remaining readers are kept in direct mode
 		"""
-		for reader in self._readers:
-			self.loadReader(reader)
+		readers = self._readers
 		self._readers = []
+		for index, reader in enumerate(readers):
+			if not self.loadReader(reader):
+				self._readers += readers[index + 1:]
+				return
+		self._stats.complete = True
 
 	def _updateIter(self, sort=False):
 		"""
@@ -665,7 +945,18 @@ class Glossary(object):
 				checks for self._sortKey and self._sortCacheSize
 		"""
 		if self._readers:  # direct mode
-			if sort:
+			if sort and self._sortChunkBytes:
+				log.info(
+					"External sort enabled, chunk size: %d MB" %
+					(self._sortChunkBytes // 1024 ** 2)
+				)
+				gen = externalSortStream(
+					(entry for entry in self._readersEntryGen() if entry),
+					self._sortChunkBytes,
+					key=Entry.getEntrySortKey(self._sortKey),
+					sizeFunc=lambda entry: entry.getSize(),
+				)
+			elif sort:
 				sortKey = self._sortKey
 				cacheSize = self._sortCacheSize
 				log.info("Stream sorting enabled, cache size: %s" % cacheSize)
@@ -677,6 +968,7 @@ class Glossary(object):
 				)
 			else:
 				gen = self._readersEntryGen()
+			gen = self._statsGen(gen)
 		else:
 			gen = self._loadedEntryGen()
 
@@ -778,7 +1070,7 @@ class Glossary(object):
 
 		returns absolute path of output file, or None if failed
 		"""
-		if isdir(filename):
+		if isdir(filename) and not self._resumeData:
 			filename = join(filename, basename(self._filename))
 		try:
 			validOptionKeys = self.formatsWriteOptions[format]
@@ -801,7 +1093,7 @@ class Glossary(object):
 					"Writing %s requires sorting" % format +
 					", ignoring user sort=False option"
 				)
-			if self._readers:
+			if self._readers and not self._sortChunkBytes:
 				log.warning(
 					"Writing to %s format requires full sort" % format +
 					", falling back to indirect mode"
@@ -850,10 +1142,31 @@ class Glossary(object):
 		else:
 			self._updateIter(sort=False)
 
+		if self._checkpoint:
+			if getattr(plugin, "supportsCheckpoint", False):
+				reader = None
+				if not sort and len(self._readers) == 1 and \
+					hasattr(self._readers[0], "resumeFrom"):
+					reader = self._readers[0]
+				self._iter = self._checkpointGen(self._iter, reader)
+			elif self._resumeData:
+				log.error(
+					"Writing %s format does not support checkpoints" % format +
+					", can not resume"
+				)
+				self.clear()
+				return
+			else:
+				log.warning(
+					"Writing %s format does not support checkpoints" % format
+				)
+
 		filename = abspath(filename)
 		log.info("Writing to file \"%s\"" % filename)
 		try:
 			self.writeFunctions[format].__call__(self, filename, **options)
+			if self._stats.complete:
+				log.pretty(self._stats.toDict(), "Glossary statistics: ")
 		except Exception:
 			log.exception("Exception while calling plugin\'s write function")
 			return
@@ -915,15 +1228,34 @@ class Glossary(object):
 		inputFormat="",
 		direct=None,
 		progressbar=True,
+		progressJsonFd=None,
 		outputFilename="",
 		outputFormat="",
 		sort=None,
 		sortKey=None,
-		sortCacheSize=1000,
+		sortCacheSize=None,
 		readOptions=None,
 		writeOptions=None,
+		checkpoint=False,
+		resume=False,
+		checkpointInterval=300,
+		memoryBudget=None,
 	):
 		"""
+		direct (bool or None): if None, it's decided automatically,
+			based on size of input, sorting requirement of output format,
+			and available memory (see ConversionPlan)
+		sortCacheSize (int or None): if given, use heap-based stream sort
+			(approximate) with this cache size in direct mode,
+			instead of external sort
+		checkpoint (bool): periodically save the state of conversion
+			into "OUTPUT_FILE.checkpoint" file, if output format supports it
+		resume (bool): resume conversion from checkpoint file
+			(implies checkpoint=True)
+		checkpointInterval (int or float): seconds between checkpoints
+		memoryBudget (int or None): maximum memory to use, in bytes
+			if None, half of available memory is used (if known)
+
 		returns absolute path of output file, or None if failed
 		"""
 		if not readOptions:
@@ -940,9 +1272,45 @@ class Glossary(object):
 			return
 		outputFilename, outputFormat, archiveType = outputArgs
 
-		if direct is None:
-			if sort is not True:
-				direct = True  # FIXME
+		plan = ConversionPlan(
+			estimateInputSize(inputFilename),
+			self.plugins[outputFormat].sortOnWrite,
+			sort=sort,
+			direct=direct,
+			sortCacheSize=sortCacheSize,
+			memoryBudget=memoryBudget,
+		)
+		plan.log()
+		direct = plan.direct
+		self._memoryBudget = plan.memoryBudget
+		self._sortChunkBytes = plan.sortChunkBytes
+
+		checkpointObj = None
+		if checkpoint or resume:
+			checkpointObj = Checkpoint(
+				outputFilename + ".checkpoint",
+				header={
+					"inputFilename": abspath(inputFilename),
+					"inputFormat": inputFormat,
+					"outputFilename": abspath(outputFilename),
+					"outputFormat": outputFormat,
+				},
+				interval=checkpointInterval,
+			)
+			if resume:
+				resumeData = checkpointObj.load()
+				if resumeData:
+					log.info(
+						"Resuming from checkpoint at entry %s" %
+						resumeData["entryIndex"]
+					)
+				else:
+					log.warning(
+						"No valid checkpoint found" +
+						", converting from the beginning"
+					)
+				self._resumeData = resumeData
+			self._checkpoint = checkpointObj
 
 		tm0 = now()
 		if not self.read(
@@ -950,6 +1318,7 @@ class Glossary(object):
 			format=inputFormat,
 			direct=direct,
 			progressbar=progressbar,
+			progressJsonFd=progressJsonFd,
 			**readOptions
 		):
 			return
@@ -968,6 +1337,9 @@ class Glossary(object):
 			log.error("Writing file \"%s\" failed." % outputFilename)
 			return
 
+		if checkpointObj:
+			checkpointObj.remove()
+
 		if archiveType:
 			finalOutputFile = self.archiveOutDir(finalOutputFile, archiveType)
 
@@ -1001,19 +1373,28 @@ class Glossary(object):
 		if not outInfoKeysAliasDict:
 			outInfoKeysAliasDict = {}
 
-		fp = open(filename, "w", encoding=encoding, newline=newline)
-		fp.write(head)
-		if writeInfo:
-			for key, desc in self._info.items():
-				try:
-					key = outInfoKeysAliasDict[key]
-				except KeyError:
-					pass
-				for rpl in rplList:
-					desc = desc.replace(rpl[0], rpl[1])
-				fp.write("##" + key + sep1 + desc + sep2)
+		resumeState = self.getResumeWriterState()
+		if resumeState:
+			openTruncated(filename, resumeState["fileSize"]).close()
+			fp = open(filename, "a", encoding=encoding, newline=newline)
+		else:
+			fp = open(filename, "w", encoding=encoding, newline=newline)
+			fp.write(head)
+			if writeInfo:
+				for key, desc in self._info.items():
+					try:
+						key = outInfoKeysAliasDict[key]
+					except KeyError:
+						pass
+					for rpl in rplList:
+						desc = desc.replace(rpl[0], rpl[1])
+					fp.write("##" + key + sep1 + desc + sep2)
 		fp.flush()
 
+		def checkpointState():
+			fp.flush()
+			return {"fileSize": fp.buffer.tell()}
+
 		myResDir = filename + "_res"
 		if not isdir(myResDir):
 			os.mkdir(myResDir)
@@ -1021,6 +1402,8 @@ class Glossary(object):
 		if not iterEntries:
 			iterEntries = self
 
+		self.setCheckpointWriter(checkpointState)
+
 		for entry in iterEntries:
 			if entry.isData():
 				if resources:
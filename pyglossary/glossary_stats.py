@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+from collections import Counter
+
+import logging
+log = logging.getLogger("root")
+
+
+class GlossaryStats(object):
+	"""
+	Statistics of glossary entries, collected in a single pass
+	as entries flow through the glossary (while loading in indirect mode,
+	or while the writer iterates in direct mode).
+
+	Readers that know some of these values before reading (from a header,
+	like StarDict .ifo file) can provide them with a `knownStats()` method
+	that returns a dict, so writers can use them before any entry is read.
+	Those values come from headers, and may be a little bigger than the
+	actual values if reader skips broken entries.
+
+	Statistics:
+		entryCount: number of entries (not including resources)
+		resourceCount: number of data entries (resource files)
+		resourceBytes: total size of resource files
+		altCount: total number of alternate words
+		multiDefiCount: number of entries with more than one definition
+		maxWordLen: length of the longest word (including alternates)
+		maxDefiLen: length of the longest definition
+		defiFormatCounter: Counter of definition formats ("m", "h", "x")
+	"""
+	keys = (
+		"entryCount",
+		"resourceCount",
+		"resourceBytes",
+		"altCount",
+		"multiDefiCount",
+		"maxWordLen",
+		"maxDefiLen",
+		"defiFormatCounter",
+	)
+	# keys that are merged with max() instead of sum
+	maxKeys = ("maxWordLen", "maxDefiLen")
+
+	def __init__(self):
+		self.clear()
+
+	def clear(self):
+		self.clearCounts()
+		self._seeded = None  # dict, or None if no reader is seen
+
+	def clearCounts(self):
+		"""
+		clears the counted statistics, but keeps the seeded ones
+		"""
+		self.entryCount = 0
+		self.resourceCount = 0
+		self.resourceBytes = 0
+		self.altCount = 0
+		self.multiDefiCount = 0
+		self.maxWordLen = 0
+		self.maxDefiLen = 0
+		self.defiFormatCounter = Counter()
+		# complete: True if all entries of glossary are counted
+		self.complete = False
+
+	def update(self, entry):
+		if entry.isData():
+			self.resourceCount += 1
+			self.resourceBytes += entry.getDataSize()
+			return
+		self.entryCount += 1
+		words = entry.getWords()
+		defis = entry.getDefis()
+		self.altCount += len(words) - 1
+		if len(defis) > 1:
+			self.multiDefiCount += 1
+		wordLen = max(len(word) for word in words)
+		if wordLen > self.maxWordLen:
+			self.maxWordLen = wordLen
+		defiLen = max(len(defi) for defi in defis)
+		if defiLen > self.maxDefiLen:
+			self.maxDefiLen = defiLen
+		self.defiFormatCounter[entry.getDefiFormat()] += 1
+
+	def seed(self, values):
+		"""
+		values: dict of statistics that a reader knows before reading,
+			or None if it doesn't know any
+		must be called once for every reader, a statistic is known only
+		if all readers know it
+		"""
+		values = dict(values) if values else {}
+		for key in values:
+			if key not in self.keys:
+				raise ValueError("invalid statistic key %r" % key)
+		if "defiFormatCounter" in values:
+			values["defiFormatCounter"] = Counter(values["defiFormatCounter"])
+		if self._seeded is None:
+			self._seeded = values
+			return
+		seeded = {}
+		for key, value in values.items():
+			if key not in self._seeded:
+				continue
+			if key in self.maxKeys:
+				seeded[key] = max(self._seeded[key], value)
+			else:
+				seeded[key] = self._seeded[key] + value
+		self._seeded = seeded
+
+	def get(self, key):
+		"""
+		returns value of statistic `key` for the whole glossary,
+		or None if it's not known (yet)
+		"""
+		if key not in self.keys:
+			raise ValueError("invalid statistic key %r" % key)
+		if self.complete:
+			return getattr(self, key)
+		if self._seeded:
+			return self._seeded.get(key)
+
+	def getMostUsedDefiFormats(self, count=None):
+		"""
+		returns a list of (defiFormat, count) tuples, or None if not known
+		"""
+		counter = self.get("defiFormatCounter")
+		if counter is None:
+			return
+		return counter.most_common(count)
+
+	def toDict(self):
+		return dict(
+			(key, getattr(self, key))
+			for key in self.keys
+		)
@@ -0,0 +1,87 @@
+import sys
+import shutil
+import random
+import tempfile
+import unittest
+from unittest import mock
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+import pyglossary.tests_common  # logger setup
+from pyglossary import glossary as glossaryModule
+from pyglossary.glossary import Glossary
+
+
+class MemoryBudgetTest(unittest.TestCase):
+	"""
+	when memory usage exceeds the budget while loading entries,
+	conversion must continue in direct mode with external sort
+	"""
+	entryCount = 25001
+
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+		words = ["word%05d" % index for index in range(self.entryCount)]
+		random.seed(0)
+		random.shuffle(words)
+		self.inputFilename = join(self.tmpDir, "input.txt")
+		with open(self.inputFilename, "w", encoding="utf-8") as fp:
+			for word in words:
+				fp.write("%s\tdefinition of %s\n" % (word, word))
+		self.expectedLines = [
+			"word%05d\tdefinition of word%05d" % (index, index)
+			for index in range(self.entryCount)
+		]
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def convert(self, rss, **options):
+		"""
+		returns (lines of output file, log messages)
+		"""
+		outputFilename = join(self.tmpDir, "output.txt")
+		with mock.patch.object(
+			glossaryModule,
+			"getProcessMemory",
+			return_value=rss,
+		), self.assertLogs("root", "DEBUG") as logs:
+			self.assertTrue(Glossary().convert(
+				self.inputFilename,
+				inputFormat="Tabfile",
+				outputFilename=outputFilename,
+				outputFormat="Tabfile",
+				progressbar=False,
+				memoryBudget=1024 ** 3,
+				**options
+			))
+		with open(outputFilename, encoding="utf-8") as fp:
+			lines = fp.read().split("\n")
+		return [
+			line for line in lines
+			if line and not line.startswith("##")
+		], "\n".join(logs.output)
+
+	def test_within_budget(self):
+		lines, logs = self.convert(1, direct=False, sort=True)
+		self.assertEqual(lines, self.expectedLines)
+		self.assertNotIn("switching to direct mode", logs)
+		self.assertNotIn("External sort enabled", logs)
+
+	def test_exceeded(self):
+		lines, logs = self.convert(2 * 1024 ** 3, direct=False, sort=True)
+		self.assertEqual(lines, self.expectedLines)
+		self.assertIn("switching to direct mode", logs)
+		self.assertIn("External sort enabled", logs)
+		# loaded entries are not counted twice
+		self.assertIn("'entryCount': %d," % self.entryCount, logs)
+
+	def test_exceeded_no_sort(self):
+		lines, logs = self.convert(2 * 1024 ** 3, direct=False, sort=False)
+		self.assertEqual(sorted(lines), self.expectedLines)
+		self.assertIn("switching to direct mode", logs)
+		self.assertIn("'entryCount': %d," % self.entryCount, logs)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -34,6 +34,47 @@ class indir(object):
 		self.oldpwd = None
 
 
+def getAvailableMemory():
+	"""
+	returns the amount of memory that is available for starting new
+	processes without swapping (in bytes), or None if not known
+	only works on Linux (reads /proc/meminfo)
+	"""
+	try:
+		with open("/proc/meminfo") as fp:
+			lines = fp.readlines()
+	except OSError:
+		return
+	values = {}
+	for line in lines:
+		parts = line.split()
+		if len(parts) < 2:
+			continue
+		try:
+			values[parts[0].rstrip(":")] = int(parts[1]) * 1024
+		except ValueError:
+			pass
+	if "MemAvailable" in values:
+		return values["MemAvailable"]
+	# Linux < 3.14
+	if "MemFree" in values:
+		return values["MemFree"] + values.get("Cached", 0)
+
+
+def getProcessMemory():
+	"""
+	returns resident memory size of current process in bytes,
+	or None if not known
+	only works on Linux (reads /proc/self/statm)
+	"""
+	try:
+		with open("/proc/self/statm") as fp:
+			rssPages = int(fp.read().split()[1])
+	except (OSError, IndexError, ValueError):
+		return
+	return rssPages * os.sysconf("SC_PAGE_SIZE")
+
+
 def my_url_show(link):
 	import subprocess
 	for path in (
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# dictzip.py
+#
+# Random access reader for dictzip files (like .dict.dz)
+# This file is part of PyGlossary project, https://github.com/ilius/pyglossary
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+
+import zlib
+from struct import unpack
+from collections import OrderedDict as odict
+
+import logging
+log = logging.getLogger("root")
+
+FTEXT, FHCRC, FEXTRA, FNAME, FCOMMENT = 1, 2, 4, 8, 16
+
+
+class DictzipFile(object):
+	"""
+	dictzip file is a gzip file that is compressed in chunks (with full
+	flush between them), and the compressed size of chunks is stored
+	in "RA" (random access) subfield of gzip extra field, so any chunk
+	can be decompressed without decompressing the data before it.
+
+	Decompressed chunks are kept in an LRU cache of `cacheSize` chunks.
+
+	raises ValueError if file is not a dictzip file (for example a normal
+	gzip file), then you should fall back to gzip module
+	"""
+	def __init__(self, filename, cacheSize=32):
+		self._filename = filename
+		self._cacheSize = cacheSize
+		self._cache = odict()  # chunk index => decompressed bytes
+		self._chunkLen = 0
+		self._chunkOffsets = []  # file offset of each chunk, and end
+		self._file = open(filename, "rb")
+		try:
+			self._readHeader()
+		except Exception:
+			self._file.close()
+			raise
+
+	def _readHeader(self):
+		fp = self._file
+		header = fp.read(10)
+		if len(header) < 10 or header[:2] != b"\x1f\x8b":
+			raise ValueError("%r is not a gzip file" % self._filename)
+		if header[2] != 8:
+			raise ValueError("unknown compression method in %r" % self._filename)
+		flags = header[3]
+		if not flags & FEXTRA:
+			raise ValueError("%r is not a dictzip file" % self._filename)
+		xlen = unpack("<H", fp.read(2))[0]
+		extra = fp.read(xlen)
+		chunkSizes = None
+		pos = 0
+		while pos + 4 <= len(extra):
+			subId = extra[pos:pos+2]
+			subLen = unpack("<H", extra[pos+2:pos+4])[0]
+			subData = extra[pos+4:pos+4+subLen]
+			pos += 4 + subLen
+			if subId != b"RA":
+				continue
+			version, chunkLen, chunkCount = unpack("<HHH", subData[:6])
+			if version != 1:
+				raise ValueError(
+					"unsupported dictzip version %s in %r" % (
+						version,
+						self._filename,
+					)
+				)
+			self._chunkLen = chunkLen
+			chunkSizes = unpack("<%dH" % chunkCount, subData[6:6+2*chunkCount])
+		if chunkSizes is None:
+			raise ValueError("%r is not a dictzip file" % self._filename)
+		if flags & FNAME:
+			while fp.read(1) not in (b"\x00", b""):
+				pass
+		if flags & FCOMMENT:
+			while fp.read(1) not in (b"\x00", b""):
+				pass
+		if flags & FHCRC:
+			fp.read(2)
+		offset = fp.tell()
+		self._chunkOffsets = [offset]
+		for size in chunkSizes:
+			offset += size
+			self._chunkOffsets.append(offset)
+
+	def _getChunk(self, index):
+		cache = self._cache
+		try:
+			data = cache[index]
+		except KeyError:
+			pass
+		else:
+			cache.move_to_end(index)
+			return data
+		beg = self._chunkOffsets[index]
+		self._file.seek(beg)
+		compressed = self._file.read(self._chunkOffsets[index + 1] - beg)
+		data = zlib.decompressobj(-zlib.MAX_WBITS).decompress(compressed)
+		cache[index] = data
+		if len(cache) > self._cacheSize:
+			cache.popitem(last=False)
+		return data
+
+	def read(self, offset, size):
+		"""
+		returns `size` bytes of uncompressed data from `offset`
+		"""
+		if size <= 0:
+			return b""
+		chunkLen = self._chunkLen
+		first = offset // chunkLen
+		last = (offset + size - 1) // chunkLen
+		last = min(last, len(self._chunkOffsets) - 2)
+		if first > last:
+			return b""
+		if first == last:
+			beg = offset - first * chunkLen
+			return self._getChunk(first)[beg:beg + size]
+		data = b"".join([
+			self._getChunk(index)
+			for index in range(first, last + 1)
+		])
+		beg = offset - first * chunkLen
+		return data[beg:beg + size]
+
+	def close(self):
+		if self._file:
+			self._file.close()
+			self._file = None
+		self._cache.clear()
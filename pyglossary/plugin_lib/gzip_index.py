@@ -0,0 +1,515 @@
+# -*- coding: utf-8 -*-
+# gzip_index.py
+#
+# Access point index for random access in gzip files (like zran.c of zlib)
+# This file is part of PyGlossary project, https://github.com/ilius/pyglossary
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+
+import os
+import zlib
+from struct import Struct
+from bisect import bisect_right
+import ctypes
+import ctypes.util
+
+import logging
+log = logging.getLogger("root")
+
+"""
+A gzip file (that is not dictzipped) can only be decompressed from the
+beginning. Access points make it possible to start decompression from
+the middle: an access point is (uncompressed position, compressed position,
+window), where window is the last 32 KiB of uncompressed data before that
+position, which is the dictionary that deflate data after it may refer to.
+
+Access points are recorded in one sequential pass, every `spacing` bytes
+of uncompressed data, at deflate block boundaries. Finding block boundaries
+needs Z_BLOCK flush mode of inflate, which Python's zlib module does not
+expose, so zlib library is loaded with ctypes for building the index.
+If it's not available, access points are only recorded at beginning of
+gzip members.
+
+Decompression from an access point is done with Python's zlib module,
+using the window as `zdict`. A block boundary is usually in the middle of
+a byte, and Python's zlib does not have inflatePrime() to start from a bit,
+so the first `bits` bits of the block (from the byte before compressed
+position) are prefixed with empty deflate blocks that make the bits before
+them a whole number of bytes.
+
+Index file (sidecar, next to the gzip file) format, little endian:
+	magic: b"PYGZIDX1"
+	header: size and mtime (ns) of gzip file, offset of gzip data in file,
+		number of access points
+	access points: uncompressed position, compressed position, bits,
+		size of window (compressed with zlib), compressed window
+"""
+
+FTEXT, FHCRC, FEXTRA, FNAME, FCOMMENT = 1, 2, 4, 8, 16
+
+windowSize = 32768
+defaultSpacing = 1024 * 1024
+
+indexFileMagic = b"PYGZIDX1"
+indexHeaderStruct = Struct("<QqQI")
+indexPointStruct = Struct("<QQBI")
+
+Z_OK = 0
+Z_STREAM_END = 1
+Z_BLOCK = 5
+Z_BUF_ERROR = -5
+
+
+class ZStream(ctypes.Structure):
+	_fields_ = [
+		("next_in", ctypes.c_void_p),
+		("avail_in", ctypes.c_uint),
+		("total_in", ctypes.c_ulong),
+		("next_out", ctypes.c_void_p),
+		("avail_out", ctypes.c_uint),
+		("total_out", ctypes.c_ulong),
+		("msg", ctypes.c_char_p),
+		("state", ctypes.c_void_p),
+		("zalloc", ctypes.c_void_p),
+		("zfree", ctypes.c_void_p),
+		("opaque", ctypes.c_void_p),
+		("data_type", ctypes.c_int),
+		("adler", ctypes.c_ulong),
+		("reserved", ctypes.c_ulong),
+	]
+
+
+_zlibLib = None
+
+
+def _bitsValue(bits):
+	"""
+	bits: list of 0 and 1, in order of deflate stream
+	"""
+	value = 0
+	for index, bit in enumerate(bits):
+		value |= bit << index
+	return value
+
+
+def _makeEmptyBlocks():
+	"""
+	returns a dict of {residue: (value, bitCount)} for sequences of empty
+	deflate blocks, with bitCount % 8 == residue, for residues 1 to 7
+
+	an empty block with fixed Huffman codes has 10 bits, and the empty block
+	with dynamic Huffman codes below has 95 bits, which makes odd residues
+	possible
+	"""
+	def num(value, count):
+		return [(value >> i) & 1 for i in range(count)]
+	fixedBlock = [0] + num(1, 2) + [0] * 7
+	# BFINAL=0, BTYPE=2, HLIT=257, HDIST=1, HCLEN=19
+	dynamicBlock = [0] + num(2, 2) + num(0, 5) + num(0, 5) + num(15, 4)
+	# code length codes: 1 bit for 18 (zeros), 2 bits for 0 and 1
+	codeLengths = {18: 1, 0: 2, 1: 2}
+	for symbol in (
+		16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15,
+	):
+		dynamicBlock += num(codeLengths.get(symbol, 0), 3)
+	# 256 literals of length 0 (138 + 118), end-of-block with length 1
+	dynamicBlock += [0] + num(138 - 11, 7) + [0] + num(118 - 11, 7) + [1, 1]
+	# one distance code with length 0, then end-of-block code
+	dynamicBlock += [1, 0] + [0]
+	emptyBlocks = {}
+	for fixedCount in range(4):
+		for bits in (
+			fixedBlock * fixedCount,
+			dynamicBlock + fixedBlock * fixedCount,
+		):
+			if len(bits) % 8:
+				emptyBlocks[len(bits) % 8] = (_bitsValue(bits), len(bits))
+	return emptyBlocks
+
+
+_emptyBlocks = _makeEmptyBlocks()
+
+
+def accessPointPrefix(bits, byte):
+	"""
+	returns bytes to be given to decompressor before compressed data of
+	an access point, for the first `bits` bits of its first block, that
+	are the high bits of `byte` (the byte before compressed position)
+	"""
+	if not bits:
+		return b""
+	value, bitCount = _emptyBlocks[8 - bits]
+	value |= (byte >> (8 - bits)) << bitCount
+	return value.to_bytes((bitCount + bits) // 8, "little")
+
+
+def loadZlibLibrary():
+	"""
+	returns zlib library loaded with ctypes, or None if it's not available
+	"""
+	global _zlibLib
+	if _zlibLib is not None:
+		return _zlibLib or None
+	_zlibLib = False
+	try:
+		lib = ctypes.CDLL(ctypes.util.find_library("z") or "libz.so.1")
+		lib.zlibVersion.restype = ctypes.c_char_p
+		lib.inflateInit2_.argtypes = [
+			ctypes.POINTER(ZStream),
+			ctypes.c_int,
+			ctypes.c_char_p,
+			ctypes.c_int,
+		]
+		lib.inflate.argtypes = [ctypes.POINTER(ZStream), ctypes.c_int]
+		for name in ("inflateReset", "inflateEnd"):
+			getattr(lib, name).argtypes = [ctypes.POINTER(ZStream)]
+	except Exception as e:
+		log.debug("could not load zlib library: %s" % e)
+		return
+	_zlibLib = lib
+	return lib
+
+
+def readGzipHeader(fileObj):
+	"""
+	reads the header of a gzip member from current position of fileObj
+	returns False if there is no gzip member
+	"""
+	header = fileObj.read(10)
+	if len(header) < 10 or header[:2] != b"\x1f\x8b":
+		return False
+	if header[2] != 8:
+		log.error("unknown gzip compression method %s" % header[2])
+		return False
+	flags = header[3]
+	if flags & FEXTRA:
+		extraLen = int.from_bytes(fileObj.read(2), "little")
+		fileObj.read(extraLen)
+	if flags & FNAME:
+		while fileObj.read(1) not in (b"\x00", b""):
+			pass
+	if flags & FCOMMENT:
+		while fileObj.read(1) not in (b"\x00", b""):
+			pass
+	if flags & FHCRC:
+		fileObj.read(2)
+	return True
+
+
+class GzipIndex(object):
+	"""
+	list of access points of a gzip file, sorted by uncompressed position
+	every access point is a tuple of:
+		(uncompressed position, compressed position in file, bits, window)
+	bits: number of bits of the first block in the byte before
+		compressed position
+	"""
+	def __init__(self, offset=0):
+		self.offset = offset  # offset of gzip data in file
+		self._points = []
+		self._outPositions = []
+
+	def __len__(self):
+		return len(self._points)
+
+	def addPoint(self, outPos, inPos, bits, window):
+		self._points.append((outPos, inPos, bits, window))
+		self._outPositions.append(outPos)
+
+	def findPoint(self, pos):
+		"""
+		returns the last access point at or before uncompressed position `pos`
+		"""
+		return self._points[max(0, bisect_right(self._outPositions, pos) - 1)]
+
+	def save(self, indexPath, filename):
+		"""
+		filename: path of the gzip file, to detect when index is outdated
+		"""
+		st = os.stat(filename)
+		with open(indexPath, "wb") as indexFile:
+			indexFile.write(indexFileMagic)
+			indexFile.write(indexHeaderStruct.pack(
+				st.st_size,
+				st.st_mtime_ns,
+				self.offset,
+				len(self._points),
+			))
+			for outPos, inPos, bits, window in self._points:
+				b_window = zlib.compress(window) if window else b""
+				indexFile.write(indexPointStruct.pack(
+					outPos,
+					inPos,
+					bits,
+					len(b_window),
+				))
+				indexFile.write(b_window)
+
+
+def loadGzipIndex(indexPath, filename, offset=0):
+	"""
+	returns GzipIndex loaded from index file `indexPath`,
+	or None if it does not exist or does not match gzip file `filename`
+	"""
+	if not os.path.isfile(indexPath):
+		return
+	st = os.stat(filename)
+	try:
+		with open(indexPath, "rb") as indexFile:
+			if indexFile.read(len(indexFileMagic)) != indexFileMagic:
+				log.warning("invalid gzip index file %r" % indexPath)
+				return
+			size, mtime_ns, indexOffset, count = indexHeaderStruct.unpack(
+				indexFile.read(indexHeaderStruct.size)
+			)
+			if (size, mtime_ns, indexOffset) != (
+				st.st_size,
+				st.st_mtime_ns,
+				offset,
+			):
+				log.debug("gzip index file %r is outdated" % indexPath)
+				return
+			index = GzipIndex(offset)
+			for _ in range(count):
+				outPos, inPos, bits, windowLen = indexPointStruct.unpack(
+					indexFile.read(indexPointStruct.size)
+				)
+				b_window = indexFile.read(windowLen)
+				index.addPoint(
+					outPos,
+					inPos,
+					bits,
+					zlib.decompress(b_window) if b_window else b"",
+				)
+	except Exception:
+		log.exception("error while reading gzip index file %r" % indexPath)
+		return
+	return index
+
+
+def buildGzipIndex(filename, offset=0, spacing=defaultSpacing):
+	"""
+	decompresses gzip data that starts at `offset` in file, and returns
+	GzipIndex with access points every `spacing` (uncompressed) bytes
+	"""
+	index = GzipIndex(offset)
+	with open(filename, "rb") as fileObj:
+		fileObj.seek(offset)
+		if not readGzipHeader(fileObj):
+			raise ValueError("invalid gzip header at %s in %r" % (
+				offset,
+				filename,
+			))
+		index.addPoint(0, fileObj.tell(), 0, b"")
+		lib = loadZlibLibrary()
+		if lib is None:
+			log.warning(
+				"zlib library is not available, gzip index of %r " % filename +
+				"will only have access points at beginning of gzip members"
+			)
+			_addMemberPoints(index, fileObj)
+		else:
+			_addBlockPoints(lib, index, fileObj, spacing)
+	return index
+
+
+def _addMemberPoints(index, fileObj):
+	outPos = 0
+	decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+	while True:
+		if decomp.eof:
+			fileObj.seek(fileObj.tell() - len(decomp.unused_data) + 8)
+			if not readGzipHeader(fileObj):
+				return
+			index.addPoint(outPos, fileObj.tell(), 0, b"")
+			decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+		raw = fileObj.read(defaultSpacing)
+		if not raw:
+			return
+		outPos += len(decomp.decompress(raw))
+
+
+def _addBlockPoints(lib, index, fileObj, spacing):
+	chunkSize = 256 * 1024
+	strm = ZStream()
+	ret = lib.inflateInit2_(
+		ctypes.byref(strm),
+		-zlib.MAX_WBITS,
+		lib.zlibVersion(),
+		ctypes.sizeof(ZStream),
+	)
+	if ret != Z_OK:
+		raise RuntimeError("inflateInit2 failed: %s" % ret)
+	inBuf = ctypes.create_string_buffer(chunkSize)
+	outBuf = ctypes.create_string_buffer(chunkSize)
+	window = b""
+	outPos = 0
+	lastPointPos = 0
+	try:
+		while True:
+			if strm.avail_in == 0:
+				data = fileObj.read(chunkSize)
+				if not data:
+					log.warning("gzip data is truncated in %r" % fileObj.name)
+					return
+				ctypes.memmove(inBuf, data, len(data))
+				strm.next_in = ctypes.addressof(inBuf)
+				strm.avail_in = len(data)
+			strm.next_out = ctypes.addressof(outBuf)
+			strm.avail_out = chunkSize
+			ret = lib.inflate(ctypes.byref(strm), Z_BLOCK)
+			produced = chunkSize - strm.avail_out
+			if produced:
+				outPos += produced
+				window = (window + ctypes.string_at(outBuf, produced))[-windowSize:]
+			if ret == Z_STREAM_END:
+				# skip CRC32 and ISIZE, and start the next member, if any
+				fileObj.seek(fileObj.tell() - strm.avail_in + 8)
+				if not readGzipHeader(fileObj):
+					return
+				lib.inflateReset(ctypes.byref(strm))
+				strm.avail_in = 0
+				window = b""
+				index.addPoint(outPos, fileObj.tell(), 0, b"")
+				lastPointPos = outPos
+				continue
+			if ret not in (Z_OK, Z_BUF_ERROR):
+				raise ValueError("error in gzip data of %r: %s" % (
+					fileObj.name,
+					strm.msg,
+				))
+			dataType = strm.data_type
+			# at end of a block, but not the last block
+			if dataType & 128 and not dataType & 64:
+				if outPos - lastPointPos >= spacing:
+					index.addPoint(
+						outPos,
+						fileObj.tell() - strm.avail_in,
+						dataType & 7,
+						window,
+					)
+					lastPointPos = outPos
+	finally:
+		lib.inflateEnd(ctypes.byref(strm))
+
+
+class IndexedGzipFile(object):
+	"""
+	file-like object (read, seek, tell) for reading uncompressed data of
+	a gzip file with random access, seek() is cheap: decompression starts
+	from the nearest access point before the position, when data is read
+
+	indexPath: path of index file, to load access points from it, or to
+		save them after building, or None to build them in memory
+	"""
+	chunkSize = 64 * 1024  # size of compressed chunks, in bytes
+
+	def __init__(
+		self,
+		filename,
+		offset=0,
+		indexPath=None,
+		spacing=defaultSpacing,
+	):
+		self._filename = filename
+		index = None
+		if indexPath:
+			index = loadGzipIndex(indexPath, filename, offset)
+		if index is None:
+			index = buildGzipIndex(filename, offset, spacing)
+			if indexPath:
+				try:
+					index.save(indexPath, filename)
+				except OSError as e:
+					log.warning("could not save gzip index file: %s" % e)
+		self._index = index
+		self._file = open(filename, "rb")
+		self._pos = 0  # position in uncompressed data
+		self._startAt(index.findPoint(0))
+
+	def _startAt(self, point):
+		outPos, inPos, bits, window = point
+		prefix = b""
+		if bits:
+			self._file.seek(inPos - 1)
+			prefix = accessPointPrefix(bits, self._file.read(1)[0])
+		self._file.seek(inPos)
+		if window:
+			self._decomp = zlib.decompressobj(-zlib.MAX_WBITS, zdict=window)
+		else:
+			self._decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+		self._decomp.decompress(prefix)
+		self._buf = b""  # decompressed data
+		self._bufPos = outPos  # uncompressed position of self._buf
+		self._eof = False
+
+	def _decompressChunk(self):
+		"""
+		returns decompressed bytes of the next chunk,
+		or None if end of data is reached
+		"""
+		while not self._eof:
+			decomp = self._decomp
+			if decomp.eof:
+				# skip CRC32 and ISIZE, and start the next member, if any
+				self._file.seek(self._file.tell() - len(decomp.unused_data) + 8)
+				if not readGzipHeader(self._file):
+					self._eof = True
+					return
+				self._decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+				continue
+			raw = self._file.read(self.chunkSize)
+			if not raw:
+				self._eof = True
+				return
+			data = decomp.decompress(raw)
+			if data:
+				return data
+
+	def seek(self, pos, whence=0):
+		if whence == 1:
+			pos += self._pos
+		elif whence != 0:
+			raise ValueError("IndexedGzipFile: unsupported whence=%s" % whence)
+		if pos < 0:
+			raise ValueError("negative seek position %s" % pos)
+		self._pos = pos
+		return pos
+
+	def tell(self):
+		return self._pos
+
+	def read(self, size=-1):
+		pos = self._pos
+		point = self._index.findPoint(pos)
+		if pos < self._bufPos or point[0] > self._bufPos + len(self._buf):
+			self._startAt(point)
+		# skip data before pos
+		while self._bufPos + len(self._buf) < pos:
+			self._bufPos += len(self._buf)
+			self._buf = b""
+			data = self._decompressChunk()
+			if data is None:
+				break
+			self._buf = data
+		skip = pos - self._bufPos
+		if skip > 0:
+			self._buf = self._buf[skip:]
+			self._bufPos += skip
+		while size < 0 or len(self._buf) < size:
+			data = self._decompressChunk()
+			if data is None:
+				break
+			self._buf += data
+		data = self._buf if size < 0 else self._buf[:size]
+		self._pos = pos + len(data)
+		return data
+
+	def close(self):
+		if self._file:
+			self._file.close()
+			self._file = None
+		self._buf = b""
@@ -0,0 +1,202 @@
+import sys
+import os
+import gzip
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+import pyglossary.tests_common  # logger setup
+from pyglossary.plugin_lib import gzip_index
+from pyglossary.plugin_lib.gzip_index import (
+	IndexedGzipFile,
+	buildGzipIndex,
+	loadGzipIndex,
+	indexFileMagic,
+)
+
+
+def sampleData(size, seed=0):
+	"""
+	returns `size` bytes of text that is compressed to many deflate blocks
+	"""
+	rand = random.Random(seed)
+	words = [
+		"".join(rand.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(
+			rand.randrange(2, 12)
+		)).encode("ascii")
+		for _ in range(5000)
+	]
+	parts = []
+	length = 0
+	while length < size:
+		part = b" ".join(rand.choice(words) for _ in range(20)) + b"\n"
+		parts.append(part)
+		length += len(part)
+	return b"".join(parts)[:size]
+
+
+class GzipIndexTest(unittest.TestCase):
+	spacing = 64 * 1024
+
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+		self.data = sampleData(1500 * 1024)
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def writeGzip(self, name, members, level=6, prefix=b""):
+		"""
+		members: list of bytes, every one is compressed as a gzip member
+		"""
+		filename = join(self.tmpDir, name)
+		with open(filename, "wb") as fp:
+			fp.write(prefix)
+			for member in members:
+				fp.write(gzip.compress(member, compresslevel=level))
+		return filename
+
+	def assertRandomReads(self, gzFile, data, count=200):
+		rand = random.Random(len(data))
+		for _ in range(count):
+			pos = rand.randrange(len(data))
+			size = rand.randrange(1, 100 * 1024)
+			gzFile.seek(pos)
+			self.assertEqual(gzFile.read(size), data[pos:pos + size], pos)
+			self.assertEqual(gzFile.tell(), min(pos + size, len(data)))
+		# sequential reads after seek, and reading past the end
+		gzFile.seek(len(data) - 10)
+		self.assertEqual(gzFile.read(5), data[-10:-5])
+		self.assertEqual(gzFile.read(100), data[-5:])
+		self.assertEqual(gzFile.read(100), b"")
+		gzFile.seek(0)
+		self.assertEqual(gzFile.read(), data)
+
+	def test_levels(self):
+		for level in (1, 6, 9):
+			filename = self.writeGzip("l%d.gz" % level, [self.data], level)
+			index = buildGzipIndex(filename, spacing=self.spacing)
+			# access points in the middle of the member, with windows
+			self.assertGreater(len(index), 10)
+			gzFile = IndexedGzipFile(filename, spacing=self.spacing)
+			self.assertRandomReads(gzFile, self.data)
+			gzFile.close()
+
+	def test_without_zlib_library(self):
+		members = [self.data[:500000], self.data[500000:]]
+		filename = self.writeGzip("members.gz", members)
+		with mock.patch.object(
+			gzip_index,
+			"loadZlibLibrary",
+			return_value=None,
+		):
+			index = buildGzipIndex(filename, spacing=self.spacing)
+			gzFile = IndexedGzipFile(filename, spacing=self.spacing)
+		# only at beginning of members
+		self.assertEqual(len(index), 2)
+		self.assertRandomReads(gzFile, self.data, count=50)
+		gzFile.close()
+
+	def test_multi_member(self):
+		members = [
+			self.data[:300000],
+			self.data[300000:300010],
+			b"",
+			self.data[300010:1000000],
+			self.data[1000000:],
+		]
+		filename = self.writeGzip("members.gz", members)
+		gzFile = IndexedGzipFile(filename, spacing=self.spacing)
+		self.assertRandomReads(gzFile, self.data)
+		gzFile.close()
+
+	def test_offset(self):
+		prefix = b"header that is not gzip data\n"
+		filename = self.writeGzip("offset.gz", [self.data], prefix=prefix)
+		gzFile = IndexedGzipFile(
+			filename,
+			offset=len(prefix),
+			spacing=self.spacing,
+		)
+		self.assertRandomReads(gzFile, self.data, count=50)
+		gzFile.close()
+
+	def test_sidecar_reload(self):
+		filename = self.writeGzip("data.gz", [self.data])
+		indexPath = filename + ".gzidx"
+		gzFile = IndexedGzipFile(
+			filename,
+			indexPath=indexPath,
+			spacing=self.spacing,
+		)
+		gzFile.close()
+		self.assertTrue(os.path.isfile(indexPath))
+		built = buildGzipIndex(filename, spacing=self.spacing)
+		loaded = loadGzipIndex(indexPath, filename)
+		self.assertEqual(loaded._points, built._points)
+		with mock.patch.object(gzip_index, "buildGzipIndex") as build:
+			gzFile = IndexedGzipFile(
+				filename,
+				indexPath=indexPath,
+				spacing=self.spacing,
+			)
+		build.assert_not_called()
+		self.assertRandomReads(gzFile, self.data)
+		gzFile.close()
+
+	def test_sidecar_stale(self):
+		filename = self.writeGzip("data.gz", [self.data])
+		indexPath = filename + ".gzidx"
+		IndexedGzipFile(filename, indexPath=indexPath).close()
+		# replace gzip file with another one, index must not be used
+		newData = sampleData(len(self.data), seed=1)
+		self.writeGzip("data.gz", [newData[:700000], newData[700000:]])
+		st = os.stat(filename)
+		os.utime(filename, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+		self.assertIsNone(loadGzipIndex(indexPath, filename))
+		gzFile = IndexedGzipFile(
+			filename,
+			indexPath=indexPath,
+			spacing=self.spacing,
+		)
+		self.assertRandomReads(gzFile, newData)
+		gzFile.close()
+		# index is rebuilt and saved for the new file
+		self.assertIsNotNone(loadGzipIndex(indexPath, filename))
+
+	def test_sidecar_corrupt(self):
+		filename = self.writeGzip("data.gz", [self.data])
+		indexPath = filename + ".gzidx"
+		IndexedGzipFile(
+			filename,
+			indexPath=indexPath,
+			spacing=self.spacing,
+		).close()
+		with open(indexPath, "rb") as fp:
+			indexData = fp.read()
+		for corrupt in (
+			b"",
+			b"NOTINDEX" + indexData[len(indexFileMagic):],
+			indexData[:len(indexFileMagic) + 10],
+			indexData[:len(indexData) // 2],
+		):
+			with open(indexPath, "wb") as fp:
+				fp.write(corrupt)
+			with self.assertLogs("root", "DEBUG"):
+				self.assertIsNone(loadGzipIndex(indexPath, filename))
+			gzFile = IndexedGzipFile(
+				filename,
+				indexPath=indexPath,
+				spacing=self.spacing,
+			)
+			self.assertRandomReads(gzFile, self.data, count=50)
+			gzFile.close()
+
+
+if __name__ == "__main__":
+	unittest.main()
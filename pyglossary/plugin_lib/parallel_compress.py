@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# parallel_compress.py
+#
+# Compress a stream in blocks, in a pool of threads
+# This file is part of PyGlossary project, https://github.com/ilius/pyglossary
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+
+from pyglossary.plugin_lib.process_pool import OrderedResults
+
+import logging
+log = logging.getLogger("root")
+
+
+def getBlockCompressor(compression):
+	"""
+	compression: "gz", "bz2" or "xz"
+	returns a function that compresses a block (bytes) into a complete
+	gzip member / bz2 stream / xz stream, so that concatenation of
+	compressed blocks is a valid compressed file of concatenation of blocks
+	"""
+	if compression == "gz":
+		import gzip
+		return gzip.compress
+	if compression == "bz2":
+		import bz2
+		return bz2.compress
+	if compression == "xz":
+		import lzma
+		return lzma.compress
+	raise ValueError("unsupported compression %r" % compression)
+
+
+class ParallelCompressWriter(object):
+	"""
+	file-like object (write only) that compresses data in blocks of
+	`blockSize` bytes, in a pool of `workers` threads (zlib, bz2 and lzma
+	release GIL while compressing), and writes compressed blocks to
+	`fileObj` in order
+
+	output is a multi-member gzip / multi-stream bz2 or xz file, like
+	pigz and pbzip2 create, that is read by all usual tools
+	"""
+	def __init__(self, fileObj, compression, workers, blockSize=1024 ** 2):
+		from multiprocessing.pool import ThreadPool
+		self._fileObj = fileObj
+		self._compress = getBlockCompressor(compression)
+		self._blockSize = blockSize
+		self._compressed = OrderedResults(ThreadPool(workers), workers)
+		self._buf = []
+		self._bufSize = 0
+		self._pos = 0  # number of uncompressed bytes written
+
+	def write(self, data):
+		self._buf.append(data)
+		self._bufSize += len(data)
+		self._pos += len(data)
+		if self._bufSize >= self._blockSize:
+			self._flushBlock()
+		return len(data)
+
+	def tell(self):
+		return self._pos
+
+	def _flushBlock(self):
+		if not self._buf:
+			return
+		block = b"".join(self._buf)
+		self._buf = []
+		self._bufSize = 0
+		for _, compressed in self._compressed.submit(self._compress, (block,)):
+			self._fileObj.write(compressed)
+
+	def flush(self):
+		pass
+
+	def close(self):
+		"""
+		writes remaining blocks, does not close `fileObj`
+		"""
+		if self._compressed is None:
+			return
+		self._flushBlock()
+		for _, compressed in self._compressed.drain():
+			self._fileObj.write(compressed)
+		self._compressed.close()
+		self._compressed = None
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+# process_pool.py
+#
+# Pools of worker processes (and threads) for plugins
+# This file is part of PyGlossary project, https://github.com/ilius/pyglossary
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+
+import multiprocessing
+from collections import deque
+
+import logging
+log = logging.getLogger("root")
+
+"""
+Worker processes are always forked, never spawned (spawn is the default
+start method on macOS and Windows):
+	- a spawned worker imports the main module again, and pyglossary.pyw
+		(or a GUI) runs the whole conversion at import time
+	- functions that workers run live in plugin modules, which are
+		imported from plugins directory by Glossary.loadPlugins,
+		and are not importable in a fresh interpreter
+
+Where fork is not available (Windows), plugins do the work in the main
+process instead.
+"""
+
+
+def canForkWorkers():
+	return "fork" in multiprocessing.get_all_start_methods()
+
+
+def processWorkers(workers):
+	"""
+	workers: number of worker processes given by user (int)
+	returns `workers`, or 0 if worker processes can not be forked
+	on this platform
+	"""
+	if workers > 1 and not canForkWorkers():
+		log.warning(
+			"Can not fork worker processes on this platform" +
+			", ignoring workers=%s" % workers
+		)
+		return 0
+	return workers
+
+
+def newProcessPool(workers, initializer=None, initargs=()):
+	"""
+	returns a multiprocessing Pool of `workers` forked processes
+	`workers` must be passed through `processWorkers` first
+	"""
+	return multiprocessing.get_context("fork").Pool(
+		workers,
+		initializer=initializer,
+		initargs=initargs,
+	)
+
+
+class OrderedResults(object):
+	"""
+	runs tasks in `pool` (of processes or threads), and gives their
+	results in the order of submission
+
+	at most `workers * 4` tasks are pending, `submit` waits for the
+	oldest one when there are more, so the producer does not get too far
+	ahead of workers, and memory usage stays bounded
+	"""
+	def __init__(self, pool, workers):
+		self._pool = pool
+		self._maxPending = workers * 4
+		self._pending = deque()  # deque of (tag, AsyncResult)
+
+	def submit(self, func, args, tag=None):
+		"""
+		runs func(*args) in pool
+		returns a list of (tag, result) of tasks that are done (in order),
+		which is empty unless too many tasks are pending
+		raises the exception of a failed task
+		"""
+		self._pending.append((tag, self._pool.apply_async(func, args)))
+		if len(self._pending) > self._maxPending:
+			tag, asyncResult = self._pending.popleft()
+			return [(tag, asyncResult.get())]
+		return []
+
+	def drain(self):
+		"""
+		yields (tag, result) of all pending tasks, in order
+		"""
+		while self._pending:
+			tag, asyncResult = self._pending.popleft()
+			yield tag, asyncResult.get()
+
+	def close(self):
+		"""
+		waits for pending tasks (results are discarded, errors are raised),
+		and for workers to exit
+		"""
+		for _ in self.drain():
+			pass
+		self._pool.close()
+		self._pool.join()
+
+	def terminate(self):
+		"""
+		stops workers without waiting for pending tasks
+		"""
+		self._pending.clear()
+		self._pool.terminate()
+		self._pool.join()
+
+
+def orderedApply(pool, func, tasks, workers):
+	"""
+	tasks: iterable of (tag, args), consumed lazily
+	yields (tag, func(*args)) of every task, in the same order,
+	func runs in `pool`, see `OrderedResults`
+
+	pool is terminated when all results are yielded, or when
+	the generator is closed or fails
+	"""
+	results = OrderedResults(pool, workers)
+	try:
+		for tag, args in tasks:
+			yield from results.submit(func, args, tag)
+		yield from results.drain()
+	finally:
+		results.terminate()
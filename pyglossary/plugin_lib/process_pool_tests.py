@@ -0,0 +1,79 @@
+import sys
+import time
+import unittest
+from multiprocessing.pool import ThreadPool
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from pyglossary.plugin_lib.process_pool import (
+	OrderedResults,
+	orderedApply,
+)
+
+
+def slowSquare(x):
+	# later tasks finish first
+	time.sleep((10 - x % 10) * 0.001)
+	return x * x
+
+
+def failOn(x, bad):
+	if x == bad:
+		raise ValueError("bad item %s" % x)
+	return x
+
+
+class OrderedApplyTest(unittest.TestCase):
+	def test_order(self):
+		self.assertEqual(
+			list(orderedApply(
+				ThreadPool(4),
+				slowSquare,
+				((x, (x,)) for x in range(100)),
+				4,
+			)),
+			[(x, x * x) for x in range(100)],
+		)
+
+	def test_bounded(self):
+		submitted = []
+
+		def tasks():
+			for x in range(100):
+				submitted.append(x)
+				yield None, (x,)
+
+		results = orderedApply(ThreadPool(2), slowSquare, tasks(), 2)
+		next(results)
+		# the first result is taken after 2 * 4 + 1 tasks are submitted
+		self.assertEqual(len(submitted), 9)
+		results.close()
+
+	def test_error(self):
+		pool = ThreadPool(2)
+		with self.assertRaises(ValueError):
+			list(orderedApply(
+				pool,
+				failOn,
+				((None, (x, 50)) for x in range(100)),
+				2,
+			))
+		with self.assertRaises(ValueError):
+			pool.apply_async(abs, (1,))  # pool is terminated
+
+
+class OrderedResultsTest(unittest.TestCase):
+	def test_submit_drain(self):
+		results = OrderedResults(ThreadPool(2), 1)
+		done = []
+		for x in range(10):
+			done += results.submit(slowSquare, (x,), x)
+			self.assertLessEqual(x + 1 - len(done), 4)
+		done += results.drain()
+		results.close()
+		self.assertEqual(done, [(x, x * x) for x in range(10)])
+
+
+if __name__ == "__main__":
+	unittest.main()
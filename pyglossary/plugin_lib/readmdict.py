@@ -287,8 +287,8 @@ class MDict(object):
 		# store stylesheet in dict in the form of
 		# {'number' : ('style_begin', 'style_end')}
 		self._stylesheet = {}
-		if header_tag.get('StyleSheet'):
-			lines = header_tag['StyleSheet'].splitlines()
+		if header_tag.get(b'StyleSheet'):
+			lines = header_tag[b'StyleSheet'].decode('utf-8').splitlines()
 			for i in range(0, len(lines), 3):
 				self._stylesheet[lines[i]] = (lines[i+1], lines[i+2])
 
@@ -419,12 +419,13 @@ class MDD(MDict):
 	def __init__(self, fname, passcode=None):
 		MDict.__init__(self, fname, encoding='UTF-16', passcode=passcode)
 
-	def items(self):
+	def items(self, start_index=0):
 		"""Return a generator which in turn produce tuples in the form of (filename, content)
+		start_index: number of records to skip (used to resume reading)
 		"""
-		return self._decode_record_block()
+		return self._decode_record_block(start_index)
 
-	def _decode_record_block(self):
+	def _decode_record_block(self, start_index=0):
 		f = open(self._fname, 'rb')
 		f.seek(self._record_block_offset)
 
@@ -449,6 +450,15 @@ class MDD(MDict):
 		i = 0
 		size_counter = 0
 		for compressed_size, decompressed_size in record_block_info_list:
+			if i < start_index and (start_index >= len(self._key_list) or self._key_list[start_index][0] >= offset + decompressed_size):
+				# all records of this block are before start_index, skip it
+				# without decompressing
+				f.seek(compressed_size, 1)
+				while i < len(self._key_list) and self._key_list[i][0] < offset + decompressed_size:
+					i += 1
+				offset += decompressed_size
+				size_counter += compressed_size
+				continue
 			record_block_compressed = f.read(compressed_size)
 			# 4 bytes: compression type
 			record_block_type = record_block_compressed[:4]
@@ -483,6 +493,8 @@ class MDD(MDict):
 				else:
 					record_end = len(record_block) + offset
 				i += 1
+				if i <= start_index:
+					continue
 				data = record_block[record_start-offset:record_end-offset]
 				yield key_text, data
 			offset += len(record_block)
@@ -501,34 +513,40 @@ class MDX(MDict):
 	>>> for key,value in mdx.items():
 	... print key, value[:10]
 	"""
+	# `number` tags of stylesheet in records
+	_stylesheet_tag_pattern = re.compile(r'`(\d+)`')
+
 	def __init__(self, fname, encoding='', substyle=False, passcode=None):
 		MDict.__init__(self, fname, encoding, passcode)
 		self._substyle = substyle
 
-	def items(self):
+	def items(self, start_index=0):
 		"""Return a generator which in turn produce tuples in the form of (key, value)
+		key is utf-8 encoded bytes, and value is str
+		start_index: number of records to skip (used to resume reading)
 		"""
-		return self._decode_record_block()
+		return self._decode_record_block(start_index)
 
 	def _substitute_stylesheet(self, txt):
 		# substitute stylesheet definition
-		txt_list = re.split('`\d+`', txt)
-		txt_tag = re.findall('`\d+`', txt)
-		txt_styled = txt_list[0]
-		for j, p in enumerate(txt_list[1:]):
-			key = txt_tag[j][1:-1]
+		# split gives [text, number, text, number, text, ...]
+		txt_list = self._stylesheet_tag_pattern.split(txt)
+		txt_styled = [txt_list[0]]
+		for j in range(1, len(txt_list), 2):
+			key = txt_list[j]
+			p = txt_list[j+1]
 			try:
 				style = self._stylesheet[key]
 			except KeyError:
 				log.error('invalid stylesheet key "%s"'%key)
 				continue
 			if p and p[-1] == '\n':
-				txt_styled = txt_styled + style[0] + p.rstrip() + style[1] + '\r\n'
+				txt_styled += [style[0], p.rstrip(), style[1], '\r\n']
 			else:
-				txt_styled = txt_styled + style[0] + p + style[1]
-		return txt_styled
+				txt_styled += [style[0], p, style[1]]
+		return ''.join(txt_styled)
 
-	def _decode_record_block(self):
+	def _decode_record_block(self, start_index=0):
 		f = open(self._fname, 'rb')
 		f.seek(self._record_block_offset)
 
@@ -548,11 +566,23 @@ class MDX(MDict):
 			size_counter += self._number_width * 2
 		assert(size_counter == record_block_info_size)
 
+		encoding = self._encoding
+		substyle = self._substyle and self._stylesheet
+
 		# actual record block data
 		offset = 0
 		i = 0
 		size_counter = 0
 		for compressed_size, decompressed_size in record_block_info_list:
+			if i < start_index and (start_index >= len(self._key_list) or self._key_list[start_index][0] >= offset + decompressed_size):
+				# all records of this block are before start_index, skip it
+				# without decompressing
+				f.seek(compressed_size, 1)
+				while i < len(self._key_list) and self._key_list[i][0] < offset + decompressed_size:
+					i += 1
+				offset += decompressed_size
+				size_counter += compressed_size
+				continue
 			record_block_compressed = f.read(compressed_size)
 			# 4 bytes indicates block compression type
 			record_block_type = record_block_compressed[:4]
@@ -590,11 +620,13 @@ class MDX(MDict):
 				else:
 					record_end = len(record_block) + offset
 				i += 1
-				record = record_block[record_start-offset:record_end-offset]
-				# convert to utf-8
-				record = record.decode(self._encoding, errors='ignore').strip(unicode('\x00')).encode('utf-8')
+				if i <= start_index:
+					continue
+				# decode to str only once
+				record = record_block[record_start-offset:record_end-offset]\
+					.decode(encoding, errors='ignore').strip('\x00')
 				# substitute styles
-				if self._substyle and self._stylesheet:
+				if substyle:
 					record = self._substitute_stylesheet(record)
 
 				yield key_text, record
@@ -693,16 +725,16 @@ if __name__ == '__main__':
 			for key, value in mdx.items():
 				tf.write(key)
 				tf.write(b'\r\n')
-				tf.write(value)
-				if not value.endswith(b'\n'):
+				tf.write(value.encode('utf-8'))
+				if not value.endswith('\n'):
 					tf.write(b'\r\n')
 				tf.write(b'</>\r\n')
 			tf.close()
 			# write out style
-			if mdx.header.get('StyleSheet'):
+			if mdx.header.get(b'StyleSheet'):
 				style_fname = ''.join([base, '_style', os.path.extsep, 'txt'])
 				sf = open(style_fname, 'wb')
-				sf.write(b'\r\n'.join(mdx.header['StyleSheet'].splitlines()))
+				sf.write(b'\r\n'.join(mdx.header[b'StyleSheet'].splitlines()))
 				sf.close()
 		# write out optional data files
 		if mdd:
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+# stardict_resdb.py
+#
+# StarDict resource storage (res.rifo, res.ridx, res.rdic / res.rdic.dz)
+# This file is part of PyGlossary project, https://github.com/ilius/pyglossary
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+
+import os
+from os.path import join, isfile
+import mmap
+from array import array
+
+from pyglossary.text_utils import intToBinStr, binStrToInt
+from pyglossary.file_utils import openTruncated
+from pyglossary.plugin_lib.dictzip import DictzipFile
+from pyglossary.plugin_lib.gzip_index import IndexedGzipFile
+
+import logging
+log = logging.getLogger("root")
+
+"""
+StarDict resource database is an alternative to "res" directory,
+that keeps all resource files in 3 files, next to .ifo file:
+
+res.rifo: text file, like .ifo:
+	StarDict's storage ifo file
+	version=3.0.0
+	filecount=...
+	ridxfilesize=...
+	idxoffsetbits=64  (optional)
+
+res.ridx: sorted (by file name bytes) list of records:
+	file name (utf-8, "/" as separator), null terminator,
+	offset of data in .rdic (32 or 64 bits), size of data (32 bits)
+
+res.rdic (or res.rdic.dz compressed with dictzip): data of files
+"""
+
+
+def hasResourceDB(direc):
+	return isfile(join(direc, "res.rifo"))
+
+
+class ResourceDBReader(object):
+	"""
+	reads resource database with random access:
+		ridx file is memory-mapped, and record positions are kept in an array
+		rdic file is memory-mapped too, or read by chunks if it's dictzipped
+	"""
+	def __init__(self, direc):
+		self._dir = direc
+		self._fileCount = 0
+		self._offsetSize = 4
+		self._ridxFile = None
+		self._ridx = None  # mmap of res.ridx
+		self._recordPos = array("Q")  # position of each record in ridx
+		self._rdicFile = None
+		self._rdic = None  # mmap, DictzipFile or IndexedGzipFile
+
+	def open(self):
+		info = {}
+		with open(join(self._dir, "res.rifo"), encoding="utf-8") as rifoFile:
+			for line in rifoFile:
+				key, eq, value = line.strip().partition("=")
+				if eq:
+					info[key] = value
+		self._fileCount = int(info.get("filecount", 0))
+		if info.get("idxoffsetbits") == "64":
+			self._offsetSize = 8
+
+		self._ridxFile = open(join(self._dir, "res.ridx"), "rb")
+		self._ridx = self._mmap(self._ridxFile)
+		self._readRecordPositions()
+
+		rdicPath = join(self._dir, "res.rdic")
+		if isfile(rdicPath):
+			self._rdicFile = open(rdicPath, "rb")
+			self._rdic = self._mmap(self._rdicFile)
+		elif isfile(rdicPath + ".dz"):
+			try:
+				self._rdic = DictzipFile(rdicPath + ".dz")
+			except ValueError:
+				log.info("%s.dz is not dictzipped, using gzip index" % rdicPath)
+				self._rdic = IndexedGzipFile(rdicPath + ".dz")
+		else:
+			raise IOError("res.rdic not found in %r" % self._dir)
+
+	def _mmap(self, fileObj):
+		if os.fstat(fileObj.fileno()).st_size == 0:
+			return b""
+		return mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def _readRecordPositions(self):
+		ridx = self._ridx
+		recordPos = array("Q")
+		tailSize = self._offsetSize + 4
+		pos = 0
+		size = len(ridx)
+		while pos < size:
+			recordPos.append(pos)
+			pos = ridx.find(b"\x00", pos)
+			if pos < 0:
+				log.error("res.ridx is corrupted")
+				break
+			pos += 1 + tailSize
+		self._recordPos = recordPos
+		if len(recordPos) != self._fileCount:
+			log.warning(
+				"res.rifo: filecount=%s" % self._fileCount +
+				", but res.ridx has %s records" % len(recordPos)
+			)
+
+	def __len__(self):
+		return len(self._recordPos)
+
+	def getRecord(self, index):
+		"""
+		returns (b_fname, offset, size)
+		"""
+		ridx = self._ridx
+		beg = self._recordPos[index]
+		pos = ridx.find(b"\x00", beg)
+		b_fname = ridx[beg:pos]
+		pos += 1
+		offset = binStrToInt(ridx[pos:pos+self._offsetSize])
+		pos += self._offsetSize
+		size = binStrToInt(ridx[pos:pos+4])
+		return b_fname, offset, size
+
+	def readData(self, offset, size):
+		rdic = self._rdic
+		if isinstance(rdic, DictzipFile):
+			return rdic.read(offset, size)
+		if isinstance(rdic, IndexedGzipFile):
+			rdic.seek(offset)
+			return rdic.read(size)
+		return rdic[offset:offset+size]
+
+	def find(self, fname):
+		"""
+		returns index of record with file name `fname` (str), or -1
+		binary search over ridx, which is sorted by file name bytes
+		"""
+		b_fname = fname.replace(os.sep, "/").encode("utf-8")
+		lo, hi = 0, len(self._recordPos)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if self.getRecord(mid)[0] < b_fname:
+				lo = mid + 1
+			else:
+				hi = mid
+		if lo < len(self._recordPos) and self.getRecord(lo)[0] == b_fname:
+			return lo
+		return -1
+
+	def get(self, fname):
+		"""
+		returns data (bytes) of file `fname`, or None if not found
+		"""
+		index = self.find(fname)
+		if index < 0:
+			return
+		_, offset, size = self.getRecord(index)
+		return self.readData(offset, size)
+
+	def iterItems(self, start=0):
+		"""
+		yields (fname, data) tuples, fname is str (with os.sep)
+		"""
+		for index in range(start, len(self._recordPos)):
+			b_fname, offset, size = self.getRecord(index)
+			fname = b_fname.decode("utf-8").replace("/", os.sep)
+			yield fname, self.readData(offset, size)
+
+	def close(self):
+		for obj in (self._ridx, self._rdic):
+			if obj is not None and not isinstance(obj, bytes):
+				obj.close()
+		for fileObj in (self._ridxFile, self._rdicFile):
+			if fileObj is not None:
+				fileObj.close()
+		self._ridx = self._rdic = None
+		self._ridxFile = self._rdicFile = None
+		self._recordPos = array("Q")
+
+
+class ResourceDBWriter(object):
+	"""
+	writes resource database in a streaming fashion:
+		data of every file is appended to res.rdic as soon as it's added,
+		only (file name, offset, size) of files are kept in memory
+		and res.ridx is written (sorted) when closing
+
+	for checkpoints, records are also appended to res.ridx.checkpoint
+	"""
+	def __init__(self, direc):
+		self._dir = direc
+		self._rdicFile = None
+		self._checkpointFile = None
+		self._records = []  # list of (b_fname, offset, size)
+		self._checkpointCount = 0  # number of records in checkpoint file
+		self._offset = 0
+
+	def open(self, resumeState=None):
+		"""
+		resumeState: dict returned by checkpointState(), or None
+		"""
+		if not os.path.isdir(self._dir):
+			os.makedirs(self._dir)
+		rdicPath = join(self._dir, "res.rdic")
+		checkpointPath = join(self._dir, "res.ridx.checkpoint")
+		if resumeState:
+			self._offset = resumeState["rdicSize"]
+			self._rdicFile = openTruncated(rdicPath, self._offset)
+			self._records = self._readCheckpoint(
+				checkpointPath,
+				resumeState["checkpointSize"],
+			)
+			self._checkpointCount = len(self._records)
+			self._checkpointFile = openTruncated(
+				checkpointPath,
+				resumeState["checkpointSize"],
+			)
+			return
+		self._rdicFile = open(rdicPath, "wb")
+		self._checkpointFile = open(checkpointPath, "wb")
+
+	def _readCheckpoint(self, filename, fileSize):
+		with open(filename, "rb") as fp:
+			data = fp.read(fileSize)
+		records = []
+		pos = 0
+		while pos < len(data):
+			beg = pos
+			pos = data.index(b"\x00", beg)
+			b_fname = data[beg:pos]
+			pos += 1
+			offset = binStrToInt(data[pos:pos+8])
+			size = binStrToInt(data[pos+8:pos+12])
+			pos += 12
+			records.append((b_fname, offset, size))
+		return records
+
+	def add(self, fname, data):
+		b_fname = fname.replace(os.sep, "/").encode("utf-8")
+		self._rdicFile.write(data)
+		self._records.append((b_fname, self._offset, len(data)))
+		self._offset += len(data)
+
+	def __len__(self):
+		return len(self._records)
+
+	def checkpointState(self):
+		self._rdicFile.flush()
+		self._checkpointFile.write(b"".join([
+			b_fname + b"\x00" + intToBinStr(offset, 8) + intToBinStr(size, 4)
+			for b_fname, offset, size in self._records[self._checkpointCount:]
+		]))
+		self._checkpointFile.flush()
+		self._checkpointCount = len(self._records)
+		return {
+			"rdicSize": self._offset,
+			"checkpointSize": self._checkpointFile.tell(),
+		}
+
+	def close(self):
+		"""
+		writes res.ridx and res.rifo
+		returns the number of files
+		"""
+		self._rdicFile.close()
+		self._rdicFile = None
+		self._checkpointFile.close()
+		self._checkpointFile = None
+		os.remove(join(self._dir, "res.ridx.checkpoint"))
+		records = self._records
+		records.sort()
+		offsetSize = 8 if self._offset >= 1 << 32 else 4
+		ridxSize = 0
+		with open(join(self._dir, "res.ridx"), "wb") as ridxFile:
+			prev = None
+			for b_fname, offset, size in records:
+				if b_fname == prev:
+					log.warning(
+						"Duplicate resource file name %r" % b_fname +
+						" in resource database"
+					)
+				prev = b_fname
+				b_record = b_fname + b"\x00" + \
+					intToBinStr(offset, offsetSize) + \
+					intToBinStr(size, 4)
+				ridxFile.write(b_record)
+				ridxSize += len(b_record)
+		rifoStr = "StarDict's storage ifo file\n" \
+			+ "version=3.0.0\n" \
+			+ "filecount=%s\n" % len(records) \
+			+ "ridxfilesize=%s\n" % ridxSize
+		if offsetSize == 8:
+			rifoStr += "idxoffsetbits=64\n"
+		with open(join(self._dir, "res.rifo"), "w", encoding="utf-8") as rifoFile:
+			rifoFile.write(rifoStr)
+		fileCount = len(records)
+		self._records = []
+		self._checkpointCount = 0
+		return fileCount
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+# writemdict.py
+#
+# Octopus MDict dictionary file (.mdx) and resource file (.mdd) writer
+# This file is part of PyGlossary project, https://github.com/ilius/pyglossary
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+
+import re
+import zlib
+import time
+from struct import Struct
+from tempfile import TemporaryFile
+from shutil import copyfileobj
+
+from pyglossary.plugin_lib.process_pool import OrderedResults
+
+import logging
+log = logging.getLogger("root")
+
+"""
+MDict file format (engine version 2.0), all numbers are big endian:
+
+header:
+	size of header text (4 bytes), header text (UTF-16LE xml tag, ending
+	with null), adler32 of header text (4 bytes, little endian)
+
+keys section:
+	number of key blocks, number of entries, size of key block info
+	(decompressed), size of key block info (compressed), size of all key
+	blocks (8 bytes each), adler32 of these 5 numbers (4 bytes)
+	key block info (compressed): for every key block:
+		number of entries (8 bytes), size and text of first key, size and
+		text of last key (size: 2 bytes, not including null terminator),
+		compressed and decompressed size of key block (8 bytes each)
+	key blocks: for every key: offset of record (8 bytes), key text,
+		null terminator
+
+records section:
+	number of record blocks, number of entries, size of record block info,
+	size of all record blocks (8 bytes each)
+	record block info: compressed and decompressed size of every record
+		block (8 bytes each)
+	record blocks: concatenated records
+
+Every compressed block (key block info, key blocks and record blocks) is:
+	compression type (4 bytes, 2 for zlib), adler32 of decompressed data
+	(4 bytes), compressed data
+
+Keys must be sorted, and records must be in the same order as keys,
+because end of each record is the offset of the next key's record.
+"""
+
+numberStruct = Struct(">Q")
+shortStruct = Struct(">H")
+adlerStruct = Struct(">I")
+zlibBlockType = b"\x02\x00\x00\x00"
+
+# characters that are ignored in sorting (and looking up) keys
+# when StripKey="Yes"
+stripKeyPattern = re.compile(r"[ _=,.;:!?@%&#~`()\[\]<>{}/\\$+\-*^'\"\t|]")
+
+
+def sortKey(key):
+	"""
+	sort key of MDict keys (str), for KeyCaseSensitive="No", StripKey="Yes"
+	"""
+	return (
+		stripKeyPattern.sub("", key).lower(),
+		key,
+	)
+
+
+def mddSortKey(key):
+	"""
+	sort key of MDD keys (str), for KeyCaseSensitive="No", StripKey="No"
+	which are declared in header of .mdd file
+	"""
+	return (
+		key.lower(),
+		key,
+	)
+
+
+def compressBlock(data):
+	return zlibBlockType + \
+		adlerStruct.pack(zlib.adler32(data) & 0xffffffff) + \
+		zlib.compress(data)
+
+
+def escapeHeaderValue(value):
+	return value.replace("&", "&amp;")\
+		.replace("<", "&lt;")\
+		.replace(">", "&gt;")\
+		.replace("\"", "&quot;")
+
+
+class MDictWriter(object):
+	"""
+	writes .mdx or .mdd file in a streaming fashion, keys must be added
+	in sortKey order (mddSortKey order for .mdd)
+
+	key blocks and record blocks are compressed (in a pool of `workers`
+	threads, zlib releases GIL while compressing) and written to temporary
+	files as soon as they are full, only sizes and first/last keys of
+	blocks are kept in memory, then the final file is put together
+	in close(), as keys section comes before records section
+	"""
+	# uncompressed size of key blocks and record blocks, in bytes
+	blockSize = 64 * 1024
+
+	def __init__(
+		self,
+		filename,
+		title="",
+		description="",
+		encoding="UTF-8",
+		isMdd=False,
+		workers=0,
+	):
+		"""
+		encoding: encoding of keys and records (of .mdx), .mdd keys are
+			always in UTF-16
+		workers: number of compression threads, 0 or 1 means compressing
+			in this thread
+		"""
+		self._filename = filename
+		self._title = title
+		self._description = description
+		self._isMdd = isMdd
+		self._encoding = "UTF-16" if isMdd else encoding.upper()
+		if self._encoding == "UTF-16":
+			self._pyEncoding = "utf-16-le"
+			self._terminator = b"\x00\x00"
+		else:
+			self._pyEncoding = self._encoding.lower()
+			self._terminator = b"\x00"
+		self._workers = workers
+		# OrderedResults of compressed blocks (tagged with block info),
+		# or None if blocks are compressed in this thread
+		self._compressed = None
+		self._keyBlocksFile = None
+		self._recordBlocksFile = None
+		# (numEntries, b_firstKey, b_lastKey, compressedSize, size)
+		self._keyBlockInfo = []
+		# (compressedSize, size)
+		self._recordBlockInfo = []
+		self._keyBuf = []
+		self._keyBufSize = 0
+		self._keyBufFirst = b""
+		self._keyBufLast = b""
+		self._recordBuf = []
+		self._recordBufSize = 0
+		self._recordOffset = 0  # offset of next record, in decompressed records
+		self._entryCount = 0
+
+	def open(self):
+		self._keyBlocksFile = TemporaryFile(prefix="pyglossary-mdict-")
+		self._recordBlocksFile = TemporaryFile(prefix="pyglossary-mdict-")
+		if self._workers > 1:
+			from multiprocessing.pool import ThreadPool
+			self._compressed = OrderedResults(
+				ThreadPool(self._workers),
+				self._workers,
+			)
+
+	def add(self, key, b_record):
+		"""
+		key: str
+		b_record: bytes, for .mdx it must include null terminator
+		"""
+		b_key = key.encode(self._pyEncoding)
+		if not self._keyBuf:
+			self._keyBufFirst = b_key
+		self._keyBufLast = b_key
+		b_keyItem = numberStruct.pack(self._recordOffset) + b_key + self._terminator
+		self._keyBuf.append(b_keyItem)
+		self._keyBufSize += len(b_keyItem)
+		if self._keyBufSize >= self.blockSize:
+			self._flushKeyBlock()
+
+		self._recordBuf.append(b_record)
+		self._recordBufSize += len(b_record)
+		self._recordOffset += len(b_record)
+		if self._recordBufSize >= self.blockSize:
+			self._flushRecordBlock()
+
+		self._entryCount += 1
+
+	def addText(self, key, text):
+		"""
+		adds a record of .mdx file
+		"""
+		self.add(key, text.encode(self._pyEncoding) + self._terminator)
+
+	def _flushKeyBlock(self):
+		if not self._keyBuf:
+			return
+		self._submit(
+			(
+				"key",
+				len(self._keyBuf),
+				self._keyBufFirst,
+				self._keyBufLast,
+			),
+			b"".join(self._keyBuf),
+		)
+		self._keyBuf = []
+		self._keyBufSize = 0
+
+	def _flushRecordBlock(self):
+		if not self._recordBuf:
+			return
+		self._submit(("record",), b"".join(self._recordBuf))
+		self._recordBuf = []
+		self._recordBufSize = 0
+
+	def _submit(self, blockInfo, data):
+		blockInfo += (len(data),)
+		if self._compressed is None:
+			self._writeBlock(blockInfo, compressBlock(data))
+			return
+		for blockInfo, compressed in self._compressed.submit(
+			compressBlock,
+			(data,),
+			blockInfo,
+		):
+			self._writeBlock(blockInfo, compressed)
+
+	def _writeBlock(self, blockInfo, compressed):
+		if blockInfo[0] == "key":
+			_, count, b_first, b_last, size = blockInfo
+			self._keyBlocksFile.write(compressed)
+			self._keyBlockInfo.append((
+				count,
+				b_first,
+				b_last,
+				len(compressed),
+				size,
+			))
+		else:
+			self._recordBlocksFile.write(compressed)
+			self._recordBlockInfo.append((len(compressed), blockInfo[1]))
+
+	def _keyTextItem(self, b_key):
+		"""
+		returns size and text of first/last key for key block info
+		size is in characters for UTF-16, and in bytes otherwise
+		"""
+		size = len(b_key)
+		if self._encoding == "UTF-16":
+			size //= 2
+		return shortStruct.pack(size) + b_key + self._terminator
+
+	def _headerText(self):
+		if self._isMdd:
+			tagName = "Library_Data"
+			attrs = [
+				("GeneratedByEngineVersion", "2.0"),
+				("RequiredEngineVersion", "2.0"),
+				("Encrypted", "0"),
+				("Encoding", ""),
+				("Format", ""),
+				("CreationDate", time.strftime("%Y-%m-%d")),
+				("KeyCaseSensitive", "No"),
+				("Stripkey", "No"),
+				("Description", self._description),
+				("Title", self._title),
+				("RegisterBy", ""),
+			]
+		else:
+			tagName = "Dictionary"
+			attrs = [
+				("GeneratedByEngineVersion", "2.0"),
+				("RequiredEngineVersion", "2.0"),
+				("Encrypted", "No"),
+				("Encoding", self._encoding),
+				("Format", "Html"),
+				("Stripkey", "Yes"),
+				("CreationDate", time.strftime("%Y-%m-%d")),
+				("Compact", "Yes"),
+				("Compat", "Yes"),
+				("KeyCaseSensitive", "No"),
+				("Description", self._description),
+				("Title", self._title),
+				("DataSourceFormat", "106"),
+				("StyleSheet", ""),
+				("Left2Right", "Yes"),
+				("RegisterBy", ""),
+			]
+		return "<%s %s/>\r\n" % (
+			tagName,
+			" ".join(
+				"%s=\"%s\"" % (key, escapeHeaderValue(value))
+				for key, value in attrs
+			),
+		)
+
+	def close(self):
+		"""
+		writes the final file, returns the number of entries
+		"""
+		self._flushKeyBlock()
+		self._flushRecordBlock()
+		if self._compressed is not None:
+			for blockInfo, compressed in self._compressed.drain():
+				self._writeBlock(blockInfo, compressed)
+			self._compressed.close()
+			self._compressed = None
+
+		keyBlockInfo = b"".join([
+			numberStruct.pack(count) +
+			self._keyTextItem(b_first) +
+			self._keyTextItem(b_last) +
+			numberStruct.pack(compressedSize) +
+			numberStruct.pack(size)
+			for count, b_first, b_last, compressedSize, size in self._keyBlockInfo
+		])
+		keyBlockInfoCompressed = compressBlock(keyBlockInfo)
+		keySectionHead = b"".join([
+			numberStruct.pack(len(self._keyBlockInfo)),
+			numberStruct.pack(self._entryCount),
+			numberStruct.pack(len(keyBlockInfo)),
+			numberStruct.pack(len(keyBlockInfoCompressed)),
+			numberStruct.pack(self._keyBlocksFile.tell()),
+		])
+		recordBlockInfo = b"".join([
+			numberStruct.pack(compressedSize) + numberStruct.pack(size)
+			for compressedSize, size in self._recordBlockInfo
+		])
+		b_header = self._headerText().encode("utf-16-le") + b"\x00\x00"
+
+		with open(self._filename, "wb") as mdictFile:
+			mdictFile.write(adlerStruct.pack(len(b_header)))
+			mdictFile.write(b_header)
+			mdictFile.write(
+				(zlib.adler32(b_header) & 0xffffffff).to_bytes(4, "little")
+			)
+			mdictFile.write(keySectionHead)
+			mdictFile.write(adlerStruct.pack(
+				zlib.adler32(keySectionHead) & 0xffffffff
+			))
+			mdictFile.write(keyBlockInfoCompressed)
+			self._keyBlocksFile.seek(0)
+			copyfileobj(self._keyBlocksFile, mdictFile)
+			mdictFile.write(numberStruct.pack(len(self._recordBlockInfo)))
+			mdictFile.write(numberStruct.pack(self._entryCount))
+			mdictFile.write(numberStruct.pack(len(recordBlockInfo)))
+			mdictFile.write(numberStruct.pack(self._recordBlocksFile.tell()))
+			mdictFile.write(recordBlockInfo)
+			self._recordBlocksFile.seek(0)
+			copyfileobj(self._recordBlocksFile, mdictFile)
+
+		self._keyBlocksFile.close()
+		self._keyBlocksFile = None
+		self._recordBlocksFile.close()
+		self._recordBlocksFile = None
+		return self._entryCount
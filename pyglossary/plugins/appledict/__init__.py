@@ -27,6 +27,11 @@ import pkgutil
 import shutil
 
 from pyglossary.plugins.formats_common import *
+from pyglossary.plugin_lib.process_pool import (
+	processWorkers,
+	newProcessPool,
+	orderedApply,
+)
 from ._dict import *
 
 import xdxf
@@ -39,7 +44,7 @@ description = "AppleDict Source (xml)"
 extentions = [".xml"]
 readOptions = []
 writeOptions = [
-	"cleanHTML",  # bool
+	"cleanHTML",  # bool or "lxml"
 	"css",  # str or None
 	"xsl",  # str or None
 	"defaultPrefs",  # dict or None, FIXME
@@ -47,8 +52,12 @@ writeOptions = [
 	"frontBackMatter",  # str or None
 	"jing",  # str or None
 	"indexes",  # str or None
+	"workers",  # int
+	"indexesCache",  # str or None
 ]
 
+formatBatchSize = 200  # number of entries that are formatted together
+
 
 def abspath_or_None(path):
 	return os.path.abspath(os.path.expanduser(path)) if path else None
@@ -98,6 +107,78 @@ def write_css(fname, css_file):
 			))
 
 
+def format_entries(
+	glos,
+	resDir,
+	cleaner,
+	indexes,
+	indexesCache,
+	workers,
+	cacheStats,
+):
+	"""
+	saves data entries into `resDir`, and yields (title_attr, text)
+	of other entries, in the same order
+
+	entries are formatted in batches, in a pool of `workers` processes
+	if workers > 1
+
+	cacheStats: list of [hits, diskHits, misses] of index expansions cache,
+		which is updated after every batch
+	"""
+	from itertools import islice
+
+	def textEntryItems():
+		for entry in glos:
+			if entry.isData():
+				entry.save(resDir)
+				continue
+			yield entry.getWords(), entry.getDefi(), entry.getDefiFormat()
+
+	def batchResults(results, stats):
+		for i, count in enumerate(stats):
+			cacheStats[i] += count
+		for result in results:
+			if result is not None:
+				yield result
+
+	def batches():
+		items = textEntryItems()
+		while True:
+			batch = list(islice(items, formatBatchSize))
+			if not batch:
+				break
+			yield batch
+
+	if workers < 2:
+		formatter = EntryFormatter(cleaner, indexes, indexesCache)
+		try:
+			for batch in batches():
+				results = formatter.format_batch(batch)
+				yield from batchResults(results, formatter.flush_cache())
+		finally:
+			formatter.close()
+		return
+
+	# raise configuration errors (like an unsupported indexes language,
+	# or a cache file that can not be created) here, if pool initializer
+	# fails, pool keeps starting new workers
+	# this also creates the cache table once, before workers open it
+	EntryFormatter(cleaner, indexes, indexesCache).close()
+	pool = newProcessPool(
+		workers,
+		initializer=init_format_worker,
+		initargs=(cleaner, indexes, indexesCache),
+	)
+	for _, (results, stats) in orderedApply(
+		pool,
+		format_entry_batch,
+		((None, (batch,)) for batch in batches()),
+		workers,
+	):
+		yield from batchResults(results, stats)
+
+
 def write(
 	glos,
 	dirPath,
@@ -109,6 +190,8 @@ def write(
 	frontBackMatter=None,
 	jing=None,
 	indexes=None,
+	workers=0,
+	indexesCache=None,
 ):
 	"""
 	write glossary to Apple dictionary .xml and supporting files.
@@ -117,7 +200,9 @@ def write(
 	:type dirPath: str, directory path, must not have extension
 
 	:type cleanHTML: str
-	:param cleanHTML: pass "yes" to use BeautifulSoup parser.
+	:param cleanHTML: pass "yes" to use BeautifulSoup parser,
+	or "lxml" to use lxml.html parser, which is much faster and gives
+	equivalent xhtml.
 
 	:type css: str or None
 	:param css: path to custom .css file
@@ -150,20 +235,37 @@ def write(
 	how to perform flexible search.  we can help it by manually providing
 	additional indexes to dictionary entries.
 	# for now no languages supported yet.
+
+	:type workers: int
+	:param workers: number of processes that format entries (transform
+	xdxf definitions, clean html and generate indexes), 0 means formatting
+	in this process.  entries are written in the same order anyway.
+	worker processes are forked, so it's ignored where fork is not
+	available (Windows).
+
+	:type indexesCache: str or None
+	:param indexesCache: path to a cache file (SQLite database) of
+	language-specific index expansions (forms of words, etc), which
+	is created if it does not exist, and can be reused between builds.
 	"""
 	if not isdir(dirPath):
 		os.mkdir(dirPath)
 
 	xdxf.xdxf_init()
 
-	if cleanHTML:
+	cleaner = ""
+	if cleanHTML == "lxml":
+		cleaner = "lxml"
+	elif cleanHTML:
+		cleaner = "bs4"
 		BeautifulSoup = get_beautiful_soup()
 		if not BeautifulSoup:
 			log.warning(
 				"cleanHTML option passed but BeautifulSoup not found.  " +
 				"to fix this run `sudo pip3 install lxml beautifulsoup4 html5lib`"
 			)
-	else:
+			cleaner = ""
+	if cleaner != "bs4":
 		BeautifulSoup = None
 
 	fileNameBase = basename(dirPath).replace(".", "_")
@@ -175,7 +277,8 @@ def write(
 	frontBackMatter = abspath_or_None(frontBackMatter)
 
 	generate_id = id_generator()
-	generate_indexes = indexes_generator(indexes)
+	cacheStats = [0, 0, 0]
+	indexesCache = abspath_or_None(indexesCache)
 
 	glos.setDefaultDefiFormat("h")
 
@@ -185,43 +288,29 @@ def write(
 
 	with open(filePathBase + ".xml", "w", encoding="utf8") as toFile:
 		write_header(glos, toFile, frontBackMatter)
-		for entryI, entry in enumerate(glos):
-			if entry.isData():
-				entry.save(myResDir)
-				continue
-
-			words = entry.getWords()
-			word, alts = words[0], words[1:]
-			defi = entry.getDefi()
-
-			long_title = _normalize.title_long(
-				_normalize.title(word, BeautifulSoup)
-			)
-			if not long_title:
-				continue
-
-			_id = next(generate_id)
-			if BeautifulSoup:
-				title_attr = BeautifulSoup.dammit.EntitySubstitution\
-					.substitute_xml(long_title, True)
-			else:
-				title_attr = str(long_title)
-
-			content_title = long_title
-			if entry.getDefiFormat() == "x":
-				defi = xdxf.xdxf_to_html(defi)
-				content_title = None
-			content = format_clean_content(content_title, defi, BeautifulSoup)
-
+		formattedEntries = format_entries(
+			glos,
+			myResDir,
+			cleaner,
+			indexes,
+			indexesCache,
+			processWorkers(int(workers)),
+			cacheStats,
+		)
+		for title_attr, text in formattedEntries:
 			toFile.write(
-				'<d:entry id="%s" d:title=%s>\n' % (_id, title_attr) +
-				generate_indexes(long_title, alts, content, BeautifulSoup) +
-				content +
+				'<d:entry id="%s" d:title=%s>\n' % (next(generate_id), title_attr) +
+				text +
 				"\n</d:entry>\n"
 			)
 
 		toFile.write("</d:dictionary>\n")
 
+	if indexes:
+		log.info(
+			"indexes cache: %s hits, %s disk hits, %s misses" % tuple(cacheStats)
+		)
+
 	if xsl:
 		shutil.copy(xsl, myResDir)
 
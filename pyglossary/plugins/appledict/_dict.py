@@ -28,6 +28,8 @@ from xml.sax.saxutils import unescape, quoteattr
 from . import _normalize
 from pyglossary.plugins.formats_common import log, toStr
 
+import xdxf
+
 log = logging.getLogger("root")
 
 
@@ -74,59 +76,35 @@ def id_generator():
 		cnt += 1
 
 
-def indexes_generator(indexes_lang):
+def quote_attr(value):
+	"""
+	escapes and quotes an attribute value, same as
+	BeautifulSoup.dammit.EntitySubstitution.substitute_xml(value, True)
 	"""
-	factory that acts according to glossary language
+	value = value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+	if '"' not in value:
+		return '"%s"' % value
+	if "'" not in value:
+		return "'%s'" % value
+	return '"%s"' % value.replace('"', "&quot;")
+
 
+def get_indexer(indexes_lang):
+	"""
 	:param indexes_lang: str
 	"""
-	indexer = None
+	if not indexes_lang:
+		return
+	from . import indexes as idxs
+	indexer = idxs.languages.get(indexes_lang, None)
 	"""Callable[[Sequence[str], str], Sequence[str]]"""
-	if indexes_lang:
-		from . import indexes as idxs
-		indexer = idxs.languages.get(indexes_lang, None)
-		if not indexer:
-			msg = "extended indexes not supported for the specified language: %s.\n"\
-				  "following languages avaible: %s." %\
-				  (indexes_lang, ", ".join(list(idxs.languages.keys())))
-			log.error(msg)
-			raise ValueError(msg)
-
-	def generate_indexes(title, alts, content, BeautifulSoup):
-		indexes = [title]
-		indexes.extend(alts)
-
-		if BeautifulSoup:
-			quoted_title = BeautifulSoup.dammit.EntitySubstitution.substitute_xml(title, True)
-		else:
-			quoted_title = '"%s"' % title.replace(">", "&gt;").replace('"', "&quot;")
-
-		if indexer:
-			indexes = set(indexer(indexes, content))
-
-		normal_indexes = set()
-		for idx in indexes:
-			normal = _normalize.title(idx, BeautifulSoup)
-			normal_indexes.add(_normalize.title_long(normal))
-			normal_indexes.add(_normalize.title_short(normal))
-		normal_indexes.discard(title)
-
-		normal_indexes = [s for s in normal_indexes if s.strip()]
-		# skip empty titles.  everything could happen.
-
-		s = "<d:index d:value=%s d:title=%s/>" % (quoted_title, quoted_title)
-		if BeautifulSoup:
-			for idx in normal_indexes:
-				s += "<d:index d:value=%s d:title=%s/>" % (
-					BeautifulSoup.dammit.EntitySubstitution.substitute_xml(idx, True),
-					quoted_title)
-		else:
-			for idx in normal_indexes:
-				s += '<d:index d:value="%s" d:title=%s/>' % (
-					idx.replace(">", "&gt;").replace('"', "&quot;"),
-					quoted_title)
-		return s
-	return generate_indexes
+	if not indexer:
+		msg = "extended indexes not supported for the specified language: %s.\n"\
+			  "following languages avaible: %s." %\
+			  (indexes_lang, ", ".join(list(idxs.languages.keys())))
+		log.error(msg)
+		raise ValueError(msg)
+	return indexer
 
 
 close_tag = re.compile("<(BR|HR)>", re.IGNORECASE)
@@ -251,3 +229,269 @@ def format_clean_content(title, body, BeautifulSoup):
 	return content
 
 
+# tags that BeautifulSoup writes as <tag/> when they are empty
+html_void_tags = frozenset([
+	"area", "base", "basefont", "bgsound", "br", "col", "command",
+	"embed", "frame", "hr", "image", "img", "input", "isindex", "keygen",
+	"link", "menuitem", "meta", "nextid", "param", "source", "spacer",
+	"track", "wbr",
+])
+
+
+def escape_text(text):
+	return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def add_class(attrib, name):
+	attrib["class"] = " ".join(attrib.get("class", "").split() + [name])
+
+
+def clean_tag_lxml(tag):
+	"""
+	applies changes of BeautifulSoup branch of `format_clean_content`
+	to lxml element `tag`
+	"""
+	attrib = tag.attrib
+	if "class" in attrib:
+		classes = attrib["class"].split()
+		if "sec" in classes:
+			classes.remove("sec")
+			if classes:
+				attrib["class"] = " ".join(classes)
+			else:
+				del attrib["class"]
+			attrib["d:priority"] = "2"
+	if "color:steelblue" in attrib.get("style", ""):
+		remove_style(attrib, "color:steelblue")
+		if "ex" not in attrib.get("class", "").split():
+			add_class(attrib, "ex")
+	if "color:green" in attrib.get("style", ""):
+		remove_style(attrib, "color:green")
+		if "p" not in attrib.get("class", "").split():
+			add_class(attrib, "c")
+	if "style" in attrib:
+		m = margin_re.search(attrib["style"])
+		if m:
+			remove_style(attrib, m.group(0))
+			add_class(attrib, "m" + m.group(1))
+	if "href" in attrib:
+		href = attrib["href"]
+		if href.startswith("bword://"):
+			href = href[len("bword://"):]
+		if not (href.startswith("http:") or href.startswith("https:")):
+			attrib["href"] = "x-dictionary:d:%s" % href
+	if tag.tag == "u":
+		tag.tag = "span"
+		add_class(attrib, "u")
+	elif tag.tag == "s":
+		tag.tag = "del"
+
+
+def serialize_lxml(elem, parts):
+	"""
+	appends xhtml of lxml element `elem` (and its tail) to `parts`,
+	in the way BeautifulSoup writes tags
+	"""
+	tag = elem.tag
+	if isinstance(tag, str):
+		parts.append("<" + tag)
+		# BeautifulSoup sorts attributes by name
+		for key, value in sorted(elem.attrib.items()):
+			parts.append(" %s=%s" % (key, quote_attr(value)))
+		if tag in html_void_tags and not (elem.text or len(elem)):
+			parts.append("/>")
+		else:
+			parts.append(">")
+			if elem.text:
+				parts.append(escape_text(elem.text))
+			for child in elem:
+				serialize_lxml(child, parts)
+			parts.append("</%s>" % tag)
+	elif tag.__name__ == "Comment":
+		# tag of comments (and other special nodes) is a factory function
+		parts.append("<!--%s-->" % elem.text)
+	if elem.tail:
+		parts.append(escape_text(elem.tail))
+
+
+def format_clean_content_lxml(title, body):
+	"""
+	same as `format_clean_content(title, body, BeautifulSoup)`,
+	but using lxml.html parser and tree, which is much faster
+
+	:param title: str | None
+	"""
+	from lxml import etree, html
+	try:
+		root = html.fragment_fromstring(body, create_parent="div")
+	except etree.ParserError:
+		root = html.Element("div")
+	for tag in root.iterdescendants(etree.Element):
+		clean_tag_lxml(tag)
+	if title:
+		h1 = html.Element("h1")
+		h1.text = title
+		h1.tail = root.text
+		root.text = None
+		root.insert(0, h1)
+	parts = []
+	if root.text:
+		parts.append(escape_text(root.text))
+	for child in root:
+		serialize_lxml(child, parts)
+	content = "".join(parts)
+	content = content.replace("&nbsp;", "&#160;")
+	content = nonprintable.sub("", content)
+	return content
+
+
+class EntryFormatter(object):
+	"""
+	normalizes titles, cleans content and generates indexes of entries
+
+	every entry is formatted independently, so entries can be formatted
+	in worker processes, see `init_format_worker` and `format_entry_batch`
+	"""
+	def __init__(self, cleaner, indexes_lang, indexes_cache=None):
+		"""
+		:param cleaner: "bs4", "lxml", or "" (only some replacements)
+		:param indexes_lang: str or None
+		:param indexes_cache: path of index expansions cache file, or None
+		"""
+		self._BeautifulSoup = get_beautiful_soup() if cleaner == "bs4" else None
+		self._lxml = cleaner == "lxml"
+		self._indexer = get_indexer(indexes_lang)
+		self._cache = None
+		if self._indexer:
+			from . import indexes as idxs
+			self._cache = idxs.cache
+			if indexes_cache:
+				self._cache.open(indexes_cache)
+
+	def flush_cache(self):
+		"""
+		returns and resets (hits, disk hits, misses) of index expansions
+		"""
+		if self._cache is None:
+			return (0, 0, 0)
+		return self._cache.flush()
+
+	def close(self):
+		if self._cache is not None:
+			self._cache.close()
+			self._cache = None
+
+	def normalize_title(self, title):
+		if self._lxml:
+			return _normalize.title_lxml(title)
+		return _normalize.title(title, self._BeautifulSoup)
+
+	def quote_title(self, title):
+		if self._BeautifulSoup or self._lxml:
+			return quote_attr(title)
+		return '"%s"' % title.replace(">", "&gt;").replace('"', "&quot;")
+
+	def clean_content(self, title, body):
+		if self._lxml:
+			return format_clean_content_lxml(title, body)
+		return format_clean_content(title, body, self._BeautifulSoup)
+
+	def generate_indexes(self, title, alts, content):
+		indexes = [title]
+		indexes.extend(alts)
+
+		quoted_title = self.quote_title(title)
+
+		if self._indexer:
+			indexes = set(self._indexer(indexes, content))
+
+		normal_indexes = set()
+		for idx in indexes:
+			normal = self.normalize_title(idx)
+			normal_indexes.add(_normalize.title_long(normal))
+			normal_indexes.add(_normalize.title_short(normal))
+		normal_indexes.discard(title)
+
+		normal_indexes = [s for s in normal_indexes if s.strip()]
+		# skip empty titles.  everything could happen.
+
+		s = "<d:index d:value=%s d:title=%s/>" % (quoted_title, quoted_title)
+		for idx in normal_indexes:
+			s += "<d:index d:value=%s d:title=%s/>" % (
+				self.quote_title(idx),
+				quoted_title,
+			)
+		return s
+
+	def format_entry(self, words, defi, xdxf_html=None):
+		"""
+		:param words: list of str
+		:param xdxf_html: html of xdxf definition, or None
+		:return: (title attribute, xml of indexes and content),
+			or None if entry must be skipped
+		"""
+		word, alts = words[0], words[1:]
+		long_title = _normalize.title_long(self.normalize_title(word))
+		if not long_title:
+			return
+
+		if self._BeautifulSoup or self._lxml:
+			title_attr = quote_attr(long_title)
+		else:
+			title_attr = str(long_title)
+
+		content_title = long_title
+		if xdxf_html is not None:
+			defi = toStr(xdxf_html)
+			content_title = None
+		content = self.clean_content(content_title, defi)
+
+		return title_attr, self.generate_indexes(long_title, alts, content) + content
+
+	def format_batch(self, items):
+		"""
+		:param items: list of (words, defi, defiFormat)
+		:return: list of results of `format_entry`
+
+		xdxf definitions of the batch are transformed together,
+		make sure to call `xdxf.xdxf_init()` first
+		"""
+		xdxf_htmls = iter(xdxf.xdxf_to_html_batch([
+			defi for _, defi, defiFormat in items
+			if defiFormat == "x"
+		]))
+		return [
+			self.format_entry(
+				words,
+				defi,
+				next(xdxf_htmls) if defiFormat == "x" else None,
+			)
+			for words, defi, defiFormat in items
+		]
+
+
+_worker_formatter = None
+_worker_init_error = None
+
+
+def init_format_worker(cleaner, indexes_lang, indexes_cache):
+	"""
+	errors are raised by `format_entry_batch`, because if a pool
+	initializer fails, pool starts new workers forever
+	"""
+	global _worker_formatter, _worker_init_error
+	try:
+		xdxf.xdxf_init()
+		_worker_formatter = EntryFormatter(cleaner, indexes_lang, indexes_cache)
+	except Exception as e:
+		_worker_init_error = e
+
+
+def format_entry_batch(items):
+	"""
+	returns (results, index expansion cache stats)
+	"""
+	if _worker_init_error is not None:
+		raise _worker_init_error
+	results = _worker_formatter.format_batch(items)
+	return results, _worker_formatter.flush_cache()
@@ -138,3 +138,28 @@ def title_short(s):
 	title_short("str[ing]") -> "str"
 	"""
 	return spaces(_title_short_re.sub("", s))
+
+
+def title_lxml(title):
+	"""
+	same as `title(title, BeautifulSoup)`, but using lxml.html parser
+	"""
+	from lxml import etree, html
+	title = title.replace("\xef\xbb\xbf", "")
+	if len(title) > 1:
+		try:
+			root = html.fragment_fromstring(title, create_parent="div")
+		except etree.ParserError:
+			title = ""
+		else:
+			etree.strip_elements(
+				root,
+				"script",
+				"style",
+				etree.Comment,
+				with_tail=False,
+			)
+			title = "".join(text.strip() for text in root.itertext())
+	title = brackets(title)
+	title = truncate(title, 1126)
+	return title
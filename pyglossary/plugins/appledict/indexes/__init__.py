@@ -20,10 +20,101 @@ extended indexes generation with respect to source language.
 
 import os
 import pkgutil
+import json
+from collections import OrderedDict as odict
 
 from pyglossary.plugins.formats_common import log
 
-__all__ = ["languages", "log"]
+__all__ = ["languages", "log", "cache"]
+
+
+class ExpansionCache(object):
+	"""
+	LRU cache of index expansions, keyed by language and key (a title,
+	or anything else that the expansion only depends on)
+
+	if a cache file is opened, expansions are also kept in an SQLite
+	database, so they are reused between runs, and by worker processes
+	"""
+	def __init__(self, maxSize=100000):
+		self._maxSize = maxSize
+		self._lru = odict()  # (lang, key) => tuple of str
+		self._con = None
+		self._pendingCount = 0  # number of uncommitted rows
+		self.hits = 0
+		self.diskHits = 0
+		self.misses = 0
+
+	def open(self, filename):
+		import sqlite3
+		self._con = sqlite3.connect(filename, timeout=60)
+		self._con.execute(
+			"CREATE TABLE IF NOT EXISTS expansion ("
+			"lang TEXT, key TEXT, value TEXT, "
+			"PRIMARY KEY (lang, key)"
+			") WITHOUT ROWID"
+		)
+		self._con.commit()
+
+	def get(self, lang, key, expand):
+		"""
+		returns expand(key) as a tuple, from cache if possible
+		"""
+		lru = self._lru
+		ckey = (lang, key)
+		try:
+			value = lru[ckey]
+		except KeyError:
+			pass
+		else:
+			lru.move_to_end(ckey)
+			self.hits += 1
+			return value
+		value = None
+		if self._con is not None:
+			row = self._con.execute(
+				"SELECT value FROM expansion WHERE lang=? AND key=?",
+				(lang, key),
+			).fetchone()
+			if row is not None:
+				value = tuple(json.loads(row[0]))
+				self.diskHits += 1
+		if value is None:
+			value = tuple(expand(key))
+			self.misses += 1
+			if self._con is not None:
+				self._con.execute(
+					"INSERT OR IGNORE INTO expansion VALUES (?, ?, ?)",
+					(lang, key, json.dumps(value, ensure_ascii=False)),
+				)
+				self._pendingCount += 1
+		lru[ckey] = value
+		if len(lru) > self._maxSize:
+			lru.popitem(last=False)
+		return value
+
+	def flush(self):
+		"""
+		commits new expansions to cache file
+		returns and resets (hits, diskHits, misses) counters
+		"""
+		if self._con is not None and self._pendingCount:
+			self._con.commit()
+			self._pendingCount = 0
+		stats = (self.hits, self.diskHits, self.misses)
+		self.hits = self.diskHits = self.misses = 0
+		return stats
+
+	def close(self):
+		self.flush()
+		if self._con is not None:
+			self._con.close()
+			self._con = None
+		self._lru.clear()
+
+
+# shared by all language indexers
+cache = ExpansionCache()
 
 languages = {}
 """
@@ -37,9 +128,12 @@ function must follow signature bellow:
 	:param content: cleaned entry content
 	:return: iterable of indexes (str).
 
+indexers can use `cache.get(lang, key, expand)` for expensive
+expansions, for example all forms of a word.
+
 use
 ```
-	from . import languages
+	from . import languages, cache
 	# or
 	from appledict.indexes import languages
 ```
@@ -50,7 +144,7 @@ here = os.path.dirname(os.path.abspath(__file__))
 for _, module, _ in pkgutil.iter_modules([here]):
 	try:
 		__import__("%s.%s" % (__name__, module))
-	except ImportError:
+	except Exception:
 		log.exception(
 			"error while importing indexes plugin %s" % module
 		)
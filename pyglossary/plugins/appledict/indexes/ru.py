@@ -18,7 +18,7 @@
 Russian indexes based on pymorphy.
 """
 
-from . import languages
+from . import languages, cache
 from pyglossary.plugins.formats_common import log
 
 try:
@@ -64,24 +64,26 @@ def _ru(title, a, a_norm):
 	# decline only one-word titles
 	if len(title.split()) == 1:
 
-		normal_forms = morphy.parse(title)
+		for word in cache.get("ru", title, lexeme_words):
+			# Apple Dictionary Services see no difference between
+			# "й" and "и", "ё" and "е", so we're trying to avoid
+			# "* Duplicate index. Skipped..." warning.
+			# new: return indexes with original letters but check for
+			# occurence against "normal forms".
+			word_norm = normalize(word)
+			if word_norm not in a_norm:
+				a.add(word)
+				a_norm.add(word_norm)
 
-		if len(normal_forms) > 0:
 
-			# forms of most probable match
-			normal_form = normal_forms[0]
-
-			for x in normal_form.lexeme:
-				word = x.word
-				# Apple Dictionary Services see no difference between
-				# "й" and "и", "ё" and "е", so we're trying to avoid
-				# "* Duplicate index. Skipped..." warning.
-				# new: return indexes with original letters but check for
-				# occurence against "normal forms".
-				word_norm = normalize(word)
-				if word_norm not in a_norm:
-					a.add(word)
-					a_norm.add(word_norm)
+def lexeme_words(title):
+	"""
+	returns all forms of one-word title, using its most probable match
+	"""
+	normal_forms = morphy.parse(title)
+	if not normal_forms:
+		return ()
+	return [x.word for x in normal_forms[0].lexeme]
 
 
 def normalize(word):
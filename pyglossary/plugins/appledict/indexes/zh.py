@@ -23,7 +23,7 @@ import re
 import bs4
 import colorize_pinyin as color
 
-from . import languages, log
+from . import languages, log, cache
 
 
 def zh(titles, content):
@@ -61,6 +61,10 @@ def pinyin_indexes(content):
 	if not pinyin or pinyin == "_":
 		return ()
 
+	return cache.get("zh", pinyin, pinyin_string_indexes)
+
+
+def pinyin_string_indexes(pinyin):
 	indexes = set()
 
 	# multiple pronunciations
@@ -0,0 +1,224 @@
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from importlib import import_module
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from pyglossary.tests_common import getPlugin
+from pyglossary.glossary import Glossary
+
+appledict = getPlugin("AppleDict")
+_dict = sys.modules[appledict.EntryFormatter.__module__]
+indexes = import_module(appledict.__name__ + ".indexes")
+_normalize = import_module(appledict.__name__ + "._normalize")
+
+# (title, body) of definitions that are cleaned the same way by
+# BeautifulSoup and lxml cleaners
+cleanerCases = [
+	(None, '<div class="sec">a</div>'),
+	(None, '<div class="sec ex">a</div>'),
+	(None, '<span class="ex" style="color:steelblue">x</span>'),
+	(None, '<span style="color:steelblue;font-weight:bold">x</span>'),
+	(None, '<span style="color:steelblue" id="q">x</span>'),
+	(None, '<i class="p" style="color:green">n</i>'),
+	(None, '<i style="color:green">c</i>'),
+	(None, '<i class="p" style="color:green;margin-left:1em">x</i>'),
+	(None, '<div style="margin-left:2em">m</div>'),
+	(None, '<span style="font-weight:bold;margin-left:2em" id="q">x</span>'),
+	(None, '<div class="ex" style="margin-left:1em;color:steelblue">m</div>'),
+	(None, '<span class="sec" style="margin-left:3em;color:green">x</span>'),
+	(None, (
+		'<a href="bword://word">w</a> '
+		'<a href="http://x.org/?a=1&amp;b=2">h</a> '
+		'<a href="https://y">s</a> <a href="other">o</a>'
+	)),
+	(None, '<u>under</u> and <s>struck</s>'),
+	(None, 'line<br>two<hr><img src="a.png"><br/>x<br>y</br>'),
+	(None, '<div><img src="a"></img></div>'),
+	(None, '<p>unclosed <b>bold'),
+	(None, 'a & b < c, a<!--comment-->b'),
+	(None, '<p>\u00e9 &#160; &eacute; &nbsp;</p>'),
+	("Title", 'body <b>bold</b> &amp; &lt;tag&gt;'),
+	('T & "q"', '<p title="a &quot;b&quot; &amp; c">x</p>'),
+	(None, 'plain text'),
+	(None, ''),
+]
+
+titleCases = [
+	"word",
+	"<b>bold</b> word",
+	"a &amp; b",
+	"x",
+	"  spaced  <i>i</i> ",
+	"<script>x</script>y",
+	"w<!--c-->x",
+]
+
+
+def testIndexer():
+	"""
+	registers indexer of language "test", which adds upper case titles
+	"""
+	def indexer(titles, content):
+		return [
+			index
+			for title in titles
+			for index in indexes.cache.get(
+				"test",
+				title,
+				lambda title: (title, title.upper()),
+			)
+		]
+	return mock.patch.dict(indexes.languages, {"test": indexer})
+
+
+class AppleDictWorkersTest(unittest.TestCase):
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def newGlossary(self, count=500):
+		glos = Glossary()
+		for index in range(count):
+			glos.addEntry("word%d" % index, "definition %d" % index)
+		return glos
+
+	def assertFailsBeforePool(self, **options):
+		"""
+		configuration errors must be raised in main process, before
+		starting worker processes (and not hang the writer)
+		"""
+		for workers in (0, 2):
+			with mock.patch.object(
+				appledict,
+				"newProcessPool",
+				wraps=appledict.newProcessPool,
+			) as newProcessPool:
+				self.assertFalse(self.newGlossary().write(
+					join(self.tmpDir, "out%d" % workers),
+					appledict.format,
+					workers=workers,
+					**options
+				))
+			newProcessPool.assert_not_called()
+
+	def test_invalid_indexes(self):
+		self.assertFailsBeforePool(indexes="xx")
+
+	def test_worker_init_error(self):
+		def failingFormatter(*args):
+			raise RuntimeError("worker init failed")
+
+		# the formatter of main process is created, but not of workers
+		with mock.patch.object(_dict, "EntryFormatter", failingFormatter):
+			self.assertFalse(self.newGlossary().write(
+				join(self.tmpDir, "out"),
+				appledict.format,
+				workers=2,
+			))
+
+	def test_invalid_indexes_cache(self):
+		with testIndexer():
+			self.assertFailsBeforePool(
+				indexes="test",
+				indexesCache=join(self.tmpDir, "missing", "cache.db"),
+			)
+
+	def test_indexes_cache(self):
+		import sqlite3
+		cachePath = join(self.tmpDir, "cache.db")
+		with testIndexer():
+			self.assertTrue(self.newGlossary().write(
+				join(self.tmpDir, "out"),
+				appledict.format,
+				indexes="test",
+				indexesCache=cachePath,
+				workers=2,
+			))
+		con = sqlite3.connect(cachePath)
+		count, = con.execute("SELECT count(*) FROM expansion").fetchone()
+		con.close()
+		self.assertEqual(count, 500)
+
+	def writeXml(self, glos, name, **options):
+		self.assertTrue(glos.write(
+			join(self.tmpDir, name),
+			appledict.format,
+			**options
+		))
+		with open(join(self.tmpDir, name, name + ".xml"), "rb") as fp:
+			return fp.read()
+
+	def test_workers_output(self):
+		cleanHTMLs = ["", "lxml"]
+		if _dict.get_beautiful_soup():
+			cleanHTMLs.append("yes")
+		for cleanHTML in cleanHTMLs:
+			outputs = []
+			for workers in (0, 3):
+				glos = Glossary()
+				for index in range(300):
+					title, body = cleanerCases[index % len(cleanerCases)]
+					glos.addEntry(["word%d" % index, "alt%d" % index], body)
+					glos.addEntry(
+						"xdxf%d" % index,
+						"<k>xdxf%d</k>definition <b>%d</b>" % (index, index),
+						defiFormat="x",
+					)
+				with mock.patch.object(appledict, "formatBatchSize", 10):
+					outputs.append(self.writeXml(
+						glos,
+						"out_%s_%s" % (cleanHTML, workers),
+						cleanHTML=cleanHTML,
+						workers=workers,
+					))
+			self.assertIn(b"<b>299</b>", outputs[0])
+			self.assertEqual(outputs[0], outputs[1])
+
+
+class CleanerTest(unittest.TestCase):
+	"""
+	lxml cleaner must give the same xhtml as BeautifulSoup cleaner
+	"""
+	def setUp(self):
+		self.BeautifulSoup = _dict.get_beautiful_soup()
+		if not self.BeautifulSoup:
+			self.skipTest("BeautifulSoup is not installed")
+
+	def test_content(self):
+		for title, body in cleanerCases:
+			self.assertEqual(
+				_dict.format_clean_content_lxml(title, body),
+				_dict.format_clean_content(title, body, self.BeautifulSoup),
+				body,
+			)
+
+	def test_leading_comment(self):
+		# BeautifulSoup drops a comment at the start of definition
+		body = "<!--comment-->text"
+		self.assertEqual(
+			_dict.format_clean_content(None, body, self.BeautifulSoup),
+			"text",
+		)
+		self.assertEqual(
+			_dict.format_clean_content_lxml(None, body),
+			body,
+		)
+
+	def test_title(self):
+		for title in titleCases:
+			self.assertEqual(
+				_normalize.title_lxml(title),
+				_normalize.title(title, self.BeautifulSoup),
+				title,
+			)
+
+
+if __name__ == "__main__":
+	unittest.main()
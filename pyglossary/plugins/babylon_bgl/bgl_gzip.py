@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright © 2008-2016 Saeed Rasooli <saeed.gnu@gmail.com> (ilius)
+# This file is part of PyGlossary project, http://github.com/ilius/pyglossary
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program. Or on Debian systems, from /usr/share/common-licenses/GPL
+# If not, see <http://www.gnu.org/licenses/gpl.txt>.
+
+import os
+import zlib
+
+import logging
+log = logging.getLogger("root")
+
+FTEXT, FHCRC, FEXTRA, FNAME, FCOMMENT = 1, 2, 4, 8, 16
+
+
+class BglGzipStream(object):
+	"""
+	Reads the gzip stream inside a BGL file, which starts at `offset`,
+	and parses BGL blocks from it.
+
+	Compressed data is decompressed with zlib in large chunks, and block
+	headers and payloads are parsed from a memoryview over decompressed
+	buffer, instead of a few small read() calls per block.
+
+	CRC of gzip members is not checked, some dictionaries do not use it
+	and set it to 0.
+	"""
+	chunkSize = 1024 * 1024  # size of compressed chunks, in bytes
+
+	def __init__(self, filename, offset=0):
+		self._filename = filename
+		self._offset = offset  # offset of gzip header in file
+		self._file = open(filename, "rb")
+		self._fileSize = os.path.getsize(filename)
+		self._start()
+
+	def _start(self):
+		self._file.seek(self._offset)
+		self._raw = b""  # compressed data that is read but not used yet
+		self._buf = b""  # decompressed data
+		self._view = memoryview(self._buf)
+		self._pos = 0  # position in self._buf
+		self._bufOffset = 0  # position of self._buf in decompressed stream
+		self._decomp = None
+		self._eof = False
+		if not self._startMember():
+			raise ValueError(
+				"invalid gzip header at %s in %r" % (
+					self._offset,
+					self._filename,
+				)
+			)
+
+	def _readRaw(self, size):
+		if len(self._raw) < size:
+			self._raw += self._file.read(max(size, self.chunkSize))
+		data = self._raw[:size]
+		self._raw = self._raw[size:]
+		return data
+
+	def _skipRawString(self):
+		while True:
+			b = self._readRaw(1)
+			if b in (b"\x00", b""):
+				return
+
+	def _startMember(self):
+		"""
+		parses header of a gzip member
+		returns False if there is no more gzip member
+		"""
+		header = self._readRaw(10)
+		if len(header) < 10 or header[:2] != b"\x1f\x8b":
+			return False
+		if header[2] != 8:
+			log.error("unknown gzip compression method %s" % header[2])
+			return False
+		flags = header[3]
+		if flags & FEXTRA:
+			extraLen = int.from_bytes(self._readRaw(2), "little")
+			self._readRaw(extraLen)
+		if flags & FNAME:
+			self._skipRawString()
+		if flags & FCOMMENT:
+			self._skipRawString()
+		if flags & FHCRC:
+			self._readRaw(2)
+		self._decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+		return True
+
+	def _decompressChunk(self):
+		"""
+		returns decompressed bytes of the next chunk,
+		or None if end of stream is reached
+		"""
+		while not self._eof:
+			decomp = self._decomp
+			if decomp.eof:
+				# skip CRC32 and ISIZE, and start the next member, if any
+				self._raw = decomp.unused_data + self._raw
+				self._readRaw(8)
+				if not self._startMember():
+					self._eof = True
+					return
+				continue
+			raw = self._raw or self._file.read(self.chunkSize)
+			self._raw = b""
+			if not raw:
+				log.warning(
+					"BGL: gzip stream is truncated in %r" % self._filename
+				)
+				self._eof = True
+				return
+			try:
+				data = decomp.decompress(raw)
+			except zlib.error as e:
+				log.error("BGL: error in gzip stream: %s" % e)
+				self._eof = True
+				return
+			if data:
+				return data
+
+	def _fill(self, size):
+		"""
+		makes sure `size` bytes are available from self._pos
+		returns False if stream ends before that
+		"""
+		while len(self._buf) - self._pos < size:
+			data = self._decompressChunk()
+			if data is None:
+				return False
+			self._view.release()
+			self._bufOffset += self._pos
+			self._buf = self._buf[self._pos:] + data
+			self._view = memoryview(self._buf)
+			self._pos = 0
+		return True
+
+	def tell(self):
+		"""
+		returns position in decompressed stream
+		"""
+		return self._bufOffset + self._pos
+
+	def compressedTell(self):
+		"""
+		returns the number of compressed bytes consumed
+		"""
+		return self._file.tell() - len(self._raw) - self._offset
+
+	def compressedSize(self):
+		return self._fileSize - self._offset
+
+	def read(self, size):
+		self._fill(size)
+		data = bytes(self._view[self._pos:self._pos + size])
+		self._pos += len(data)
+		return data
+
+	def readBlock(self):
+		"""
+		returns (blockType, data) of the next block, or None at the end
+
+		first byte of block: type in low 4 bits, and length code in high
+		4 bits: if length code < 4, the length is in the next
+		(length code + 1) bytes (big endian), otherwise length is
+		(length code - 4)
+		"""
+		if not self._fill(1):
+			return
+		view = self._view
+		pos = self._pos
+		head = view[pos]
+		blockType = head & 0xf
+		lengthCode = head >> 4
+		if lengthCode < 4:
+			headerSize = lengthCode + 2
+			if not self._fill(headerSize):
+				log.error("BGL: block header is truncated")
+				self._pos = len(self._buf)
+				return
+			view = self._view
+			pos = self._pos
+			length = int.from_bytes(view[pos+1:pos+headerSize], "big")
+		else:
+			headerSize = 1
+			length = lengthCode - 4
+		if not self._fill(headerSize + length):
+			log.error("BGL: block data is truncated")
+		view = self._view
+		pos = self._pos + headerSize
+		data = bytes(view[pos:pos+length])
+		self._pos = pos + len(data)
+		return blockType, data
+
+	def seek(self, pos):
+		"""
+		seeking backward restarts decompression from the beginning,
+		seeking forward decompresses (and drops) data until `pos`
+		"""
+		if pos < self.tell():
+			self._view.release()
+			self._start()
+		while True:
+			skip = pos - self.tell()
+			if skip <= len(self._buf) - self._pos:
+				self._pos += skip
+				return
+			self._pos = len(self._buf)
+			if not self._fill(1):
+				return
+
+	def flush(self):
+		pass
+
+	def close(self):
+		if self._file:
+			self._file.close()
+			self._file = None
+		self._view.release()
@@ -20,24 +20,10 @@
 # with this program. Or on Debian systems, from /usr/share/common-licenses/GPL
 # If not, see <http://www.gnu.org/licenses/gpl.txt>.
 
-import io
-import gzip
 import re
 from collections import OrderedDict as odict
 
 from pyglossary.plugins.formats_common import *  # FIXME
-try:
-	GzipFile = __import__(
-		"pyglossary.plugin_lib.py%d%d.gzip_no_crc" % sys.version_info[:2],
-		fromlist="GzipFile",
-	).GzipFile
-except ImportError:
-	from gzip import GzipFile
-	log.exception("")
-	log.warning(
-		"If things didn\'t work well with BGL files, "
-		"install Python 3.5 and try again"
-	)
 
 from pyglossary.text_utils import (
 	binStrToInt,
@@ -46,6 +32,11 @@ from pyglossary.text_utils import (
 )
 
 from pyglossary.xml_utils import xml_escape
+from pyglossary.plugin_lib.process_pool import (
+	processWorkers,
+	newProcessPool,
+	orderedApply,
+)
 
 from .bgl_info import (
 	infoKeysByCode,
@@ -53,6 +44,7 @@ from .bgl_info import (
 	charsetInfoDecode,
 )
 from .bgl_pos import partOfSpeechByCode
+from .bgl_gzip import BglGzipStream
 from .bgl_text import (
 	replaceHtmlEntries,
 	replaceHtmlEntriesInKeys,
@@ -66,8 +58,6 @@ from .bgl_text import (
 	unkownHtmlEntries,
 )
 
-file = io.BufferedReader
-
 debugReadOptions = {
 	"searchCharSamples",  # bool
 	"collectMetadata2",  # bool
@@ -87,6 +77,8 @@ readOptions = [
 	"strictStringConvertion",  # bool
 	"processHtmlInKey",  # bool
 	"keyRStripChars",  # str, list of characters to strip (from right side)
+	"fullPrescan",  # bool, read all blocks in open() to count entries
+	"workers",  # int, number of processes to decode entries, 0 to disable
 ] + sorted(debugReadOptions)
 
 
@@ -106,26 +98,32 @@ charsetDecodePattern = re.compile(
 )
 
 
-class BGLGzipFile(GzipFile):
-	"""
-	gzip_no_crc.py contains GzipFile class without CRC check.
+# BglReader instance of decoding worker process, see decodeEntryBlocks
+_workerReader = None
 
-	It prints a warning when CRC code does not match.
-	The original method raises an exception in this case.
-	Some dictionaries do not use CRC code, it is set to 0.
+
+def initDecodeWorker(state):
 	"""
-	def __init__(
-		self,
-		fileobj=None,
-		closeFileobj=False,
-		**kwargs
-	):
-		GzipFile.__init__(self, fileobj=fileobj, **kwargs)
-		self.closeFileobj = closeFileobj
+	initializer of decoding worker processes
+	state: dict of BglReader attributes that are used in decoding
+	"""
+	global _workerReader
+	_workerReader = BglReader(None)
+	for key, value in state.items():
+		setattr(_workerReader, key, value)
 
-	def close(self):
-		if self.closeFileobj:
-			self.fileobj.close()
+
+def decodeEntryBlocks(rawBlocks):
+	"""
+	runs in decoding worker processes
+	rawBlocks: list of (type, data, offset) of entry blocks
+	returns a list of (words, defi) tuples, or None for invalid blocks
+	"""
+	block = Block()
+	results = []
+	for block.type, block.data, block.offset in rawBlocks:
+		results.append(_workerReader.decodeEntryBlock(block))
+	return results
 
 
 class Block(object):
@@ -143,51 +141,6 @@ class Block(object):
 		)
 
 
-class FileOffS(file):
-	"""
-	A file class with an offset.
-
-	This class provides an interface to a part of a file starting at specified
-	offset and ending at the end of the file, making it appear an independent
-	file. offset parameter of the constructor specifies the offset of the first
-	byte of the modeled file.
-	"""
-	def __init__(self, filename, offset=0):
-		fp = open(filename, "rb")
-		file.__init__(self, fp)
-		self._fp = fp
-		self.offset = offset
-		self.filesize = os.path.getsize(filename)
-		file.seek(self, offset)  # OR self.seek(0)
-
-	def close(self):
-		self._fp.close()
-
-	def seek(self, pos, whence=0):  # position, whence
-		if whence == 0:  # relative to start of file
-			file.seek(
-				self,
-				max(0, pos) + self.offset,
-				0,
-			)
-		elif whence == 1:  # relative to current position
-			file.seek(
-				self,
-				max(
-					self.offset,
-					self.tell() + pos,
-				),
-				0
-			)
-		elif whence == 2:  # relative to end of file
-			file.seek(self, pos, 2)
-		else:
-			raise ValueError("FileOffS.seek: bad whence=%s" % whence)
-
-	def tell(self):
-		return file.tell(self) - self.offset
-
-
 class DefinitionFields(object):
 	"""
 		Fields of entry definition
@@ -238,6 +191,8 @@ class DefinitionFields(object):
 
 
 class BglReader(object):
+	# number of entry blocks that are sent to a decoding worker at once
+	decodeBatchSize = 200
 
 	##########################################################################
 	"""
@@ -284,6 +239,8 @@ class BglReader(object):
 		self.targetEncoding = None
 		####
 		self.bgl_numEntries = None
+		self.numResources = None
+		self.numBlocks = 0
 		self.wordLenMax = 0
 		self.defiMaxBytes = 0
 		##
@@ -296,6 +253,14 @@ class BglReader(object):
 		self.specialCharPattern = re.compile(r"[^\s\w.]", re.U)
 		###
 		self.file = None
+		# number of decoding worker processes, 0 means no worker
+		self.workers = 0
+		self._parallelGen = None
+		# the first entry or resource block, that is read by readInfo
+		# and not processed yet
+		self._pendingBlock = None
+		# offset of the last block that is processed by __next__
+		self._lastBlockOffset = None
 		# offset of gzip header, set in self.open()
 		self.gzipOffset = None
 		# must be a in RRGGBB format
@@ -303,10 +268,37 @@ class BglReader(object):
 		self.iconData = None
 
 	def __len__(self):
+		if self.numEntries is not None:
+			return self.numEntries + self.numResources
+		# without fullPrescan, we only have bgl_numEntries from
+		# glossary info, which is close to the number of entries
+		if self.bgl_numEntries:
+			return self.bgl_numEntries
+		log.warning("len(reader) called while numEntries=None")
+		return 0
+
+	def knownStats(self):
+		"""
+		statistics that are known from readInfo, only with fullPrescan
+		"""
 		if self.numEntries is None:
-			log.warning("len(reader) called while numEntries=None")
-			return 0
-		return self.numEntries + self.numResources
+			return
+		return {
+			"entryCount": self.numEntries,
+			"resourceCount": self.numResources,
+			"multiDefiCount": 0,
+		}
+
+	def progressFraction(self):
+		"""
+		returns the fraction of compressed input bytes consumed so far
+		"""
+		if not isinstance(self.file, BglGzipStream):
+			return 0.0
+		size = self.file.compressedSize()
+		if size <= 0:
+			return 0.0
+		return self.file.compressedTell() / size
 
 	# open .bgl file, read signature, find and open gzipped content
 	# self.file - ungzipped content
@@ -332,6 +324,14 @@ class BglReader(object):
 		# a string of characters that will be stripped from the end of the
 		# key (and alternate), see str.rstrip function
 		keyRStripChars=None,
+		# read all blocks in open() to count entries and resources,
+		# and to collect metadata blocks that come after entries (if any)
+		# that means the whole gzip stream is decompressed twice
+		fullPrescan=False,
+		# number of processes that decode entries (charset tags, html,
+		# definition fields), while main process reads blocks
+		# 0 (or 1) means decoding in main process
+		workers=0,
 		**kwargs
 	):
 		if kwargs:
@@ -357,6 +357,8 @@ class BglReader(object):
 		self.strictStringConvertion = strictStringConvertion
 		self.processHtmlInKey = processHtmlInKey
 		self.keyRStripChars = keyRStripChars
+		self.fullPrescan = fullPrescan
+		self.workers = processWorkers(int(workers))
 
 		if not self.openGzip():
 			return False
@@ -387,10 +389,11 @@ class BglReader(object):
 			log.error("invalid gzip header position: %s" % gzipOffset)
 			return False
 
-		self.file = BGLGzipFile(
-			fileobj=FileOffS(self._filename, gzipOffset),
-			closeFileobj=True,
-		)
+		try:
+			self.file = BglGzipStream(self._filename, gzipOffset)
+		except ValueError as e:
+			log.error(str(e))
+			return False
 
 		return True
 
@@ -398,12 +401,19 @@ class BglReader(object):
 		"""
 		read meta information about the dictionary: author, description,
 		source and target languages, etc (articles are not read)
+
+		metadata blocks (type 0 and 3) come before entries, so we read
+		blocks until the first entry or resource block, and keep that
+		block for __next__, so gzip stream is decompressed only once
+		with fullPrescan=True, all blocks are read, then we go back to
+		the beginning of gzip stream
 		"""
-		self.numEntries = 0
+		if self.fullPrescan:
+			self.numEntries = 0
+			self.numResources = 0
 		self.numBlocks = 0
-		self.numResources = 0
-		block = Block()
 		while not self.isEndOfDictData():
+			block = Block()
 			if not self.readBlock(block):
 				break
 			self.numBlocks += 1
@@ -411,22 +421,32 @@ class BglReader(object):
 				continue
 			if block.type == 0:
 				self.readType0(block)
-			elif block.type in (1, 7, 10, 11, 13):
-				self.numEntries += 1
-			elif block.type == 2:
-				self.numResources += 1
 			elif block.type == 3:
 				self.readType3(block)
+			elif block.type in (1, 2, 7, 10, 11, 13):
+				if not self.fullPrescan:
+					self._pendingBlock = block
+					break
+				if block.type == 2:
+					self.numResources += 1
+				else:
+					self.numEntries += 1
 			else:  # Unknown block.type
 				log.debug(
 					"Unkown Block type %r" % block.type +
 					", data_length = %s" % len(block.data) +
 					", number = %s" % self.numBlocks
 				)
-		self.file.seek(0)
+		if self.fullPrescan:
+			self.rewind()
 
 		self.detectEncoding()
 
+		if self.numEntries is None:
+			log.debug("bgl_numEntries = %s" % self.bgl_numEntries)
+			self.numBlocks = 0
+			return
+
 		log.debug("numEntries = %s" % self.numEntries)
 		if self.bgl_numEntries and self.bgl_numEntries != self.numEntries:
 			# There are a number of cases when these numbers do not match.
@@ -502,10 +522,43 @@ class BglReader(object):
 		"""
 		return False
 
+	def checkpointState(self):
+		"""
+		returns position of reader, to be given to `resumeFrom` later
+		"""
+		return {"blockOffset": self._lastBlockOffset}
+
+	def resumeFrom(self, state):
+		"""
+		continue reading after the block that `checkpointState` was called
+		must be called before iterating over reader
+		the gzip stream is decompressed (without parsing blocks) up to that
+		block, that is much faster than processing entries
+		"""
+		offset = state["blockOffset"]
+		if offset is None:
+			return
+		self._pendingBlock = None
+		self.file.seek(offset)
+		self.readBlock(Block())
+		self._lastBlockOffset = offset
+
+	def rewind(self):
+		"""
+		go back to the beginning of gzip stream
+		reading again means decompressing everything again
+		"""
+		self.file.seek(0)
+		self._pendingBlock = None
+
 	def close(self):
+		if self._parallelGen is not None:
+			self._parallelGen.close()
+			self._parallelGen = None
 		if self.file:
 			self.file.close()
 			self.file = None
+		self._pendingBlock = None
 
 	def __del__(self):
 		self.close()
@@ -517,58 +570,14 @@ class BglReader(object):
 	# returns False if error
 	def readBlock(self, block):
 		block.offset = self.file.tell()
-		length = self.readBytes(1)
-		if length == -1:
-			log.debug("readBlock: length = -1")
-			return False
-		block.type = length & 0xf
-		length >>= 4
-		if length < 4:
-			length = self.readBytes(length+1)
-			if length == -1:
-				log.error("readBlock: length = -1")
-				return False
-		else:
-			length -= 4
-		self.file.flush()
-		if length > 0:
-			try:
-				block.data = self.file.read(length)
-			except:
-				# struct.error: unpack requires a string argument of length 4
-				# FIXME
-				log.exception(
-					"failed to read block data" +
-					": numBlocks=%s" % self.numBlocks +
-					", length=%s" % length +
-					", filePos=%s" % self.file.tell()
-				)
-				block.data = b""
-				return False
-		else:
+		res = self.file.readBlock()
+		if res is None:
+			log.debug("readBlock: end of file")
 			block.data = b""
+			return False
+		block.type, block.data = res
 		return True
 
-	def readBytes(self, num):
-		"""
-			return -1 if error
-		"""
-		if num < 1 or num > 4:
-			log.error("invalid argument num=%s" % num)
-			return -1
-		self.file.flush()
-		buf = self.file.read(num)
-		if len(buf) == 0:
-			log.debug("readBytes: end of file: len(buf)==0")
-			return -1
-		if len(buf) != num:
-			log.error(
-				"readBytes: expected to read %s bytes" % num +
-				", but found %s bytes" % len(buf)
-			)
-			return -1
-		return binStrToInt(buf)
-
 	def readType0(self, block):
 		code = block.data[0]
 		if code == 2:
@@ -728,56 +737,159 @@ class BglReader(object):
 	def __next__(self):
 		if not self.file:
 			raise StopIteration
-		block = Block()
-		while not self.isEndOfDictData():
-			if not self.readBlock(block):
+		if self.workers > 1:
+			if self._parallelGen is None:
+				self._parallelGen = self.parallelEntryGen()
+			return next(self._parallelGen)
+		while True:
+			block = self.nextBlock()
+			if block is None:
 				break
-			if not block.data:
-				continue
-
+			self._lastBlockOffset = block.offset
 			if block.type == 2:
 				return self.readType2(block)
-
-			elif block.type == 11:
-				succeed, u_word, u_alts, u_defi = self.readEntry_Type11(block)
-				if not succeed:
-					continue
-
-				return self._glos.newEntry(
-					[u_word] + u_alts,
-					u_defi,
-				)
-
 			elif block.type in (1, 7, 10, 11, 13):
-				pos = 0
-				# word:
-				succeed, pos, u_word, b_word = self.readEntryWord(block, pos)
-				if not succeed:
-					continue
-				# defi:
-				succeed, pos, u_defi, b_defi = self.readEntryDefi(
-					block,
-					pos,
-					b_word,
-				)
-				if not succeed:
-					continue
-				# now pos points to the first char after definition
-				succeed, pos, u_alts = self.readEntryAlts(
-					block,
-					pos,
-					b_word,
-					u_word,
-				)
-				if not succeed:
+				res = self.decodeEntryBlock(block)
+				if res is None:
 					continue
-				return self._glos.newEntry(
-					[u_word] + u_alts,
-					u_defi,
-				)
+				return self._glos.newEntry(*res)
 
 		raise StopIteration
 
+	def nextBlock(self):
+		"""
+		returns the next non-empty block, or None at the end
+		"""
+		while not self.isEndOfDictData():
+			if self._pendingBlock:
+				block = self._pendingBlock
+				self._pendingBlock = None
+			else:
+				block = Block()
+				if not self.readBlock(block):
+					return
+			if block.data:
+				return block
+
+	def decodeEntryBlock(self, block):
+		"""
+		returns (words, defi) of an entry block, or None if it's invalid
+			words: list of str, the word and its alternates
+			defi: str
+		"""
+		if block.type == 11:
+			succeed, u_word, u_alts, u_defi = self.readEntry_Type11(block)
+			if not succeed:
+				return
+			return [u_word] + u_alts, u_defi
+
+		pos = 0
+		# word:
+		succeed, pos, u_word, b_word = self.readEntryWord(block, pos)
+		if not succeed:
+			return
+		# defi:
+		succeed, pos, u_defi, b_defi = self.readEntryDefi(
+			block,
+			pos,
+			b_word,
+		)
+		if not succeed:
+			return
+		# now pos points to the first char after definition
+		succeed, pos, u_alts = self.readEntryAlts(
+			block,
+			pos,
+			b_word,
+			u_word,
+		)
+		if not succeed:
+			return
+		return [u_word] + u_alts, u_defi
+
+	def decodeState(self):
+		"""
+		returns attributes that decoding worker processes need
+		"""
+		return {
+			key: getattr(self, key)
+			for key in (
+				"sourceEncoding",
+				"targetEncoding",
+				"defaultEncoding",
+				"partOfSpeechColor",
+				"noControlSequenceInDefi",
+				"strictStringConvertion",
+				"processHtmlInKey",
+				"keyRStripChars",
+			)
+		}
+
+	def parallelEntryGen(self):
+		"""
+		main process reads blocks and sends batches of raw entry blocks to
+		a pool of `self.workers` processes that decode them, results are
+		yielded in the original order
+		resources (type 2 blocks) are processed in main process
+		"""
+		pool = newProcessPool(
+			self.workers,
+			initializer=initDecodeWorker,
+			initargs=(self.decodeState(),),
+		)
+		tasks = (
+			(
+				blocks,
+				([
+					(block.type, block.data, block.offset)
+					for block in blocks
+					if block.type != 2
+				],),
+			)
+			for blocks in self.iterBlockBatches()
+		)
+		for blocks, results in orderedApply(
+			pool,
+			decodeEntryBlocks,
+			tasks,
+			self.workers,
+		):
+			yield from self.batchResultGen(blocks, results)
+
+	def iterBlockBatches(self):
+		"""
+		yields lists of entry and resource blocks
+		"""
+		batch = []
+		while True:
+			block = self.nextBlock()
+			if block is None:
+				break
+			if block.type not in (1, 2, 7, 10, 11, 13):
+				continue
+			batch.append(block)
+			if len(batch) >= self.decodeBatchSize:
+				yield batch
+				batch = []
+		if batch:
+			yield batch
+
+	def batchResultGen(self, blocks, results):
+		"""
+		results: decoded entry blocks of the batch (excluding resources)
+		"""
+		results = iter(results)
+		for block in blocks:
+			self._lastBlockOffset = block.offset
+			if block.type == 2:
+				entry = self.readType2(block)
+				if entry is not None:
+					yield entry
+				continue
+			res = next(results)
+			if res is not None:
+				yield self._glos.newEntry(*res)
+
 	def readEntryWord(self, block, pos):
 		"""
 			Read word part of entry.
@@ -21,6 +21,7 @@
 # If not, see <http://www.gnu.org/licenses/gpl.txt>.
 
 from .bgl_reader import BglReader
+from .bgl_gzip import BglGzipStream
 
 
 class MetaData(object):
@@ -73,21 +74,18 @@ class MetaData2(object):
 
 class GzipWithCheck(object):
 	"""
-	gzip.GzipFile with check.
+	BglGzipStream with check.
 	It checks that unpacked data match what was packed.
 	"""
-	def __init__(self, fileobj, unpackedPath, reader, closeFileobj=False):
+	def __init__(self, filename, offset, unpackedPath, reader):
 		"""
 		constructor
 
-		fileobj - gzip file - archive
+		filename, offset - path of bgl file, and offset of gzip data in it
 		unpackedPath - path of a file containing original data, for testing.
 		reader - reference to BglReader class instance, used for logging.
 		"""
-		self.file = BGLGzipFile(
-			fileobj=fileobj,
-			closeFileobj=closeFileobj,
-		)
+		self.file = BglGzipStream(filename, offset)
 		self.unpackedFile = open(unpackedPath, "rb")
 		self.reader = reader
 
@@ -123,9 +121,28 @@ class GzipWithCheck(object):
 #			)
 		return buf1
 
-	def seek(self, offset, whence=os.SEEK_SET):
-		self.file.seek(offset, whence)
-		self.unpackedFile.seek(offset, whence)
+	def readBlock(self):
+		pos = self.file.tell()
+		res = self.file.readBlock()
+		size = self.file.tell() - pos
+		buf1 = b""
+		if res is not None:
+			# block header is not returned, so only the payload is compared
+			buf1 = res[1]
+		buf2 = self.unpackedFile.read(size)
+		if not buf2.endswith(buf1):
+			self.reader.msgLogFileWrite(
+				"GzipWithCheck.readBlock: !=: pos = %s, (%s) (%s)" % (
+					pos,
+					buf1,
+					buf2,
+				)
+			)
+		return res
+
+	def seek(self, offset):
+		self.file.seek(offset)
+		self.unpackedFile.seek(offset)
 #		self.reader.msgLogFileWrite(
 #			"GzipWithCheck.seek: offset = %s, whence = %s" % (offset, whence)
 #		)
@@ -166,6 +183,9 @@ class DebugBglReader(BglReader):
 		msgLogPath=None,
 		**kwargs
 	):
+		# statistics and samples are collected while decoding, so
+		# entries must be decoded in this process
+		kwargs["workers"] = 0
 		if not BglReader.open(self, filename, **kwargs):
 			return
 
@@ -219,21 +239,16 @@ class DebugBglReader(BglReader):
 				bglFile.seek(i)
 				f2.write(bglFile.read())
 				f2.close()
-				self.file = gzip.open(self.dataFile, "rb")
+				self.file = BglGzipStream(self.dataFile)
+			elif self.unpackedGzipPath:
+				self.file = GzipWithCheck(
+					self._filename,
+					gzipOffset,
+					self.unpackedGzipPath,
+					self,
+				)
 			else:
-				f2 = FileOffS(self._filename, gzipOffset)
-				if self.unpackedGzipPath:
-					self.file = GzipWithCheck(
-						f2,
-						self.unpackedGzipPath,
-						self,
-						closeFileobj=True,
-					)
-				else:
-					self.file = BGLGzipFile(
-						fileobj=f2,
-						closeFileobj=True,
-					)
+				self.file = BglGzipStream(self._filename, gzipOffset)
 
 	def close(self):
 		BglReader.close(self)
@@ -372,7 +387,7 @@ class DebugBglReader(BglReader):
 
 	def dumpBlocks(self, dumpPath):
 		import pickle
-		self.file.seek(0)
+		self.rewind()
 		metaData = MetaData()
 		metaData.numFiles = 0
 		metaData.gzipStartOffset = self.gzipOffset
@@ -430,7 +445,7 @@ class DebugBglReader(BglReader):
 		with open(dumpPath, "wb") as f:
 			pickle.dump(metaData, f)
 
-		self.file.seek(0)
+		self.rewind()
 
 	def dumpMetadata2(self, dumpPath):
 		import pickle
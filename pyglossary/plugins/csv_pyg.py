@@ -44,6 +44,7 @@ class Reader(object):
 	def clear(self):
 		self._filename = ""
 		self._file = None
+		self._fileSize = 0
 		self._leadingLinesCount = 0
 		self._wordCount = None
 		self._pos = -1
@@ -54,6 +55,7 @@ class Reader(object):
 	def open(self, filename, encoding="utf-8"):
 		self._filename = filename
 		self._file = open(filename, "r", encoding=encoding)
+		self._fileSize = os.path.getsize(filename)
 		self._csvReader = csv.reader(
 			self._file,
 			dialect="excel",
@@ -80,6 +82,11 @@ class Reader(object):
 				self._leadingLinesCount
 		return self._wordCount + len(self._resFileNames)
 
+	def progressFraction(self):
+		if not (self._file and self._fileSize):
+			return 0.0
+		return self._file.buffer.tell() / self._fileSize
+
 	def __iter__(self):
 		if not self._csvReader:
 			log.error("%s is not open, can not iterate" % self)
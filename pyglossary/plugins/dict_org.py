@@ -82,6 +82,7 @@ class Reader(object):
 		self._glos = glos
 		self._filename = ""
 		self._indexFp = None
+		self._indexSize = 0
 		self._dictFp = None
 		self._leadingLinesCount = 0
 		self._len = None
@@ -92,6 +93,7 @@ class Reader(object):
 			filename = filename[:-6]
 		self._filename = filename
 		self._indexFp = open(filename+".index", "rb")
+		self._indexSize = os.path.getsize(filename+".index")
 		if os.path.isfile(filename+".dict.dz"):
 			self._dictFp = gzip.open(filename+".dict.dz")
 		else:
@@ -118,6 +120,17 @@ class Reader(object):
 			) - self._leadingLinesCount
 		return self._len
 
+	def progressFraction(self):
+		if not (self._indexFp and self._indexSize):
+			return 0.0
+		return self._indexFp.tell() / self._indexSize
+
+	def checkpointState(self):
+		return {"offset": self._indexFp.tell()}
+
+	def resumeFrom(self, state):
+		self._indexFp.seek(state["offset"])
+
 	def __iter__(self):
 		if not self._indexFp:
 			log.error("reader is not open, can not iterate")
@@ -25,16 +25,25 @@ from pyglossary.text_utils import (
 	unescapeNTB,
 	splitByBarUnescapeNTB,
 )
+from pyglossary.file_utils import openTruncated
+from pyglossary.entry import Entry
+from pyglossary.plugin_lib.process_pool import OrderedResults
+
+from hashlib import sha1
 
 enable = True
 format = "Edlin"
 description = "Editable Linked List of Entries"
 extentions = [".edlin"]
-readOptions = []
+readOptions = [
+	"prefetch",  # int, number of entry files that are read ahead
+]
 writeOptions = [
 	"encoding",  # str
 	"havePrevLink",  # bool
+	"workers",  # int, number of threads that write entry files
 ]
+supportsCheckpoint = True
 
 
 def makeDir(direc):
@@ -42,6 +51,19 @@ def makeDir(direc):
 		os.makedirs(direc)
 
 
+def makeHashDirs(direc):
+	"""
+	creates all 256 directories for first 2 characters of hashes
+	"""
+	for i in range(256):
+		makeDir(join(direc, "%.2x" % i))
+
+
+def writeTextFile(fpath, text, encoding):
+	with open(fpath, "w", encoding=encoding) as toFile:
+		toFile.write(text)
+
+
 class Reader(object):
 	def __init__(self, glos):
 		self._glos = glos
@@ -58,8 +80,9 @@ class Reader(object):
 		self._rootPath = None
 		self._resDir = ""
 		self._resFileNames = []
+		self._prefetch = 0
 
-	def open(self, filename, encoding="utf-8"):
+	def open(self, filename, encoding="utf-8", prefetch=32):
 		from pyglossary.json_utils import jsonToOrderedData
 		if isdir(filename):
 			infoFname = join(filename, "info.json")
@@ -73,6 +96,7 @@ class Reader(object):
 			)
 		self._filename = filename
 		self._encoding = encoding
+		self._prefetch = int(prefetch)
 
 		with open(infoFname, "r", encoding=encoding) as infoFp:
 			infoJson = infoFp.read()
@@ -96,42 +120,109 @@ class Reader(object):
 			return 0
 		return self._wordCount + len(self._resFileNames)
 
+	def readEntryFile(self, path):
+		"""
+		returns (nextPath, word, defi) of entry file, word and defi are
+		not stripped, and can be empty
+		"""
+		with open(
+			join(self._filename, path),
+			"r",
+			encoding=self._encoding,
+		) as fromFile:
+			header = fromFile.readline().rstrip()
+			if self._havePrevLink:
+				self._prevPath, nextPath = header.split(" ")
+			else:
+				nextPath = header
+			word = fromFile.readline()
+			defi = fromFile.read() if word else ""
+		return nextPath, word, defi
+
+	def iterEntryFiles(self):
+		"""
+		yields (word, defi) of entry files, following the links
+		"""
+		nextPath = self._rootPath
+		while nextPath != "END":
+			nextPath, word, defi = self.readEntryFile(nextPath)
+			yield word, defi
+
+	def prefetchEntryFiles(self):
+		"""
+		same as iterEntryFiles, but files are read in a thread, up to
+		`self._prefetch` files ahead of the consumer
+
+		the next path is only known after reading the header of a file,
+		so files can not be read in parallel, but file system latency
+		is hidden behind processing entries
+		"""
+		import threading
+		from queue import Queue, Full
+		queue = Queue(self._prefetch)
+		stopEvent = threading.Event()
+		# items: ("entry", (word, defi)), ("error", exception), ("end", None)
+
+		def put(item):
+			while not stopEvent.is_set():
+				try:
+					queue.put(item, timeout=0.1)
+				except Full:
+					continue
+				return True
+			return False
+
+		def readAhead():
+			try:
+				for record in self.iterEntryFiles():
+					if not put(("entry", record)):
+						return
+			except Exception as e:
+				put(("error", e))
+				return
+			put(("end", None))
+
+		thread = threading.Thread(target=readAhead, daemon=True)
+		thread.start()
+		try:
+			while True:
+				kind, value = queue.get()
+				if kind == "end":
+					return
+				if kind == "error":
+					raise value
+				yield value
+		finally:
+			stopEvent.set()
+			thread.join()
+
 	def __iter__(self):
 		if not self._rootPath:
 			log.error("iterating over a reader which is not open")
-			raise StopIteration
+			return
+
+		if self._prefetch > 0:
+			entryFiles = self.prefetchEntryFiles()
+		else:
+			entryFiles = self.iterEntryFiles()
 
 		wordCount = 0
-		nextPath = self._rootPath
-		while nextPath != "END":
+		for word, defi in entryFiles:
 			wordCount += 1
 			# before or after reading word and defi
 			# (and skipping empty entry)? FIXME
-
-			with open(
-				join(self._filename, nextPath),
-				"r",
-				encoding=self._encoding,
-			) as fromFile:
-				header = fromFile.readline().rstrip()
-				if self._havePrevLink:
-					self._prevPath, nextPath = header.split(" ")
-				else:
-					nextPath = header
-				word = fromFile.readline()
-				if not word:
-					yield None  # update progressbar
-					continue
-				defi = fromFile.read()
-				if not defi:
-					log.warning(
-						"Edlin Reader: no definition for word %r" % word +
-						", skipping"
-					)
-					yield None  # update progressbar
-					continue
-				word = word.rstrip()
-				defi = defi.rstrip()
+			if not word:
+				yield None  # update progressbar
+				continue
+			if not defi:
+				log.warning(
+					"Edlin Reader: no definition for word %r" % word +
+					", skipping"
+				)
+				yield None  # update progressbar
+				continue
+			word = word.rstrip()
+			defi = defi.rstrip()
 
 			if self._glos.getPref("enable_alts", True):
 				word = splitByBarUnescapeNTB(word)
@@ -164,24 +255,52 @@ class Writer(object):
 		self._glos = glos
 		self._clear()
 
-	def close(self):
-		self._clear()
-
 	def _clear(self):
 		self._filename = ""
 		self._encoding = "utf-8"
 		self._hashSet = set()
+		self._newHashes = []  # hashes that are not saved in checkpoint yet
+		self._resumeState = None
+		self._writes = None  # OrderedResults of file writes, or None
+		self._workers = 0
 		# self._wordCount = None
 
-	def open(self, filename, encoding="utf-8", havePrevLink=True):
-		if exists(filename):
-			raise ValueError("directory %r already exists" % filename)
+	def open(
+		self,
+		filename,
+		encoding="utf-8",
+		havePrevLink=True,
+		workers=4,
+	):
 		self._filename = filename
 		self._encoding = encoding
 		self._havePrevLink = havePrevLink
+		self._workers = int(workers)
 		self._resDir = join(filename, "res")
-		os.makedirs(filename)
-		os.mkdir(self._resDir)
+		self._hashesFilename = filename.rstrip(os.sep) + ".checkpoint-hashes"
+		self._resumeState = self._glos.getResumeWriterState()
+		if self._resumeState:
+			self.loadHashes(self._resumeState["hashesFileSize"])
+		else:
+			if exists(filename):
+				raise ValueError("directory %r already exists" % filename)
+			os.makedirs(filename)
+			os.mkdir(self._resDir)
+		makeHashDirs(filename)
+		if self._workers > 1:
+			from multiprocessing.pool import ThreadPool
+			self._writes = OrderedResults(
+				ThreadPool(self._workers),
+				self._workers,
+			)
+
+	def loadHashes(self, fileSize):
+		"""
+		load entry hashes that are saved by the last checkpoint
+		"""
+		with open(self._hashesFilename, "rb") as fp:
+			hashesBytes = fp.read(fileSize)
+		self._hashSet = set(hashesBytes.decode("ascii").split())
 
 	def hashToPath(self, h):
 		return h[:2] + "/" + h[2:]
@@ -192,38 +311,54 @@ class Writer(object):
 		don't call it twice for one entry, if you do you will get a
 		different hash string
 		"""
-		from hashlib import sha1
 		_hash = sha1(toBytes(entry.getWord())).hexdigest()[:8]
 		if _hash not in self._hashSet:
 			self._hashSet.add(_hash)
+			self._newHashes.append(_hash)
 			return _hash
 		index = 0
 		while True:
 			tmp_hash = _hash + hex(index)[2:]
 			if tmp_hash not in self._hashSet:
 				self._hashSet.add(tmp_hash)
+				self._newHashes.append(tmp_hash)
 				return tmp_hash
 			index += 1
 
 	def saveEntry(self, thisEntry, thisHash, prevHash, nextHash):
-		dpath = join(self._filename, thisHash[:2])
-		makeDir(dpath)
-		with open(
-			join(dpath, thisHash[2:]),
-			"w",
-			encoding=self._encoding,
-		) as toFile:
-			nextPath = self.hashToPath(nextHash) if nextHash else "END"
-			if self._havePrevLink:
-				prevPath = self.hashToPath(prevHash) if prevHash else "START"
-				header = prevPath + " " + nextPath
-			else:
-				header = nextPath
-			toFile.write("\n".join([
-				header,
-				thisEntry.getWord(),
-				thisEntry.getDefi(),
-			]))
+		"""
+		hash directories are created in open(), and file is written
+		in the thread pool if there is one
+		"""
+		fpath = join(self._filename, thisHash[:2], thisHash[2:])
+		nextPath = self.hashToPath(nextHash) if nextHash else "END"
+		if self._havePrevLink:
+			prevPath = self.hashToPath(prevHash) if prevHash else "START"
+			header = prevPath + " " + nextPath
+		else:
+			header = nextPath
+		text = "\n".join([
+			header,
+			thisEntry.getWord(),
+			thisEntry.getDefi(),
+		])
+		if self._writes is None:
+			writeTextFile(fpath, text, self._encoding)
+			return
+		self._writes.submit(writeTextFile, (fpath, text, self._encoding))
+
+	def waitForWrites(self):
+		"""
+		waits until all entry files are written, raises their errors
+		"""
+		if self._writes is not None:
+			for _ in self._writes.drain():
+				pass
+
+	def close(self):
+		if self._writes is not None:
+			self._writes.close()
+		self._clear()
 
 	def _iterNonDataEntries(self):
 		for entry in self._glos:
@@ -237,14 +372,46 @@ class Writer(object):
 		from pyglossary.json_utils import dataToPrettyJson
 
 		glosIter = iter(self._iterNonDataEntries())
-		try:
-			thisEntry = next(glosIter)
-		except StopIteration:
-			raise ValueError("glossary is empty")
-
-		count = 1
-		rootHash = thisHash = self.getEntryHash(thisEntry)
-		prevHash = None
+		state = self._resumeState
+		if state:
+			# thisEntry is not saved yet, we keep it in checkpoint
+			thisEntry = Entry.fromRaw(state["thisEntry"])
+			count = state["count"]
+			rootHash = state["rootHash"]
+			prevHash = state["prevHash"]
+			thisHash = state["thisHash"]
+			hashesFile = openTruncated(
+				self._hashesFilename,
+				state["hashesFileSize"],
+			)
+		else:
+			try:
+				thisEntry = next(glosIter)
+			except StopIteration:
+				raise ValueError("glossary is empty")
+			count = 1
+			rootHash = thisHash = self.getEntryHash(thisEntry)
+			prevHash = None
+			hashesFile = open(self._hashesFilename, "wb")
+
+		def checkpointState():
+			# entries before thisEntry must be on disk when resuming
+			self.waitForWrites()
+			hashesFile.write("".join([
+				h + "\n" for h in self._newHashes
+			]).encode("ascii"))
+			hashesFile.flush()
+			self._newHashes = []
+			return {
+				"count": count,
+				"rootHash": rootHash,
+				"prevHash": prevHash,
+				"thisHash": thisHash,
+				"thisEntry": thisEntry.getRaw(),
+				"hashesFileSize": hashesFile.tell(),
+			}
+
+		self._glos.setCheckpointWriter(checkpointState)
 		for nextEntry in glosIter:
 			nextHash = self.getEntryHash(nextEntry)
 			self.saveEntry(thisEntry, thisHash, prevHash, nextHash)
@@ -252,6 +419,9 @@ class Writer(object):
 			prevHash, thisHash = thisHash, nextHash
 			count += 1
 		self.saveEntry(thisEntry, thisHash, prevHash, None)
+		self.waitForWrites()
+		hashesFile.close()
+		os.remove(self._hashesFilename)
 
 		with open(
 			join(self._filename, "info.json"),
@@ -34,3 +34,4 @@ writeOptions = []
 supportsAlternates = False
 sortOnWrite = DEFAULT_NO
 sortKey = None
+supportsCheckpoint = False
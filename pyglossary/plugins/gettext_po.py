@@ -20,6 +20,7 @@ class Reader(object):
 	def clear(self):
 		self._filename = ""
 		self._file = None
+		self._fileSize = 0
 		self._wordCount = None
 		self._resDir = ""
 		self._resFileNames = []
@@ -27,6 +28,7 @@ class Reader(object):
 	def open(self, filename):
 		self._filename = filename
 		self._file = open(filename)
+		self._fileSize = os.path.getsize(filename)
 		self._resDir = filename + "_res"
 		if isdir(self._resDir):
 			self._resFileNames = os.listdir(self._resDir)
@@ -49,6 +51,11 @@ class Reader(object):
 			)
 		return self._wordCount
 
+	def progressFraction(self):
+		if not (self._file and self._fileSize):
+			return 0.0
+		return self._file.buffer.tell() / self._fileSize
+
 	def __iter__(self):
 		from polib import unescape as po_unescape
 		word = ""
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 # octopus_mdic.py
-# Read Octopus MDict dictionary format, mdx(dictionary)/mdd(data)
+# Read and write Octopus MDict dictionary format, mdx(dictionary)/mdd(data)
 #
 # Copyright (C) 2013 Xiaoqiang Wang <xiaoqiangwang AT gmail DOT com>
 # Copyright (C) 2013-2016 Saeed Rasooli <saeed.gnu@gmail.com>
@@ -30,7 +30,11 @@ readOptions = [
 	"encoding",  # str
 	"substyle",  # bool
 ]
-writeOptions = []
+writeOptions = [
+	"encoding",  # str, encoding of .mdx file: "UTF-8" or "UTF-16"
+	"resources",  # bool, write resource files into .mdd file
+	"workers",  # int, number of threads that compress blocks
+]
 
 
 class Reader(object):
@@ -45,6 +49,8 @@ class Reader(object):
 		self._mdx = None
 		self._mdd = None
 		self._mddFilename = ""
+		self._mdxIndex = 0  # number of mdx records that are read
+		self._mddIndex = 0  # number of mdd records that are read
 
 	def open(self, filename, **options):
 		from pyglossary.plugin_lib.readmdict import MDX, MDD
@@ -78,19 +84,30 @@ class Reader(object):
 		if self._mdx is None:
 			log.error("trying to iterate on a closed MDX file")
 		else:
-			for word, defi in self._mdx.items():
-				word = toStr(word)
-				defi = toStr(defi)
-				yield self._glos.newEntry(word, defi)
+			for word, defi in self._mdx.items(self._mdxIndex):
+				self._mdxIndex += 1
+				# defi is already decoded to str by MDX
+				yield self._glos.newEntry(toStr(word), defi)
 			self._mdx = None
 
 		if self._mdd:
-			for b_fname, b_data in self._mdd.items():
+			for b_fname, b_data in self._mdd.items(self._mddIndex):
+				self._mddIndex += 1
 				fname = toStr(b_fname)
 				fname = fname.replace("\\", os.sep).lstrip(os.sep)
 				yield self._glos.newDataEntry(fname, b_data)
 			self._mdd = None
 
+	def checkpointState(self):
+		return {
+			"mdxIndex": self._mdxIndex,
+			"mddIndex": self._mddIndex,
+		}
+
+	def resumeFrom(self, state):
+		self._mdxIndex = state["mdxIndex"]
+		self._mddIndex = state["mddIndex"]
+
 	def __len__(self):
 		if self._mdx is None:
 			log.error(
@@ -101,3 +118,86 @@ class Reader(object):
 
 	def close(self):
 		self.clear()
+
+
+def write(
+	glos,
+	filename,
+	encoding="UTF-8",
+	resources=True,
+	workers=4,
+):
+	"""
+	entries are sorted (with bounded memory) in order of MDict keys,
+	alternate words are written as links: "@@@LINK=" + main word
+
+	data of resource files is written into a temporary file as they come,
+	and written into .mdd file in order of their keys at the end
+	"""
+	from tempfile import TemporaryFile
+	from pyglossary.plugin_lib.writemdict import (
+		MDictWriter,
+		sortKey,
+		mddSortKey,
+	)
+	from pyglossary.sort_stream import (
+		externalSortStream,
+		defaultChunkBytes,
+	)
+
+	workers = int(workers)
+	title = glos.getInfo("name")
+	description = glos.getInfo("description")
+	resFile = TemporaryFile(prefix="pyglossary-mdd-")
+	# resList: list of (mddSortKey, key, offset in resFile, size)
+	resList = []
+
+	def recordGen():
+		for entry in glos:
+			if entry.isData():
+				if not resources:
+					continue
+				key = "\\" + entry.getFileName().replace(os.sep, "\\")
+				data = entry.getData()
+				resList.append((mddSortKey(key), key, resFile.tell(), len(data)))
+				resFile.write(data)
+				continue
+			words = entry.getWords()
+			defi = entry.getDefi().replace("bword://", "entry://")
+			yield sortKey(words[0]), words[0], defi
+			for alt in words[1:]:
+				yield sortKey(alt), alt, "@@@LINK=%s" % words[0]
+
+	mdx = MDictWriter(
+		filename,
+		title=title,
+		description=description,
+		encoding=encoding,
+		workers=workers,
+	)
+	mdx.open()
+	for _, word, defi in externalSortStream(
+		recordGen(),
+		defaultChunkBytes,
+		key=lambda item: item[0],
+		sizeFunc=lambda item: len(item[1]) + len(item[2]) + 100,
+	):
+		mdx.addText(word, defi)
+	log.info("Wrote %s keys to %s" % (mdx.close(), filename))
+
+	if resList:
+		resList.sort()
+		mddFilename = "".join([splitext(filename)[0], extsep, "mdd"])
+		mdd = MDictWriter(
+			mddFilename,
+			title=title,
+			description=description,
+			isMdd=True,
+			workers=workers,
+		)
+		mdd.open()
+		for _, key, offset, size in resList:
+			resFile.seek(offset)
+			mdd.add(key, resFile.read(size))
+		log.info("Wrote %s files to %s" % (mdd.close(), mddFilename))
+	resFile.close()
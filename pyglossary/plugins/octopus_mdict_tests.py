@@ -0,0 +1,176 @@
+import sys
+import os
+import shutil
+import tempfile
+import unittest
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from pyglossary.tests_common import getPlugin
+from pyglossary.glossary import Glossary
+from pyglossary.entry import DataEntry
+from pyglossary.plugin_lib.readmdict import MDX, MDD
+from pyglossary.plugin_lib.writemdict import (
+	sortKey as mdxSortKey,
+	mddSortKey,
+)
+
+octopus_mdict = getPlugin("OctopusMdict")
+
+
+class MddKeyOrderTest(unittest.TestCase):
+	"""
+	.mdd header declares KeyCaseSensitive="No" and StripKey="No", so keys
+	must be sorted case-insensitively, without stripping punctuation
+	"""
+	fileNames = [
+		"ab.png",
+		"A_c.png",
+		"a.png",
+		"img/b.png",
+		"B.png",
+		"a-b.png",
+	]
+	sortedKeys = [
+		"\\a-b.png",
+		"\\a.png",
+		"\\A_c.png",
+		"\\ab.png",
+		"\\B.png",
+		"\\img\\b.png",
+	]
+
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def test_mddSortKey(self):
+		self.assertEqual(
+			sorted(self.sortedKeys[::-1], key=mddSortKey),
+			self.sortedKeys,
+		)
+
+	def test_write(self):
+		glos = Glossary()
+		glos.addEntry("word", "definition")
+		for fname in self.fileNames:
+			glos.addEntryObj(DataEntry(
+				fname.replace("/", os.sep),
+				fname.encode("utf-8"),
+			))
+		filename = join(self.tmpDir, "test.mdx")
+		self.assertTrue(glos.write(filename, octopus_mdict.format))
+		mdd = MDD(join(self.tmpDir, "test.mdd"))
+		items = list(mdd.items())
+		self.assertEqual(
+			[b_key.decode("utf-8") for b_key, _ in items],
+			self.sortedKeys,
+		)
+		for b_key, b_data in items:
+			self.assertEqual(
+				b_key.decode("utf-8")[1:].replace("\\", "/"),
+				b_data.decode("utf-8"),
+			)
+
+
+def blockCounts(mdx):
+	"""
+	returns (number of key blocks, number of record blocks) of MDX object
+	"""
+	with open(mdx._fname, "rb") as fp:
+		fp.seek(mdx._key_block_offset)
+		keyBlockCount = mdx._read_number(fp)
+		fp.seek(mdx._record_block_offset)
+		recordBlockCount = mdx._read_number(fp)
+	return keyBlockCount, recordBlockCount
+
+
+class MdxWriteTest(unittest.TestCase):
+	entryCount = 3000
+
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def newGlossary(self):
+		glos = Glossary()
+		for index in range(self.entryCount):
+			glos.addEntry(
+				[
+					"w\u00f6rd%04d" % index,
+					"alt%04d" % index,
+					"\u0627\u0644\u062a%04d" % index,
+				],
+				"definition of <b>%d</b> \u00e9\u00e8 %s" % (index, "x" * 50),
+			)
+		return glos
+
+	def expectedRecords(self):
+		records = {}
+		for index in range(self.entryCount):
+			word = "w\u00f6rd%04d" % index
+			records[word] = "definition of <b>%d</b> \u00e9\u00e8 %s" % (
+				index,
+				"x" * 50,
+			)
+			records["alt%04d" % index] = "@@@LINK=" + word
+			records["\u0627\u0644\u062a%04d" % index] = "@@@LINK=" + word
+		return records
+
+	def write(self, name, **options):
+		filename = join(self.tmpDir, name)
+		self.assertTrue(self.newGlossary().write(
+			filename,
+			octopus_mdict.format,
+			**options
+		))
+		return filename
+
+	def test_round_trip(self):
+		for encoding in ("UTF-8", "UTF-16"):
+			filename = self.write("test-%s.mdx" % encoding, encoding=encoding)
+			mdx = MDX(filename)
+			keyBlockCount, recordBlockCount = blockCounts(mdx)
+			self.assertGreater(keyBlockCount, 1)
+			self.assertGreater(recordBlockCount, 1)
+			items = [
+				(b_key.decode("utf-8"), defi)
+				for b_key, defi in mdx.items()
+			]
+			self.assertEqual(len(items), self.entryCount * 3)
+			self.assertEqual(dict(items), self.expectedRecords())
+			keys = [key for key, _ in items]
+			self.assertEqual(keys, sorted(keys, key=mdxSortKey))
+
+	def test_read_links(self):
+		filename = self.write("test.mdx", encoding="UTF-16")
+		glos = Glossary()
+		self.assertTrue(glos.read(filename, format=octopus_mdict.format))
+		records = dict(
+			(entry.getWord(), entry.getDefi())
+			for entry in glos
+		)
+		self.assertEqual(records["alt0005"], "@@@LINK=w\u00f6rd0005")
+		self.assertEqual(records, self.expectedRecords())
+
+	def test_workers(self):
+		for encoding in ("UTF-8", "UTF-16"):
+			outputs = []
+			for workers in (0, 4):
+				filename = self.write(
+					"test-%s-%s.mdx" % (encoding, workers),
+					encoding=encoding,
+					workers=workers,
+				)
+				with open(filename, "rb") as fp:
+					outputs.append(fp.read())
+			self.assertEqual(outputs[0], outputs[1])
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -8,14 +8,32 @@ from os.path import (
 )
 import re
 import gzip
+import mmap
+from bisect import bisect_left
+from array import array
+from struct import Struct
 from time import time as now
 from collections import Counter
+from collections import OrderedDict as odict
+from hashlib import sha1
+from itertools import islice, chain
 
 from pyglossary.text_utils import (
-	intToBinStr,
 	binStrToInt,
 	runDictzip,
 )
+from pyglossary.file_utils import openTruncated
+from pyglossary.sort_stream import (
+	externalSortStream,
+	defaultChunkBytes,
+)
+from pyglossary.plugin_lib.dictzip import DictzipFile
+from pyglossary.plugin_lib.gzip_index import IndexedGzipFile
+from pyglossary.plugin_lib.stardict_resdb import (
+	hasResourceDB,
+	ResourceDBReader,
+	ResourceDBWriter,
+)
 
 from formats_common import *
 
@@ -26,8 +44,11 @@ extentions = [".ifo"]
 readOptions = []
 writeOptions = [
 	"dictzip",  # bool
+	"dedup",  # bool
+	"resdb",  # bool
 ]
 sortOnWrite = ALWAYS
+supportsCheckpoint = True
 # sortKey also is defined in line 52
 supportsAlternates = True
 
@@ -40,6 +61,23 @@ infoKeys = (
 	"date",
 )
 
+# definition type code (in .dict file) => defiFormat
+defiFormatByType = {
+	"m": "m",
+	"t": "m",
+	"y": "m",
+	"g": "h",
+	"h": "h",
+	"x": "x",
+}
+
+# packs (offset, size) of .idx record, by size of offset in bytes
+idxTailStructs = {
+	4: Struct(">II"),
+	8: Struct(">QI"),
+}
+synTailStruct = Struct(">I")
+
 
 def sortKeyBytes(b_word):
 	"""
@@ -101,6 +139,8 @@ class Reader(object):
 	def close(self):
 		if self._dictFile:
 			self._dictFile.close()
+		if self._resDB is not None:
+			self._resDB.close()
 		self.clear()
 
 	def clear(self):
@@ -111,7 +151,12 @@ class Reader(object):
 		self._sametypesequence = ""
 		self._resDir = ""
 		self._resFileNames = []
+		self._resDB = None  # ResourceDBReader, if there is no res directory
 		self._wordCount = None
+		self._offsetSize = 4  # size of offsets in .idx file, in bytes
+		# index of the next word/resource to read, used for checkpoints
+		self._nextWordIndex = 0
+		self._nextResIndex = 0
 
 	def open(self, filename):
 		if splitext(filename)[1].lower() == ".ifo":
@@ -123,6 +168,11 @@ class Reader(object):
 		sametypesequence = self._glos.getInfo("sametypesequence")
 		if not verifySameTypeSequence(sametypesequence):
 			return False
+		idxoffsetbits = self._glos.getInfo("idxoffsetbits")
+		if idxoffsetbits not in ("", "32", "64"):
+			log.error("Invalid idxoffsetbits=%s" % idxoffsetbits)
+			return False
+		self._offsetSize = 8 if idxoffsetbits == "64" else 4
 		self._indexData = self.readIdxFile()
 		self._wordCount = len(self._indexData)
 		self._synDict = self.readSynFile()
@@ -137,14 +187,62 @@ class Reader(object):
 		else:
 			self._resDir = ""
 			self._resFileNames = []
-		# self.readResources()
+			self.openResourceDB()
+
+	def openResourceDB(self):
+		"""
+		StarDict resource database (res.rifo, res.ridx, res.rdic[.dz])
+		is used only if there is no "res" directory
+		"""
+		direc = dirname(self._filename)
+		if not hasResourceDB(direc):
+			return
+		resDB = ResourceDBReader(direc)
+		try:
+			resDB.open()
+		except Exception:
+			log.exception("error while opening StarDict resource database")
+			resDB.close()
+			return
+		self._resDB = resDB
+
+	def getResourceCount(self):
+		if self._resDB is not None:
+			return len(self._resDB)
+		return len(self._resFileNames)
 
 	def __len__(self):
 		if self._wordCount is None:
 			raise RuntimeError(
 				"StarDict: len(reader) called while reader is not open"
 			)
-		return self._wordCount + len(self._resFileNames)
+		return self._wordCount + self.getResourceCount()
+
+	def knownStats(self):
+		"""
+		statistics that are known from .ifo, .idx and .syn files
+		"""
+		stats = {
+			"entryCount": self._wordCount,
+			"altCount": sum(len(alts) for alts in self._synDict.values()),
+			"resourceCount": self.getResourceCount(),
+		}
+		if len(self._sametypesequence) == 1:
+			defiFormat = defiFormatByType.get(self._sametypesequence, "")
+			if defiFormat:
+				stats["defiFormatCounter"] = {defiFormat: self._wordCount}
+				stats["multiDefiCount"] = 0
+		return stats
+
+	def checkpointState(self):
+		return {
+			"wordIndex": self._nextWordIndex,
+			"resIndex": self._nextResIndex,
+		}
+
+	def resumeFrom(self, state):
+		self._nextWordIndex = state["wordIndex"]
+		self._nextResIndex = state["resIndex"]
 
 	def readIfoFile(self):
 		"""
@@ -171,6 +269,7 @@ class Reader(object):
 			with open(self._filename+".idx", "rb") as idxFile:
 				idxBytes = idxFile.read()
 
+		offsetSize = self._offsetSize
 		indexData = []
 		pos = 0
 		while pos < len(idxBytes):
@@ -181,11 +280,11 @@ class Reader(object):
 				break
 			b_word = idxBytes[beg:pos]
 			pos += 1
-			if pos + 8 > len(idxBytes):
+			if pos + offsetSize + 4 > len(idxBytes):
 				log.error("Index file is corrupted")
 				break
-			offset = binStrToInt(idxBytes[pos:pos+4])
-			pos += 4
+			offset = binStrToInt(idxBytes[pos:pos+offsetSize])
+			pos += offsetSize
 			size = binStrToInt(idxBytes[pos:pos+4])
 			pos += 4
 			indexData.append([b_word, offset, size])
@@ -206,7 +305,15 @@ class Reader(object):
 			log.warning("indexData is empty")
 			raise StopIteration
 
-		for wordIndex, (b_word, defiOffset, defiSize) in enumerate(indexData):
+		# fast path for compact dictionaries with a single definition type:
+		# the whole block is the definition
+		singleTypeCode = None
+		if len(sametypesequence) == 1:
+			singleTypeCode = ord(sametypesequence)
+
+		for wordIndex in range(self._nextWordIndex, len(indexData)):
+			b_word, defiOffset, defiSize = indexData[wordIndex]
+			self._nextWordIndex = wordIndex + 1
 			if not b_word:
 				continue
 
@@ -225,7 +332,9 @@ class Reader(object):
 				)
 				continue
 
-			if sametypesequence:
+			if singleTypeCode is not None:
+				defisData = [(b_defiBlock, singleTypeCode)]
+			elif sametypesequence:
 				defisData = self.parseDefiBlockCompact(
 					b_defiBlock,
 					sametypesequence,
@@ -244,14 +353,7 @@ class Reader(object):
 			for b_defi, defiFormatCode in defisData:
 				defis.append(b_defi.decode("utf-8"))
 				defiFormats.append(
-					{
-						"m": "m",
-						"t": "m",
-						"y": "m",
-						"g": "h",
-						"h": "h",
-						"x": "x",
-					}.get(chr(defiFormatCode), "")
+					defiFormatByType.get(chr(defiFormatCode), "")
 				)
 
 			# FIXME
@@ -279,14 +381,24 @@ class Reader(object):
 				defiFormat=defiFormat,
 			)
 
-		if isdir(self._resDir):
-			for fname in os.listdir(self._resDir):
-				fpath = join(self._resDir, fname)
-				with open(fpath, "rb") as fromFile:
-					yield self._glos.newDataEntry(
-						fname,
-						fromFile.read(),
-					)
+		if self._resDB is not None:
+			resIndex = self._nextResIndex
+			for fname, data in self._resDB.iterItems(resIndex):
+				resIndex += 1
+				self._nextResIndex = resIndex
+				yield self._glos.newDataEntry(fname, data)
+			return
+
+		resFileNames = self._resFileNames
+		for resIndex in range(self._nextResIndex, len(resFileNames)):
+			fname = resFileNames[resIndex]
+			self._nextResIndex = resIndex + 1
+			fpath = join(self._resDir, fname)
+			with open(fpath, "rb") as fromFile:
+				yield self._glos.newDataEntry(
+					fname,
+					fromFile.read(),
+				)
 
 	def readSynFile(self):
 		"""
@@ -408,24 +520,521 @@ class Reader(object):
 				i += size
 		return res
 
-	# def readResources(self):
-	#	if not isdir(self._resDir):
-	#		resInfoPath = join(baseDirPath, "res.rifo")
-	#		if isfile(resInfoPath):
-	#			log.warning(
-	#				"StarDict resource database is not supported. Skipping"
-	#			)
+
+class OffsetTableKeys(object):
+	"""
+	sequence of sort keys of records in an offset table, in sorted order
+	to be used with bisect, without loading the words into memory
+	"""
+	def __init__(self, lookup, table):
+		self._lookup = lookup
+		self._table = table
+
+	def __len__(self):
+		return len(self._table)
+
+	def __getitem__(self, sortedIndex):
+		return sortKeyBytes(
+			self._lookup.getRecordWord(self._table, sortedIndex)
+		)
+
+
+class OffsetTable(object):
+	"""
+	start positions of records in a mapped .idx or .syn file
+		positions: array of positions, in file order
+		order: array of record indexes in sortKeyBytes order,
+			or None if file is already sorted (which is the normal case)
+	"""
+	def __init__(self, data, tailSize, positions, order):
+		self.data = data  # mmap or bytes
+		self.tailSize = tailSize  # size of fields after null terminator
+		self.positions = positions
+		self.order = order
+
+	def __len__(self):
+		return len(self.positions)
+
+	def recordIndex(self, sortedIndex):
+		if self.order is None:
+			return sortedIndex
+		return self.order[sortedIndex]
+
+
+class StarDictLookup(object):
+	"""
+	Look up words in a StarDict dictionary without loading it:
+	.idx and .syn files are memory-mapped, and the start position of
+	their records are kept in offset tables (arrays), which can be cached
+	in FILE.idx.offsets and FILE.syn.offsets files (cacheOffsets=True).
+	Words are found with bisect, in the same order as sortKeyBytes, so
+	case-insensitive lookup ignores the case of ASCII letters only.
+	Definitions are read from mapped .dict file, or from .dict.dz with
+	a cache of decompressed dictzip chunks.
+
+	usage:
+		lookup = StarDictLookup("/path/to/dict.ifo")
+		lookup.open()
+		for word, defis in lookup.lookup("hello"):
+			# defis is a list of (defi, defiFormat) tuples
+			...
+		lookup.close()
+	"""
+	offsetsCacheMagic = b"PyGlossary StarDict offsets"
+	offsetsCacheVersion = 1
+	# uncompressed bytes between access points of .dict.dz files that
+	# are not dictzipped
+	gzipIndexSpacing = 256 * 1024
+
+	def __init__(self, filename, cacheOffsets=False, blockCacheSize=64):
+		"""
+		cacheOffsets: save offset tables next to dictionary files,
+			and use them in the next open() if .idx/.syn are not changed
+			(and gzip access point index, if .dict.dz is not dictzipped)
+			disabled by default, because it writes files in the directory
+			of dictionary
+		blockCacheSize: number of decompressed .dict.dz chunks in memory
+		"""
+		if splitext(filename)[1].lower() == ".ifo":
+			filename = splitext(filename)[0]
+		self._filename = realpath(filename)
+		self._cacheOffsets = cacheOffsets
+		self._blockCacheSize = blockCacheSize
+		self._info = {}
+		self._files = []  # open files that are mapped
+		self._maps = []
+		self._idx = None  # OffsetTable
+		self._syn = None  # OffsetTable, or None if there is no .syn file
+		self._dict = None  # mmap, DictzipFile or IndexedGzipFile
+		self._offsetSize = 4
+
+	def open(self):
+		with open(self._filename+".ifo", "r", encoding="utf-8") as ifoFile:
+			for line in ifoFile:
+				key, eq, value = line.strip().partition("=")
+				if eq:
+					self._info[key] = value
+		if self._info.get("idxoffsetbits") == "64":
+			self._offsetSize = 8
+		sametypesequence = self._info.get("sametypesequence", "")
+		if not verifySameTypeSequence(sametypesequence):
+			raise ValueError("invalid sametypesequence=%r" % sametypesequence)
+
+		if isfile(self._filename+".idx"):
+			self._idx = self.loadOffsetTable(".idx", self._offsetSize + 4)
+		else:
+			self._idx = self.loadOffsetTable(".idx.gz", self._offsetSize + 4)
+		if isfile(self._filename+".syn"):
+			self._syn = self.loadOffsetTable(".syn", 4)
+
+		dictPath = self._filename+".dict"
+		if isfile(dictPath):
+			self._dict = self._mapFile(dictPath)
+		else:
+			try:
+				self._dict = DictzipFile(
+					dictPath+".dz",
+					cacheSize=self._blockCacheSize,
+				)
+			except ValueError:
+				log.info(
+					"%s.dz is not dictzipped, using gzip index" % dictPath
+				)
+				self._dict = IndexedGzipFile(
+					dictPath+".dz",
+					indexPath=dictPath+".dz.gzidx" if self._cacheOffsets else None,
+					spacing=self.gzipIndexSpacing,
+				)
+
+	def close(self):
+		if self._dict is not None and not isinstance(self._dict, bytes):
+			self._dict.close()
+		self._dict = None
+		for mm in self._maps:
+			mm.close()
+		for fileObj in self._files:
+			fileObj.close()
+		self._maps = []
+		self._files = []
+		self._idx = None
+		self._syn = None
+
+	def __len__(self):
+		return len(self._idx)
+
+	def getInfo(self, key):
+		return self._info.get(key, "")
+
+	def _mapFile(self, path):
+		if path.endswith(".gz"):
+			with gzip.open(path, "rb") as gzFile:
+				return gzFile.read()
+		fileObj = open(path, "rb")
+		if os.fstat(fileObj.fileno()).st_size == 0:
+			fileObj.close()
+			return b""
+		mm = mmap.mmap(fileObj.fileno(), 0, access=mmap.ACCESS_READ)
+		self._files.append(fileObj)
+		self._maps.append(mm)
+		return mm
+
+	def loadOffsetTable(self, ext, tailSize):
+		path = self._filename + ext
+		data = self._mapFile(path)
+		st = os.stat(path)
+		stamp = b"%d %d %d" % (st.st_size, st.st_mtime_ns, tailSize)
+		cachePath = "%s.%s.offsets" % (self._filename, ext.split(".")[1])
+		if self._cacheOffsets:
+			table = self.readOffsetsCache(cachePath, stamp, data, tailSize)
+			if table is not None:
+				return table
+		t0 = now()
+		table = self.buildOffsetTable(data, tailSize)
+		log.debug(
+			"Building offset table of %s took %.2f seconds" % (
+				path,
+				now() - t0,
+			)
+		)
+		if self._cacheOffsets:
+			self.writeOffsetsCache(cachePath, stamp, table)
+		return table
+
+	def buildOffsetTable(self, data, tailSize):
+		# 32-bit positions if file is smaller than 4 GiB
+		typecode = "I" if len(data) < 1 << 32 else "Q"
+		positions = array(typecode)
+		isSorted = True
+		lastKey = None
+		pos = 0
+		size = len(data)
+		while pos < size:
+			end = data.find(b"\x00", pos)
+			if end < 0 or end + 1 + tailSize > size:
+				log.error("%s is corrupted" % self._filename)
+				break
+			positions.append(pos)
+			if isSorted:
+				key = sortKeyBytes(data[pos:end])
+				if lastKey is not None and key < lastKey:
+					isSorted = False
+				lastKey = key
+			pos = end + 1 + tailSize
+		order = None
+		table = OffsetTable(data, tailSize, positions, None)
+		if not isSorted:
+			log.warning(
+				"%s is not sorted, sorting offset table" % self._filename
+			)
+			order = array("I", sorted(
+				range(len(positions)),
+				key=lambda index: sortKeyBytes(
+					self.getRecordWordByIndex(table, index),
+				),
+			))
+			table.order = order
+		return table
+
+	def readOffsetsCache(self, cachePath, stamp, data, tailSize):
+		"""
+		returns OffsetTable, or None if cache file is missing or outdated
+		"""
+		try:
+			with open(cachePath, "rb") as cacheFile:
+				header = cacheFile.readline().rstrip(b"\n").split(b" ")
+				if header[:2] != [
+					self.offsetsCacheMagic.replace(b" ", b"_"),
+					b"%d" % self.offsetsCacheVersion,
+				]:
+					return
+				if b" ".join(header[2:5]) != stamp:
+					return
+				typecode = header[5].decode("ascii")
+				count = int(header[6])
+				hasOrder = header[7] == b"1"
+				byteorder = header[8].decode("ascii")
+				if byteorder != sys.byteorder:
+					return
+				positions = array(typecode)
+				positions.fromfile(cacheFile, count)
+				order = None
+				if hasOrder:
+					order = array("I")
+					order.fromfile(cacheFile, count)
+		except (IOError, EOFError, ValueError, IndexError):
+			return
+		return OffsetTable(data, tailSize, positions, order)
+
+	def writeOffsetsCache(self, cachePath, stamp, table):
+		header = b" ".join([
+			self.offsetsCacheMagic.replace(b" ", b"_"),
+			b"%d" % self.offsetsCacheVersion,
+			stamp,
+			table.positions.typecode.encode("ascii"),
+			b"%d" % len(table.positions),
+			b"1" if table.order is not None else b"0",
+			sys.byteorder.encode("ascii"),
+		])
+		try:
+			with open(cachePath, "wb") as cacheFile:
+				cacheFile.write(header + b"\n")
+				table.positions.tofile(cacheFile)
+				if table.order is not None:
+					table.order.tofile(cacheFile)
+		except IOError as e:
+			log.debug("can not write offsets cache %s: %s" % (cachePath, e))
+
+	def getRecordWordByIndex(self, table, index):
+		data = table.data
+		pos = table.positions[index]
+		return data[pos:data.find(b"\x00", pos)]
+
+	def getRecordWord(self, table, sortedIndex):
+		return self.getRecordWordByIndex(table, table.recordIndex(sortedIndex))
+
+	def getRecordTail(self, table, index):
+		"""
+		returns the fields after null terminator, as bytes
+		"""
+		data = table.data
+		pos = data.find(b"\x00", table.positions[index]) + 1
+		return data[pos:pos+table.tailSize]
+
+	def getWord(self, wordIndex):
+		"""
+		returns headword of `wordIndex`-th record of .idx file (str)
+		"""
+		return self.getRecordWordByIndex(self._idx, wordIndex).decode("utf-8")
+
+	def getDefinitions(self, wordIndex):
+		"""
+		returns a list of (defi, defiFormat) tuples
+		"""
+		tail = self.getRecordTail(self._idx, wordIndex)
+		offset = binStrToInt(tail[:self._offsetSize])
+		size = binStrToInt(tail[self._offsetSize:])
+		b_block = self.readDictBlock(offset, size)
+		sametypesequence = self._info.get("sametypesequence", "")
+		if len(sametypesequence) == 1:
+			defisData = [(b_block, ord(sametypesequence))]
+		elif sametypesequence:
+			defisData = self.parseDefiBlockCompact(b_block, sametypesequence)
+		else:
+			defisData = self.parseDefiBlockGeneral(b_block)
+		if defisData is None:
+			log.error("Data file is corrupted. Word index %s" % wordIndex)
+			return []
+		return [
+			(
+				b_defi.decode("utf-8"),
+				defiFormatByType.get(chr(defiFormatCode), ""),
+			)
+			for b_defi, defiFormatCode in defisData
+		]
+
+	def readDictBlock(self, offset, size):
+		dictData = self._dict
+		if isinstance(dictData, DictzipFile):
+			return dictData.read(offset, size)
+		if isinstance(dictData, IndexedGzipFile):
+			dictData.seek(offset)
+			return dictData.read(size)
+		return dictData[offset:offset+size]
+
+	parseDefiBlockCompact = Reader.parseDefiBlockCompact
+	parseDefiBlockGeneral = Reader.parseDefiBlockGeneral
+
+	def _iterRange(self, table, b_lowerPrefix, exact):
+		"""
+		yields (b_word, recordIndex) of records whose lowercase word
+		is `b_lowerPrefix` (if exact=True) or starts with it
+		"""
+		sortedIndex = bisect_left(
+			OffsetTableKeys(self, table),
+			(b_lowerPrefix,),
+		)
+		while sortedIndex < len(table):
+			index = table.recordIndex(sortedIndex)
+			b_word = self.getRecordWordByIndex(table, index)
+			b_lower = b_word.lower()
+			if exact:
+				if b_lower != b_lowerPrefix:
+					break
+			elif not b_lower.startswith(b_lowerPrefix):
+				break
+			yield b_word, index
+			sortedIndex += 1
+
+	def _synWordIndex(self, synIndex):
+		return binStrToInt(self.getRecordTail(self._syn, synIndex))
+
+	def find(self, word, ignoreCase=False):
+		"""
+		returns sorted list of indexes of .idx records that match `word`,
+		by headword or by synonym
+		"""
+		b_word = word.encode("utf-8")
+		b_lower = b_word.lower()
+		wordIndexes = set()
+		for b_match, index in self._iterRange(self._idx, b_lower, True):
+			if ignoreCase or b_match == b_word:
+				wordIndexes.add(index)
+		if self._syn is not None:
+			for b_match, index in self._iterRange(self._syn, b_lower, True):
+				if ignoreCase or b_match == b_word:
+					wordIndex = self._synWordIndex(index)
+					if wordIndex < len(self._idx):
+						wordIndexes.add(wordIndex)
+		return sorted(wordIndexes)
+
+	def lookup(self, word, ignoreCase=False):
+		"""
+		returns a list of (headword, defis) tuples
+		where defis is a list of (defi, defiFormat) tuples
+		"""
+		return [
+			(self.getWord(wordIndex), self.getDefinitions(wordIndex))
+			for wordIndex in self.find(word, ignoreCase=ignoreCase)
+		]
+
+	def prefix(self, prefix, limit=None, ignoreCase=False):
+		"""
+		returns sorted list of words (headwords and synonyms)
+		that start with `prefix`, at most `limit` words
+		"""
+		b_prefix = prefix.encode("utf-8")
+		b_lower = b_prefix.lower()
+		tables = [self._idx]
+		if self._syn is not None:
+			tables.append(self._syn)
+		b_words = set()
+		for table in tables:
+			count = 0
+			for b_word, _ in self._iterRange(table, b_lower, False):
+				if not ignoreCase and not b_word.startswith(b_prefix):
+					continue
+				if b_word in b_words:
+					continue
+				b_words.add(b_word)
+				count += 1
+				if limit is not None and count >= limit:
+					break
+		words = sorted(b_words, key=sortKeyBytes)
+		if limit is not None:
+			words = words[:limit]
+		return [b_word.decode("utf-8") for b_word in words]
+
+
+class SynonymList(object):
+	"""
+	list of (b_alt, wordIndex) tuples for .syn file, stored as a packed
+	byte arena (alternates with null terminators) and two arrays (start
+	offset in arena, and word index), instead of millions of tuples
+	"""
+	def __init__(self):
+		self._arena = bytearray()
+		self._offsets = array("Q")
+		self._wordIndexes = array("I")
+
+	def __len__(self):
+		return len(self._wordIndexes)
+
+	def append(self, b_alt, wordIndex):
+		self._offsets.append(len(self._arena))
+		self._arena += b_alt
+		self._arena += b"\x00"
+		self._wordIndexes.append(wordIndex)
+
+	def getAlt(self, index):
+		beg = self._offsets[index]
+		if index + 1 < len(self._offsets):
+			end = self._offsets[index + 1] - 1
+		else:
+			end = len(self._arena) - 1
+		return bytes(self._arena[beg:end])
+
+	def getArenaSize(self):
+		return len(self._arena)
+
+	def iterRecords(self, start=0):
+		"""
+		yields .syn records (bytes) in order of appending
+		"""
+		arena = self._arena
+		offsets = self._offsets
+		wordIndexes = self._wordIndexes
+		count = len(wordIndexes)
+		for index in range(start, count):
+			end = offsets[index + 1] if index + 1 < count else len(arena)
+			yield bytes(arena[offsets[index]:end]) + \
+				synTailStruct.pack(wordIndexes[index])
+
+	def iterSortKeys(self):
+		"""
+		yields a sort key (bytes) for each record, which gives the same
+		order as sorting (sortKeyBytes(b_alt), wordIndex) tuples:
+			b_alt.lower() + b"\x00" + b_alt + b"\x00" + wordIndex (4 bytes)
+		the .syn record is the second half of sort key: key[len(b_alt)+1:]
+		"""
+		for index in range(len(self._wordIndexes)):
+			b_alt = self.getAlt(index)
+			yield b_alt.lower() + b"\x00" + b_alt + b"\x00" + \
+				synTailStruct.pack(self._wordIndexes[index])
+
+	@classmethod
+	def fromSynBytes(cls, synBytes):
+		"""
+		load from .syn records, like the ones in .syn.checkpoint file
+		"""
+		synList = cls()
+		pos = 0
+		size = len(synBytes)
+		while pos < size:
+			end = synBytes.find(b"\x00", pos)
+			synList._offsets.append(len(synList._arena))
+			synList._arena += synBytes[pos:end+1]
+			synList._wordIndexes.append(
+				synTailStruct.unpack_from(synBytes, end + 1)[0]
+			)
+			pos = end + 5
+		return synList
 
 
 class Writer(object):
+	# maximum number of definition hashes kept for dedup
+	# (about 100 bytes per hash in memory)
+	dedupTableSize = 200000
+	# number of entries that are checked before choosing compact mode
+	compactSampleSize = 1000
+	# .dict offsets from this are written as 64-bit (idxoffsetbits=64)
+	offset32Limit = 1 << 32
+	# buffer size of .dict and .idx files
+	writeBufferSize = 4 * 1024 ** 2
+	# synonyms are sorted in memory up to this count,
+	# and with external sort (chunks of synSortChunkBytes) beyond it
+	synInMemorySortMax = 2000000
+	synSortChunkBytes = defaultChunkBytes
+
 	def __init__(self, glos):
 		self._glos = glos
+		self._dedup = False
+		self._resDB = None
 
 	def write(
 		self,
 		filename,
 		dictzip=True,
+		dedup=False,
+		resdb=False,
 	):
+		"""
+		dedup: write identical definition blocks only once into .dict file
+			and point their .idx records to the same offset and size
+			only the `dedupTableSize` most recent definitions are checked
+		resdb: write resource files into StarDict resource database
+			(res.rifo, res.ridx, res.rdic) instead of "res" directory
+		"""
+		self._dedup = dedup
 		fileBasePath = ""
 		##
 		if splitext(filename)[1].lower() == ".ifo":
@@ -441,82 +1050,267 @@ class Writer(object):
 			fileBasePath = realpath(fileBasePath)
 		self._filename = fileBasePath
 		self._resDir = join(dirname(self._filename), "res")
+		if resdb:
+			self._resDB = ResourceDBWriter(dirname(self._filename))
 
-		self.writeGeneral()
-#		if self.glossaryHasAdditionalDefinitions():
-#			self.writeGeneral()
-#		else:
-#			defiFormat = self.detectMainDefinitionFormat()
-#			if defiFormat == None:
-#				self.writeGeneral()
-#			else:
-#				self.writeCompact(defiFormat)
+		self.writeEntries()
 
 		if dictzip:
 			runDictzip(self._filename)
+			if resdb and isfile(join(dirname(self._filename), "res.rdic")):
+				runDictzip(join(dirname(self._filename), "res"), ext=".rdic")
 
-#	def writeCompact(self, defiFormat):
-#		"""
-#		Build StarDict dictionary with sametypesequence option specified.
-#		Every item definition consists of a single article.
-#		All articles have the same format, specified in defiFormat parameter.
-#
-#		Parameters:
-#		defiFormat - format of article definition: h - html, m - plain text
-#		"""
-#		dictMark = 0
-#		idxBytes = b""
-#		dictStr = ""
-#		altIndexList = [] # contains tuples (b"alternate", wordIndex)
-#		for i, entry in enumerate(self._glos):
-#			words = entry.getWords()
-#			defi = entry.getDefi()
-#			for alt in words[1:]:
-#				altIndexList.append((alt.encode("utf-8"), i))
-#			dictStr += defi
-#			defiLen = len(defi)
-#			idxBytes += words[0] + b"\x00" + intToBinStr(dictMark, 4) + \
-#				intToBinStr(defiLen, 4)
-#			dictMark += defiLen
-#		wordCount = i + 1
-#		with open(self._filename+".dict", "wb") as dictFile:
-#			dictFile.write(dictStr)
-#		with open(self._filename+".idx", "wb") as idxFile:
-#			idxFile.write(idxBytes)
-#		indexFileSize = len(idxBytes)
-#		del idxBytes, dictStr
-#
-#		self.writeSynFile(altIndexList)
-#		self.writeIfoFile(
-#			wordCount,
-#			indexFileSize,
-#			len(altIndexList),
-#			defiFormat,
-#		)
-
-	def writeGeneral(self):
-		"""
-		Build StarDict dictionary in general case.
-		Every item definition may consist of an arbitrary number of articles.
-		sametypesequence option is not used.
+	def sampleCompactFormat(self, sample):
 		"""
-		dictMark = 0
-		altIndexList = []  # list of tuples (b"alternate", wordIndex)
+		sample: list of first entries of glossary
 
-		dictFile = open(self._filename+".dict", "wb")
-		idxFile = open(self._filename+".idx", "wb")
-		indexFileSize = 0
+		returns the common definition format ("h" or "m") of entries,
+		if the glossary is suitable for compact (sametypesequence) mode,
+		or None otherwise
+		uses glossary statistics if they are known, and sample entries
+		compact mode may still fall back to general mode while writing
+		"""
+		stats = self._glos.getStats()
+		if stats.get("multiDefiCount"):
+			return None
+		formatsCount = stats.getMostUsedDefiFormats()
+		if formatsCount and len(formatsCount) > 1:
+			return None
+		compactFormat = None
+		for entry in sample:
+			if entry.isData():
+				continue
+			if len(entry.getDefis()) > 1:
+				return None
+			entry.detectDefiFormat()
+			defiFormat = entry.getDefiFormat()
+			if defiFormat not in ("m", "h"):
+				defiFormat = "m"
+			if compactFormat is None:
+				compactFormat = defiFormat
+			elif defiFormat != compactFormat:
+				return None
+		return compactFormat
+
+	def rewriteIdxFile(
+		self,
+		indexFileSize,
+		offsetSize,
+		newOffsetSize,
+		blockFunc=None,
+	):
+		"""
+		rewrite the part of .idx file that is written so far
+		records are streamed (in chunks of writeBufferSize bytes) into
+		a temporary file, which then replaces .idx file
 
+		indexFileSize: size of .idx file written so far
+		offsetSize, newOffsetSize: size of offsets (4 or 8 bytes)
+			in current and new .idx file
+		blockFunc: optional function that is given (offset, size) of
+			each dict block, and returns the new (offset, size)
+
+		returns new size of .idx file
+		"""
+		idxPath = self._filename+".idx"
+		tailStruct = idxTailStructs[offsetSize]
+		tailSize = tailStruct.size
+		newTailStruct = idxTailStructs[newOffsetSize]
+		newIndexFileSize = 0
+		with open(idxPath, "rb") as idxFile, \
+			open(idxPath+".tmp", "wb") as newIdxFile:
+			buf = b""
+			remaining = indexFileSize
+			while remaining > 0:
+				chunk = idxFile.read(min(self.writeBufferSize, remaining))
+				if not chunk:
+					raise IOError("%s is truncated" % idxPath)
+				remaining -= len(chunk)
+				buf += chunk
+				parts = []
+				pos = 0
+				while True:
+					tailPos = buf.find(b"\x00", pos) + 1
+					if tailPos == 0 or tailPos + tailSize > len(buf):
+						break
+					parts.append(buf[pos:tailPos])  # including null terminator
+					offset, size = tailStruct.unpack_from(buf, tailPos)
+					if blockFunc:
+						offset, size = blockFunc(offset, size)
+					parts.append(newTailStruct.pack(offset, size))
+					pos = tailPos + tailSize
+				buf = buf[pos:]
+				data = b"".join(parts)
+				newIdxFile.write(data)
+				newIndexFileSize += len(data)
+			if buf:
+				raise IOError("%s is truncated" % idxPath)
+		os.replace(idxPath+".tmp", idxPath)
+		return newIndexFileSize
+
+	def compactToGeneral(self, compactFormat, indexFileSize, offsetSize):
+		"""
+		convert .dict and .idx files that are written so far in compact
+		mode (sametypesequence=compactFormat) into general mode
+		shared blocks (dedup) remain shared
+
+		returns (dictMark, indexFileSize, offsetSize) of new files
+		"""
+		log.info(
+			"Switching from compact (sametypesequence) to general mode"
+		)
 		t0 = now()
+		dictPath = self._filename+".dict"
+		os.rename(dictPath, dictPath+".compact")
+		b_type = compactFormat.encode("ascii")
+		newOffsets = {}  # old offset => new offset
+		newDictMark = 0
+		# every block grows by 2 bytes, and every .idx record is bigger
+		# than 2 bytes, so this is an upper bound of new .dict size
+		if os.path.getsize(dictPath+".compact") + indexFileSize >= \
+			self.offset32Limit:
+			newOffsetSize = 8
+		else:
+			newOffsetSize = offsetSize
+
+		with open(dictPath+".compact", "rb") as oldDictFile, \
+			open(dictPath, "wb") as dictFile:
+			def blockFunc(offset, size):
+				nonlocal newDictMark
+				newOffset = newOffsets.get(offset)
+				if newOffset is None:
+					oldDictFile.seek(offset)
+					dictFile.write(
+						b_type + oldDictFile.read(size) + b"\x00"
+					)
+					newOffset = newOffsets[offset] = newDictMark
+					newDictMark += size + 2
+				return newOffset, size + 2
+
+			indexFileSize = self.rewriteIdxFile(
+				indexFileSize,
+				offsetSize,
+				newOffsetSize,
+				blockFunc=blockFunc,
+			)
+		os.remove(dictPath+".compact")
+		log.info("Switching to general mode took %.2f seconds" % (now() - t0))
+		return newDictMark, indexFileSize, newOffsetSize
+
+	def openBuffered(self, ext, size=None):
+		"""
+		opens .dict or .idx file for writing, with a large buffer
+		if `size` is given, file is truncated to `size` bytes and
+		we continue writing from there
+		"""
+		filename = self._filename + ext
+		if size is None:
+			return open(filename, "wb", buffering=self.writeBufferSize)
+		fileObj = open(filename, "r+b", buffering=self.writeBufferSize)
+		fileObj.truncate(size)
+		fileObj.seek(size)
+		return fileObj
+
+	def writeEntries(self):
+		"""
+		Build StarDict dictionary.
+
+		If all entries have a single definition with the same format,
+		sametypesequence option is used (compact mode): dict blocks
+		have no type byte or null terminator.
+		That is decided by glossary statistics and the first
+		`compactSampleSize` entries; if a later entry does not fit,
+		we switch to general mode (convert what is written so far).
+
+		In general case, every item definition may consist of an arbitrary
+		number of articles, and sametypesequence option is not used.
+
+		Offsets in .idx file are 32-bit, until .dict file passes 4 GiB,
+		then .idx file is converted to 64-bit offsets (idxoffsetbits=64).
+		"""
+		dictMark = 0
+		altIndexList = SynonymList()
+		indexFileSize = 0
 		wordCount = 0
+		offsetSize = 4  # size of offsets in .idx file, in bytes
+		glosIter = iter(self._glos)
+
+		resumeState = self._glos.getResumeWriterState()
+		if resumeState:
+			dictMark = resumeState["dictMark"]
+			indexFileSize = resumeState["indexFileSize"]
+			wordCount = resumeState["wordCount"]
+			compactFormat = resumeState["compactFormat"]
+			offsetSize = resumeState["offsetBits"] // 8
+			dictFile = self.openBuffered(".dict", dictMark)
+			idxFile = self.openBuffered(".idx", indexFileSize)
+			altIndexList = self.readAltsCheckpoint(
+				resumeState["altsFileSize"],
+			)
+			altsCheckpointFile = openTruncated(
+				self._filename+".syn.checkpoint",
+				resumeState["altsFileSize"],
+			)
+		else:
+			sample = list(islice(glosIter, self.compactSampleSize))
+			compactFormat = self.sampleCompactFormat(sample)
+			glosIter = chain(sample, glosIter)
+			dictFile = self.openBuffered(".dict")
+			idxFile = self.openBuffered(".idx")
+			altsCheckpointFile = open(self._filename+".syn.checkpoint", "wb")
+
+		if compactFormat:
+			log.info("Using compact mode: sametypesequence=%s" % compactFormat)
+
+		altsCheckpointCount = len(altIndexList)
+
+		resDB = self._resDB
+
+		def checkpointState():
+			nonlocal altsCheckpointCount
+			dictFile.flush()
+			idxFile.flush()
+			altsCheckpointFile.write(b"".join(
+				altIndexList.iterRecords(altsCheckpointCount)
+			))
+			altsCheckpointFile.flush()
+			altsCheckpointCount = len(altIndexList)
+			return {
+				"dictMark": dictMark,
+				"indexFileSize": indexFileSize,
+				"wordCount": wordCount,
+				"altsFileSize": altsCheckpointFile.tell(),
+				"compactFormat": compactFormat,
+				"offsetBits": offsetSize * 8,
+				"resDB": (
+					resDB.checkpointState()
+					if resDB is not None else None
+				),
+			}
+
+		t0 = now()
 		defiFormatCounter = Counter()
-		if not isdir(self._resDir):
+		if resDB is not None:
+			resDB.open(resumeState["resDB"] if resumeState else None)
+		elif not isdir(self._resDir):
 			os.mkdir(self._resDir)
 
-		entryI = -1
-		for entry in self._glos:
+		# dedupTable: sha1 digest of dict block => offset of dict block
+		# in LRU order, bounded to self.dedupTableSize
+		dedupTable = odict() if self._dedup else None
+		dedupCount = 0
+		dedupBytes = 0
+
+		idxTailStruct = idxTailStructs[offsetSize]
+
+		entryI = wordCount - 1
+		self._glos.setCheckpointWriter(checkpointState)
+		for entry in glosIter:
 			if entry.isData():
-				entry.save(self._resDir)
+				if resDB is not None:
+					resDB.add(entry.getFileName(), entry.getData())
+				else:
+					entry.save(self._resDir)
 				continue
 			entryI += 1
 
@@ -531,38 +1325,104 @@ class Writer(object):
 				defiFormat = "m"
 			assert isinstance(defiFormat, str) and len(defiFormat) == 1
 
-			b_dictBlock = b""
+			if compactFormat and (
+				len(defis) > 1 or defiFormat != compactFormat
+			):
+				self._glos.invalidateCheckpoint()
+				dictFile.close()
+				idxFile.close()
+				dictMark, indexFileSize, offsetSize = self.compactToGeneral(
+					compactFormat,
+					indexFileSize,
+					offsetSize,
+				)
+				dictFile = self.openBuffered(".dict", dictMark)
+				idxFile = self.openBuffered(".idx", indexFileSize)
+				idxTailStruct = idxTailStructs[offsetSize]
+				compactFormat = None
+				if dedupTable is not None:
+					dedupTable.clear()
 
 			for alt in words[1:]:
-				altIndexList.append((alt.encode("utf-8"), entryI))
-
-			b_dictBlock += (defiFormat + defis[0]).encode("utf-8") + b"\x00"
+				altIndexList.append(alt.encode("utf-8"), entryI)
 
-			for altDefi in defis[1:]:
-				b_dictBlock += (defiFormat + altDefi).encode("utf-8") + b"\x00"
-
-			dictFile.write(b_dictBlock)
+			if compactFormat:
+				b_dictBlock = defis[0].encode("utf-8")
+			else:
+				b_dictBlock = b"".join([
+					(defiFormat + defi).encode("utf-8") + b"\x00"
+					for defi in defis
+				])
 
 			blockLen = len(b_dictBlock)
+			blockOffset = None
+			if dedupTable is not None:
+				blockHash = sha1(b_dictBlock).digest()
+				blockOffset = dedupTable.get(blockHash)
+				if blockOffset is None:
+					dedupTable[blockHash] = dictMark
+					if len(dedupTable) > self.dedupTableSize:
+						dedupTable.popitem(last=False)
+				else:
+					dedupTable.move_to_end(blockHash)
+					dedupCount += 1
+					dedupBytes += blockLen
+
+			if blockOffset is None:
+				dictFile.write(b_dictBlock)
+				blockOffset = dictMark
+				dictMark += blockLen
+
+			if offsetSize == 4 and blockOffset >= self.offset32Limit:
+				log.info("Switching to 64-bit offsets in .idx file")
+				self._glos.invalidateCheckpoint()
+				idxFile.close()
+				indexFileSize = self.rewriteIdxFile(indexFileSize, 4, 8)
+				idxFile = self.openBuffered(".idx", indexFileSize)
+				offsetSize = 8
+				idxTailStruct = idxTailStructs[8]
+
 			b_idxBlock = word.encode("utf-8") + b"\x00" + \
-				intToBinStr(dictMark, 4) + \
-				intToBinStr(blockLen, 4)
+				idxTailStruct.pack(blockOffset, blockLen)
 			idxFile.write(b_idxBlock)
 
-			dictMark += blockLen
 			indexFileSize += len(b_idxBlock)
 
 			wordCount += 1
 
 		dictFile.close()
 		idxFile.close()
-		if not os.listdir(self._resDir):
+		altsCheckpointFile.close()
+		os.remove(self._filename+".syn.checkpoint")
+		if resDB is not None:
+			resCount = resDB.close()
+			log.info("Wrote %s files into resource database" % resCount)
+		elif not os.listdir(self._resDir):
 			os.rmdir(self._resDir)
 		log.info("Writing dict file took %.2f seconds" % (now() - t0))
+		if dedupTable is not None:
+			log.info(
+				"Dedup: %s definitions were shared" % dedupCount +
+				", saved %s bytes" % dedupBytes
+			)
 		log.pretty(defiFormatCounter.most_common(), "defiFormatsCount: ")
 
 		self.writeSynFile(altIndexList)
-		self.writeIfoFile(wordCount, indexFileSize, len(altIndexList))
+		self.writeIfoFile(
+			wordCount,
+			indexFileSize,
+			len(altIndexList),
+			sametypesequence=compactFormat,
+			idxoffsetbits=offsetSize * 8,
+		)
+
+	def readAltsCheckpoint(self, fileSize):
+		"""
+		read alternates that are saved by the last checkpoint
+		returns a SynonymList
+		"""
+		with open(self._filename+".syn.checkpoint", "rb") as fp:
+			return SynonymList.fromSynBytes(fp.read(fileSize))
 
 	def writeSynFile(self, altIndexList):
 		"""
@@ -571,29 +1431,32 @@ class Writer(object):
 		if not altIndexList:
 			return
 
-		log.info("Sorting %s synonyms..." % len(altIndexList))
+		count = len(altIndexList)
+		log.info("Sorting and writing %s synonyms..." % count)
 		t0 = now()
 
-		altIndexList.sort(
-			key=lambda x: sortKeyBytes(x[0])
-		)
-		# 28 seconds with old sort key (converted from custom cmp)
-		# 0.63 seconds with my new sort key
-		# 0.20 seconds without key function (default sort)
+		# sort keys are plain bytes (see SynonymList.iterSortKeys),
+		# so they are compared in C, without a key function
+		if count <= self.synInMemorySortMax:
+			sortedKeys = sorted(altIndexList.iterSortKeys())
+		else:
+			sortedKeys = externalSortStream(
+				altIndexList.iterSortKeys(),
+				self.synSortChunkBytes,
+				sizeFunc=len,
+			)
 
-		log.info("Sorting %s synonyms took %.2f seconds" % (
-			len(altIndexList),
-			now() - t0,
-		))
-		log.info("Writing %s synonyms..." % len(altIndexList))
-		t0 = now()
-		with open(self._filename+".syn", "wb") as synFile:
-			synFile.write(b"".join([
-				b_alt + b"\x00" + intToBinStr(wordIndex, 4)
-				for b_alt, wordIndex in altIndexList
-			]))
-		log.info("Writing %s synonyms took %.2f seconds" % (
-			len(altIndexList),
+		with open(
+			self._filename+".syn",
+			"wb",
+			buffering=self.writeBufferSize,
+		) as synFile:
+			for key in sortedKeys:
+				# key: b_alt.lower() + b"\x00" + b_alt + b"\x00" + wordIndex
+				synFile.write(key[(len(key) - 4) // 2:])
+
+		log.info("Sorting and writing %s synonyms took %.2f seconds" % (
+			count,
 			now() - t0,
 		))
 
@@ -603,6 +1466,7 @@ class Writer(object):
 		indexFileSize,
 		synwordcount,
 		sametypesequence=None,
+		idxoffsetbits=32,
 	):
 		"""
 		Build .ifo file
@@ -616,6 +1480,8 @@ class Writer(object):
 			ifoStr += "sametypesequence=%s\n" % sametypesequence
 		if synwordcount > 0:
 			ifoStr += "synwordcount=%s\n" % synwordcount
+		if idxoffsetbits != 32:
+			ifoStr += "idxoffsetbits=%s\n" % idxoffsetbits
 		for key in infoKeys:
 			if key in (
 				"bookname",
@@ -637,33 +1503,6 @@ class Writer(object):
 		with open(self._filename+".ifo", "w", encoding="utf-8") as ifoFile:
 			ifoFile.write(ifoStr)
 
-	def glossaryHasAdditionalDefinitions(self):
-		"""
-		Search for additional definitions in the glossary.
-		We need to know if the glossary contains additional definitions
-		to make the decision on the format of the StarDict dictionary.
-		"""
-		for entry in self._glos:
-			if len(entry.getDefis()) > 1:
-				return True
-		return False
-
-	def detectMainDefinitionFormat(self):
-		"""
-		Scan main definitions of the glossary.
-		Return format common to all definitions: "h" or "m"
-
-		If definitions has different formats return None.
-		"""
-		self._glos.setDefaultDefiFormat("m")
-		formatsCount = self._glos.getMostUsedDefiFormats()
-		if not formatsCount:
-			return None
-		if len(formatsCount) > 1:  # FIXME
-			return None
-
-		return formatsCount[0]
-
 
 def write(glos, filename, **kwargs):
 	writer = Writer(glos)
@@ -0,0 +1,297 @@
+import sys
+import os
+import zlib
+import gzip
+import shutil
+import tempfile
+import unittest
+from struct import pack
+from os.path import dirname, abspath, join, isfile
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from pyglossary.tests_common import getPlugin
+from pyglossary.glossary import Glossary
+
+stardict = getPlugin("Stardict")
+
+# (word, definition), not sorted
+entries = [
+	("Zebra", "striped animal"),
+	("apple", "a fruit"),
+	("Apple", "a company"),
+	("apples", "more than one apple"),
+	("banana", "yellow fruit"),
+	("bär", "bear in German"),
+	("appendix", "part of a book"),
+	("cat", "small animal"),
+]
+# (synonym, index of word in entries)
+synonyms = [
+	("pomme", 1),
+	("APPLE", 2),
+	("kitty", 7),
+	("appel", 1),
+]
+
+
+def writeDictzip(filename, data, chunkLen=100):
+	"""
+	writes `data` into a dictzip file, with chunks of `chunkLen` bytes
+	"""
+	compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+	chunks = []
+	for pos in range(0, len(data), chunkLen):
+		chunk = compressor.compress(data[pos:pos + chunkLen])
+		if pos + chunkLen < len(data):
+			chunk += compressor.flush(zlib.Z_FULL_FLUSH)
+		else:
+			chunk += compressor.flush()
+		chunks.append(chunk)
+	subData = pack("<HHH", 1, chunkLen, len(chunks))
+	subData += pack("<%dH" % len(chunks), *[len(chunk) for chunk in chunks])
+	extra = b"RA" + pack("<H", len(subData)) + subData
+	with open(filename, "wb") as fp:
+		fp.write(b"\x1f\x8b\x08\x04" + b"\x00" * 4 + b"\x00\x03")
+		fp.write(pack("<H", len(extra)) + extra)
+		for chunk in chunks:
+			fp.write(chunk)
+		fp.write(pack("<II", zlib.crc32(data), len(data)))
+
+
+class StarDictLookupTest(unittest.TestCase):
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+		self.filename = join(self.tmpDir, "test")
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def writeDict(self, entries, synonyms, sort=True, dictExt=".dict"):
+		"""
+		writes .ifo, .idx, .syn and dictionary files by hand
+		synonyms: list of (alt, index of word in entries)
+		if sort=False, records of .idx and .syn are written in given order
+		"""
+		b_dict = b""
+		idxRecords = []
+		for word, defi in entries:
+			b_defi = defi.encode("utf-8")
+			idxRecords.append(
+				word.encode("utf-8") + b"\x00" +
+				pack(">II", len(b_dict), len(b_defi))
+			)
+			b_dict += b_defi
+		newIndex = list(range(len(entries)))
+		if sort:
+			order = sorted(
+				range(len(entries)),
+				key=lambda index: stardict.sortKeyBytes(
+					entries[index][0].encode("utf-8")
+				),
+			)
+			idxRecords = [idxRecords[index] for index in order]
+			for sortedIndex, index in enumerate(order):
+				newIndex[index] = sortedIndex
+			synonyms = sorted(
+				synonyms,
+				key=lambda item: stardict.sortKeyBytes(item[0].encode("utf-8")),
+			)
+		synRecords = [
+			alt.encode("utf-8") + b"\x00" + pack(">I", newIndex[wordIndex])
+			for alt, wordIndex in synonyms
+		]
+		b_idx = b"".join(idxRecords)
+		with open(self.filename + ".idx", "wb") as fp:
+			fp.write(b_idx)
+		with open(self.filename + ".syn", "wb") as fp:
+			fp.write(b"".join(synRecords))
+		if dictExt == ".dict":
+			with open(self.filename + ".dict", "wb") as fp:
+				fp.write(b_dict)
+		elif dictExt == ".dict.dz":
+			writeDictzip(self.filename + ".dict.dz", b_dict, chunkLen=16)
+		elif dictExt == ".dict.gz":
+			# gzip file that is not dictzipped
+			with open(self.filename + ".dict.dz", "wb") as fp:
+				fp.write(gzip.compress(b_dict))
+		with open(self.filename + ".ifo", "w", encoding="utf-8") as fp:
+			fp.write("\n".join([
+				"StarDict's dict ifo file",
+				"version=3.0.0",
+				"bookname=test",
+				"wordcount=%d" % len(entries),
+				"synwordcount=%d" % len(synonyms),
+				"idxfilesize=%d" % len(b_idx),
+				"sametypesequence=m",
+			]) + "\n")
+
+	def openLookup(self, **kwargs):
+		lookup = stardict.StarDictLookup(self.filename + ".ifo", **kwargs)
+		lookup.open()
+		self.addCleanup(lookup.close)
+		return lookup
+
+	def assertLookups(self, lookup, entries=entries):
+		self.assertEqual(len(lookup), len(entries))
+		self.assertEqual(
+			lookup.lookup("apple"),
+			[("apple", [("a fruit", "m")])],
+		)
+		self.assertEqual(
+			sorted(lookup.lookup("apple", ignoreCase=True)),
+			[
+				("Apple", [("a company", "m")]),
+				("apple", [("a fruit", "m")]),
+			],
+		)
+		self.assertEqual(
+			lookup.lookup("bär"),
+			[("bär", [("bear in German", "m")])],
+		)
+		self.assertEqual(lookup.lookup("appl"), [])
+		self.assertEqual(lookup.lookup("zebra"), [])
+		self.assertEqual(
+			lookup.lookup("zebra", ignoreCase=True),
+			[("Zebra", [("striped animal", "m")])],
+		)
+		for word, defi in entries:
+			self.assertEqual(lookup.lookup(word), [(word, [(defi, "m")])])
+
+	def test_exact(self):
+		self.writeDict(entries, synonyms)
+		lookup = self.openLookup()
+		self.assertLookups(lookup)
+		self.assertEqual(lookup.getInfo("bookname"), "test")
+
+	def test_prefix(self):
+		self.writeDict(entries, synonyms)
+		lookup = self.openLookup()
+		self.assertEqual(
+			lookup.prefix("app"),
+			["appel", "appendix", "apple", "apples"],
+		)
+		self.assertEqual(
+			lookup.prefix("app", ignoreCase=True),
+			["appel", "appendix", "APPLE", "Apple", "apple", "apples"],
+		)
+		self.assertEqual(
+			lookup.prefix("app", limit=2),
+			["appel", "appendix"],
+		)
+		self.assertEqual(lookup.prefix("x"), [])
+
+	def test_synonyms(self):
+		self.writeDict(entries, synonyms)
+		lookup = self.openLookup()
+		self.assertEqual(
+			lookup.lookup("pomme"),
+			[("apple", [("a fruit", "m")])],
+		)
+		self.assertEqual(
+			lookup.lookup("kitty"),
+			[("cat", [("small animal", "m")])],
+		)
+		# by headword "Apple" and synonym "APPLE" of the same word
+		self.assertEqual(
+			lookup.find("apple", ignoreCase=True),
+			lookup.find("Apple") + lookup.find("apple"),
+		)
+		self.assertEqual(lookup.find("APPLE"), lookup.find("Apple"))
+
+	def test_unsorted(self):
+		self.writeDict(entries, synonyms, sort=False)
+		with self.assertLogs("root", "WARNING"):
+			lookup = self.openLookup()
+		self.assertLookups(lookup)
+		self.assertEqual(
+			lookup.prefix("app"),
+			["appel", "appendix", "apple", "apples"],
+		)
+		# indexes are record indexes of .idx file, in file order
+		self.assertEqual(lookup.find("apple"), [1])
+		self.assertEqual(lookup.getWord(0), "Zebra")
+
+	def test_dictzip(self):
+		self.writeDict(entries, synonyms, dictExt=".dict.dz")
+		lookup = self.openLookup(blockCacheSize=2)
+		self.assertIsInstance(lookup._dict, stardict.DictzipFile)
+		self.assertLookups(lookup)
+
+	def test_gzip(self):
+		self.writeDict(entries, synonyms, dictExt=".dict.gz")
+		lookup = self.openLookup()
+		self.assertIsInstance(lookup._dict, stardict.IndexedGzipFile)
+		self.assertLookups(lookup)
+		self.assertFalse(isfile(self.filename + ".dict.dz.gzidx"))
+
+	def test_offsets_cache(self):
+		self.writeDict(entries, synonyms, sort=False, dictExt=".dict.gz")
+		self.openLookup().close()
+		# cache files are only written with cacheOffsets=True
+		for ext in (".idx.offsets", ".syn.offsets", ".dict.dz.gzidx"):
+			self.assertFalse(isfile(self.filename + ext), ext)
+		self.openLookup(cacheOffsets=True).close()
+		for ext in (".idx.offsets", ".syn.offsets", ".dict.dz.gzidx"):
+			self.assertTrue(isfile(self.filename + ext), ext)
+		lookup = self.openLookup(cacheOffsets=True)
+		self.assertLookups(lookup)
+		lookup.close()
+
+		# change the dictionary, outdated cache files must not be used
+		newEntries = entries[:3] + [("apricot", "another fruit")]
+		newSynonyms = [("pomme", 1), ("abricot", 3)]
+		idxPath = self.filename + ".idx"
+		st = os.stat(idxPath)
+		self.writeDict(newEntries, newSynonyms, dictExt=".dict.gz")
+		for ext in (".idx", ".syn", ".dict.dz"):
+			os.utime(
+				self.filename + ext,
+				ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9),
+			)
+		lookup = self.openLookup(cacheOffsets=True)
+		self.assertEqual(len(lookup), 4)
+		self.assertEqual(
+			lookup.lookup("abricot"),
+			[("apricot", [("another fruit", "m")])],
+		)
+		self.assertEqual(lookup.prefix("ap"), ["apple", "apricot"])
+		lookup.close()
+
+		# corrupt cache files are rebuilt
+		for ext in (".idx.offsets", ".syn.offsets"):
+			with open(self.filename + ext, "r+b") as fp:
+				fp.truncate(50)
+		lookup = self.openLookup(cacheOffsets=True)
+		self.assertEqual(
+			lookup.lookup("pomme"),
+			[("apple", [("a fruit", "m")])],
+		)
+		self.assertEqual(lookup.prefix("ap"), ["apple", "apricot"])
+
+	def test_writer_output(self):
+		glos = Glossary()
+		for index in range(300):
+			glos.addEntry(
+				["word%03d" % index, "alt%03d" % index],
+				"definition %d" % index,
+			)
+		self.assertTrue(glos.write(
+			self.filename + ".ifo",
+			stardict.format,
+			dictzip=False,
+		))
+		lookup = self.openLookup()
+		self.assertEqual(len(lookup), 300)
+		self.assertEqual(
+			lookup.lookup("alt123"),
+			[("word123", [("definition 123", "m")])],
+		)
+		self.assertEqual(
+			lookup.prefix("alt12", limit=3),
+			["alt120", "alt121", "alt122"],
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,118 @@
+import sys
+import shutil
+import tempfile
+import unittest
+import filecmp
+from unittest import mock
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from pyglossary.tests_common import getPlugin
+from pyglossary.glossary import Glossary
+from pyglossary.checkpoint import Checkpoint
+
+stardict = getPlugin("Stardict")
+
+
+class Crash(BaseException):
+	pass
+
+
+class StarDictResumeTest(unittest.TestCase):
+	"""
+	kills the conversion at the first checkpoint after the writer has
+	rewritten its files (switching to general mode or 64-bit offsets),
+	resumes it, and compares output files with an uninterrupted conversion
+	"""
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+		self.inputFilename = join(self.tmpDir, "input.txt")
+
+	def writeInput(self, count, htmlStart):
+		"""
+		entries from htmlStart are html, others are plain text
+		(more than compactSampleSize entries are needed for checkpoints
+		to start while writing)
+		"""
+		with open(self.inputFilename, "w", encoding="utf-8") as fp:
+			for index in range(count):
+				if index < htmlStart:
+					fp.write("word%04d\tdefinition %d\n" % (index, index))
+				else:
+					fp.write("word%04d\tline one<br>line %d\n" % (index, index))
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def convert(self, outputFilename, **kwargs):
+		return Glossary().convert(
+			self.inputFilename,
+			outputFilename=outputFilename,
+			writeOptions={"dictzip": False},
+			direct=True,
+			progressbar=False,
+			**kwargs
+		)
+
+	def convertCrashAfter(self, outputFilename, methodName):
+		"""
+		crashes at the first checkpoint after Writer.<methodName> is called
+		"""
+		called = []
+		method = getattr(stardict.Writer, methodName)
+		save = Checkpoint.save
+
+		def methodWrapper(*args, **kwargs):
+			called.append(True)
+			return method(*args, **kwargs)
+
+		def saveWrapper(*args, **kwargs):
+			if called:
+				raise Crash
+			return save(*args, **kwargs)
+
+		with mock.patch.object(stardict.Writer, methodName, methodWrapper), \
+			mock.patch.object(Checkpoint, "save", saveWrapper):
+			with self.assertRaises(Crash):
+				self.convert(
+					outputFilename,
+					checkpoint=True,
+					checkpointInterval=0,
+				)
+		self.assertTrue(called)
+
+	def assertSameOutput(self, name1, name2):
+		for ext in (".ifo", ".idx", ".dict"):
+			self.assertTrue(
+				filecmp.cmp(
+					join(self.tmpDir, name1 + ext),
+					join(self.tmpDir, name2 + ext),
+					shallow=False,
+				),
+				"%s files are different" % ext,
+			)
+
+	def test_resume_after_compact_to_general(self):
+		self.writeInput(1600, 1500)
+		self.convert(join(self.tmpDir, "ref.ifo"))
+		outputFilename = join(self.tmpDir, "out.ifo")
+		self.convertCrashAfter(outputFilename, "compactToGeneral")
+		self.assertTrue(self.convert(outputFilename, resume=True))
+		self.assertSameOutput("ref", "out")
+
+	def test_resume_after_64bit_offsets(self):
+		self.writeInput(1600, 1600)
+		# about the size of .dict file after 1200 entries
+		with mock.patch.object(stardict.Writer, "offset32Limit", 18000):
+			self.convert(join(self.tmpDir, "ref.ifo"))
+			outputFilename = join(self.tmpDir, "out.ifo")
+			self.convertCrashAfter(outputFilename, "rewriteIdxFile")
+			self.assertTrue(self.convert(outputFilename, resume=True))
+		self.assertSameOutput("ref", "out")
+		with open(join(self.tmpDir, "out.ifo"), encoding="utf-8") as fp:
+			self.assertIn("idxoffsetbits=64", fp.read())
+
+
+if __name__ == "__main__":
+	unittest.main()
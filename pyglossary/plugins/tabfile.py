@@ -16,6 +16,7 @@ writeOptions = [
 	"writeInfo",  # bool
 	"resources",  # bool
 ]
+supportsCheckpoint = True
 
 
 class Reader(TextGlossaryReader):
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
 from formats_common import *
-import subprocess
+from itertools import groupby
+from operator import itemgetter
 
 enable = True
 format = "Treedict"
@@ -10,56 +11,202 @@ extentions = [".tree", ".treedict"]
 readOptions = []
 writeOptions = [
 	"encoding",  # str
+	"archive",  # str: "tar.bz2", "tar.gz", "tar.xz", "tar", "zip" or ""
+	"workers",  # int, number of threads that compress tar archive
 ]
 
 
-def write(glos, filename, encoding="utf-8", archive="tar.bz2", sep=os.sep):
+def wordFilePath(word, sep):
+	"""
+	returns relative path of .m file of `word`, separated by "/"
+	words that are written into the same file (like "ab" and "a/b")
+	have the same path
+	"""
+	return "/".join([
+		part for part in (sep.join(word) + ".m").split(os.sep)
+		if part not in ("", ".")
+	])
+
+
+def iterWordFiles(glos, sep, encoding):
+	"""
+	yields (path, data) of .m files, sorted by path
+	definitions of repeated words (and words with the same path)
+	are merged (in the original order)
+	"""
+	from pyglossary.sort_stream import (
+		externalSortStream,
+		defaultChunkBytes,
+	)
+
+	def itemGen():
+		for entry in glos:
+			defi = entry.getDefi()
+			for word in entry.getWords():
+				if not word:
+					log.error("empty word")
+					continue
+				yield wordFilePath(word, sep), defi
+
+	items = externalSortStream(
+		itemGen(),
+		defaultChunkBytes,
+		key=itemgetter(0),
+		sizeFunc=lambda item: len(item[0]) + len(item[1]) + 100,
+	)
+	for path, group in groupby(items, key=itemgetter(0)):
+		yield path, "".join([defi for _, defi in group]).encode(encoding)
+
+
+def writeMembers(files, rootName, addDir, addFile):
+	"""
+	calls addDir(dirPath) for every directory (before its contents) and
+	addFile(filePath, data) for every file, paths are separated by "/"
+
+	files are sorted by path, so contents of every directory are
+	contiguous, and we only need to keep the directories of the last file
+	"""
+	dirStack = []
+	count = 0
+	for path, data in files:
+		parts = [rootName] + path.split("/")
+		dirs = parts[:-1]
+		index = 0
+		while index < min(len(dirStack), len(dirs)) and \
+				dirStack[index] == dirs[index]:
+			index += 1
+		del dirStack[index:]
+		for part in dirs[index:]:
+			dirStack.append(part)
+			addDir("/".join(dirStack))
+		addFile("/".join(parts), data)
+		count += 1
+	return count
+
+
+def writeDirectory(filename, files):
 	if os.path.exists(filename):
 		if os.path.isdir(filename):
 			if os.listdir(filename):
-				log.warning("Warning: directory \"%s\" is not empty.")
+				log.warning("Warning: directory \"%s\" is not empty." % filename)
 		else:
-			raise IOError("\"%s\" is not a directory")
-	for entry in glos:
-		defi = entry.getDefi()
-		for word in entry.getWords():
-			if not word:
-				log.error("empty word")
-				continue
-			chars = list(word)
-			try:
-				os.makedirs(filename + os.sep + sep.join(chars[:-1]))
-			except:
-				pass
-			entryFname = "%s%s%s.m" % (
-				filename,
-				os.sep,
-				sep.join(chars),
+			raise IOError("\"%s\" is not a directory" % filename)
+	parentDir, rootName = split(os.path.abspath(filename))
+
+	def addDir(dirPath):
+		os.makedirs(join(parentDir, *dirPath.split("/")), exist_ok=True)
+
+	def addFile(filePath, data):
+		with open(join(parentDir, *filePath.split("/")), "ab") as entryFp:
+			entryFp.write(data)
+
+	return writeMembers(files, rootName, addDir, addFile)
+
+
+def writeTar(archivePath, rootName, files, compression, workers):
+	"""
+	compression: "", "gz", "bz2" or "xz"
+	"""
+	import tarfile
+	from io import BytesIO
+	from time import time as now
+	from pyglossary.plugin_lib.parallel_compress import ParallelCompressWriter
+	mtime = int(now())
+
+	with open(archivePath, "wb") as archiveFile:
+		compressWriter = None
+		if compression and workers > 1:
+			compressWriter = ParallelCompressWriter(
+				archiveFile,
+				compression,
+				workers,
+			)
+			tar = tarfile.open(
+				fileobj=compressWriter,
+				mode="w|",
+				format=tarfile.GNU_FORMAT,
 			)
-			try:
-				with open(entryFname, "a", encoding=encoding) as entryFp:
-					entryFp.write(defi)
-			except:
-				log.exception("")
-	if archive:
-		if archive == "tar.gz":
-			(output, error) = subprocess.Popen(
-				["tar", "-czf", filename+".tar.gz", filename],
-				stdout=subprocess.PIPE
-			).communicate()
-		elif archive == "tar.bz2":
-			(output, error) = subprocess.Popen(
-				["tar", "-cjf", filename+".tar.bz2", filename],
-				stdout=subprocess.PIPE
-			).communicate()
-		elif archive == "zip":
-			(output, error) = subprocess.Popen(
-				["zip", "-r", filename+".zip", filename],
-				stdout=subprocess.PIPE
-			).communicate()
 		else:
-			log.error("Undefined archive format: \"%s\"" % archive)
-		try:
-			shutil.rmtree(filename, ignore_errors=True)
-		except:
-			pass
+			tar = tarfile.open(
+				fileobj=archiveFile,
+				mode="w|" + compression,
+				format=tarfile.GNU_FORMAT,
+			)
+
+		def addDir(dirPath):
+			info = tarfile.TarInfo(dirPath)
+			info.type = tarfile.DIRTYPE
+			info.mode = 0o755
+			info.mtime = mtime
+			tar.addfile(info)
+
+		def addFile(filePath, data):
+			info = tarfile.TarInfo(filePath)
+			info.size = len(data)
+			info.mode = 0o644
+			info.mtime = mtime
+			tar.addfile(info, BytesIO(data))
+
+		count = writeMembers(files, rootName, addDir, addFile)
+		tar.close()
+		if compressWriter:
+			compressWriter.close()
+	return count
+
+
+def writeZip(archivePath, rootName, files):
+	import zipfile
+	with zipfile.ZipFile(archivePath, "w", zipfile.ZIP_DEFLATED) as zipFile:
+
+		def addDir(dirPath):
+			info = zipfile.ZipInfo(dirPath + "/")
+			info.external_attr = (0o40755 << 16) | 0x10
+			zipFile.writestr(info, b"")
+
+		def addFile(filePath, data):
+			zipFile.writestr(filePath, data)
+
+		return writeMembers(files, rootName, addDir, addFile)
+
+
+def write(
+	glos,
+	filename,
+	encoding="utf-8",
+	archive="tar.bz2",
+	sep=os.sep,
+	workers=0,
+):
+	"""
+	archive members (or files, if archive is empty) are written directly
+	from a sorted stream of words, without creating the tree on disk
+
+	workers: number of threads that compress tar archive in blocks,
+		0 or 1 means compressing in this thread
+	"""
+	workers = int(workers)
+	filename = filename.rstrip(os.sep)
+	if not split(filename)[1]:
+		log.error("Invalid output path: \"%s\"" % filename)
+		return
+	if archive and archive not in ("tar", "tar.gz", "tar.bz2", "tar.xz", "zip"):
+		log.error("Undefined archive format: \"%s\"" % archive)
+		return
+	files = iterWordFiles(glos, sep, encoding)
+	if not archive:
+		count = writeDirectory(filename, files)
+		log.info("Wrote %s files into %s" % (count, filename))
+		return
+	archivePath = filename + "." + archive
+	rootName = split(filename)[1]
+	if archive == "zip":
+		count = writeZip(archivePath, rootName, files)
+	else:
+		count = writeTar(
+			archivePath,
+			rootName,
+			files,
+			archive[len("tar."):],
+			workers,
+		)
+	log.info("Wrote %s files into %s" % (count, archivePath))
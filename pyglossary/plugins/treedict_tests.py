@@ -0,0 +1,190 @@
+import sys
+import os
+import shutil
+import tarfile
+import zipfile
+import tempfile
+import unittest
+from unittest import mock
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from pyglossary.tests_common import getPlugin
+from pyglossary.glossary import Glossary
+from pyglossary import sort_stream
+
+treedict = getPlugin("Treedict")
+
+# (words, defi)
+entries = [
+	("cat", "feline;"),
+	("car", "vehicle;"),
+	(["dog", "cat"], "pet;"),
+	("ab", "x;"),
+	("a", "first;"),
+	("cat", "again;"),
+	("dot", "point;"),
+]
+expectedFiles = {
+	"out/a.m": b"first;",
+	"out/a/b.m": b"x;",
+	"out/c/a/r.m": b"vehicle;",
+	"out/c/a/t.m": b"feline;pet;again;",
+	"out/d/o/g.m": b"pet;",
+	"out/d/o/t.m": b"point;",
+}
+expectedDirs = [
+	"out",
+	"out/a",
+	"out/c",
+	"out/c/a",
+	"out/d",
+	"out/d/o",
+]
+
+
+class TreedictWriteTest(unittest.TestCase):
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+		self.filename = join(self.tmpDir, "out")
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def newGlossary(self, repeat=1):
+		glos = Glossary()
+		for _ in range(repeat):
+			for words, defi in entries:
+				glos.addEntry(words, defi)
+		# like Glossary.write, before calling write function of plugin
+		glos.updateEntryFilters()
+		glos._updateIter()
+		return glos
+
+	def write(self, filename, repeat=1, **options):
+		# small sort chunks, to merge repeated words from several chunks
+		with mock.patch.object(sort_stream, "defaultChunkBytes", 300):
+			treedict.write(
+				self.newGlossary(repeat),
+				filename,
+				sep=os.sep,
+				**options
+			)
+
+	def readTar(self, archivePath):
+		"""
+		returns (list of directories, dict of files) in order of members
+		"""
+		dirs = []
+		files = {}
+		with tarfile.open(archivePath) as tar:
+			for member in tar.getmembers():
+				if member.isdir():
+					dirs.append(member.name)
+				else:
+					files[member.name] = tar.extractfile(member).read()
+		return dirs, files
+
+	def readZip(self, archivePath):
+		dirs = []
+		files = {}
+		with zipfile.ZipFile(archivePath) as zipFile:
+			for name in zipFile.namelist():
+				if name.endswith("/"):
+					dirs.append(name[:-1])
+				else:
+					files[name] = zipFile.read(name)
+		return dirs, files
+
+	def readDirectory(self, dirPath):
+		dirs = []
+		files = {}
+		parent = dirname(dirPath)
+		for root, dirNames, fileNames in os.walk(dirPath):
+			dirs.append(os.path.relpath(root, parent).replace(os.sep, "/"))
+			for fileName in fileNames:
+				path = join(root, fileName)
+				with open(path, "rb") as fp:
+					files[os.path.relpath(path, parent).replace(os.sep, "/")] = \
+						fp.read()
+		return dirs, files
+
+	def test_tar(self):
+		for archive in ("tar", "tar.gz", "tar.bz2", "tar.xz"):
+			for workers in (0, 3):
+				if archive == "tar" and workers:
+					continue
+				self.write(self.filename, archive=archive, workers=workers)
+				dirs, files = self.readTar(self.filename + "." + archive)
+				self.assertEqual(dirs, expectedDirs, archive)
+				self.assertEqual(files, expectedFiles, archive)
+				os.remove(self.filename + "." + archive)
+
+	def test_zip(self):
+		self.write(self.filename, archive="zip")
+		dirs, files = self.readZip(self.filename + ".zip")
+		self.assertEqual(dirs, expectedDirs)
+		self.assertEqual(files, expectedFiles)
+
+	def test_directory(self):
+		self.write(self.filename, archive="")
+		dirs, files = self.readDirectory(self.filename)
+		self.assertEqual(sorted(dirs), expectedDirs)
+		self.assertEqual(files, expectedFiles)
+
+	def test_member_order(self):
+		# every directory comes before its contents
+		self.write(self.filename, archive="tar")
+		with tarfile.open(self.filename + ".tar") as tar:
+			seen = set()
+			for member in tar.getmembers():
+				parent = dirname(member.name)
+				if parent:
+					self.assertIn(parent, seen, member.name)
+				seen.add(member.name)
+
+	def test_repeated_words(self):
+		# repeated words in several sort chunks are merged in input order
+		self.write(self.filename, repeat=20, archive="tar.gz")
+		_, files = self.readTar(self.filename + ".tar.gz")
+		self.assertEqual(files["out/c/a/t.m"], b"feline;pet;again;" * 20)
+		self.assertEqual(files["out/a.m"], b"first;" * 20)
+
+	def test_trailing_separator(self):
+		for archive in ("tar.gz", "zip", ""):
+			self.write(self.filename + os.sep, archive=archive)
+			if archive == "zip":
+				dirs, files = self.readZip(self.filename + ".zip")
+			elif archive:
+				dirs, files = self.readTar(self.filename + "." + archive)
+			else:
+				dirs, files = self.readDirectory(self.filename)
+				dirs.sort()
+			self.assertEqual(dirs, expectedDirs, archive)
+			self.assertEqual(files, expectedFiles, archive)
+			if archive:
+				# not "out/.tar.gz"
+				self.assertFalse(os.path.exists(self.filename + os.sep))
+
+	def test_glossary_write(self):
+		outputFilename = self.newGlossary().write(
+			self.filename + os.sep,
+			treedict.format,
+			archive="tar.gz",
+		)
+		self.assertEqual(outputFilename, self.filename)
+		dirs, files = self.readTar(self.filename + ".tar.gz")
+		self.assertEqual(dirs, expectedDirs)
+		self.assertEqual(files, expectedFiles)
+
+	def test_invalid_path(self):
+		with self.assertLogs("root", "ERROR"):
+			treedict.write(self.newGlossary(), os.sep, archive="tar")
+		with self.assertLogs("root", "ERROR"):
+			treedict.write(self.newGlossary(), self.filename, archive="rar")
+		self.assertEqual(os.listdir(self.tmpDir), [])
+
+
+if __name__ == "__main__":
+	unittest.main()
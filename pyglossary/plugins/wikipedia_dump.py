@@ -2,10 +2,14 @@
 
 from time import time as now
 import re
-try:
-	from BeautifulSoup import BeautifulSoup
-except ImportError:
-	from bs4 import BeautifulSoup
+from lxml import etree
+from lxml import html as lxml_html
+
+from pyglossary.plugin_lib.process_pool import (
+	processWorkers,
+	newProcessPool,
+	orderedApply,
+)
 
 from formats_common import *
 
@@ -13,54 +17,264 @@ enable = True
 format = "WikipediaDump"
 description = "Wikipedia Dump(Static HTML)"
 extentions = [".wiki"]
-readOptions = []
+readOptions = [
+	"workers",  # int, number of processes to parse articles, 0 to disable
+	"manifest",  # str, path of file to cache the list of articles in
+]
 writeOptions = [
 	"encoding",  # str
 ]
 
+manifestHeader = "# pyglossary WikipediaDump manifest, articles: %s\n"
+
+specialPattern = re.compile(r".*~[^_]")
+
+xpathFirstP = etree.XPath("(.//p)[1]")
+xpathContent = etree.XPath(
+	'.//*[@id="column-content"]//*[@id="content"]'
+)
+xpathFirstHeading = etree.XPath(
+	'.//h1[contains(concat(" ", normalize-space(@class), " "), " firstHeading ")]'
+)
+xpathBodyContent = etree.XPath('.//*[@id="bodyContent"]')
+
+
+def isSpecialByPath(fname):
+	"""
+		fname: str, file name without extension
+	"""
+	return re.match(specialPattern, fname)
+
+
+def parseArticle(word, fpath):
+	"""
+	returns html definition of article file `fpath`, or None
+	"""
+	try:
+		with open(fpath, "rb") as fileObj:
+			text = fileObj.read().decode("utf-8")
+	except UnicodeDecodeError:
+		log.error("error decoding file %r, not UTF-8" % fpath)
+		return
+	except:
+		log.exception("error reading file %r" % fpath)
+		return
+
+	try:
+		root = lxml_html.document_fromstring(text)
+	except etree.ParserError:
+		return
+	body = root.find("body")
+	if body is None:
+		return
+
+	firstP = xpathFirstP(body)
+	if firstP:
+		pText = firstP[0].text_content()
+		if pText.startswith("Redirecting to "):
+			toWord = pText[len("Redirecting to "):]
+			return "↳ <a href=\"bword://%s\">%s</a>" % (toWord, toWord)
+			# "↳" does not look good for RTL languages FIXME
+
+	content = xpathContent(body)
+	if not content:
+		log.warning("could not find \"content\" element: %s" % fpath)
+		return
+	content = content[0]
+
+	firstHeading = xpathFirstHeading(content)
+	if not firstHeading:
+		log.warning("could not find \"firstHeading\" element: %s" % fpath)
+		return
+	firstHeading = firstHeading[0].text_content()
+
+	if firstHeading != word:
+		log.debug("word=%r, firstHeading=%r" % (firstHeading, word))
+
+	bodyContent = xpathBodyContent(content)
+	if not bodyContent:
+		log.warning("could not find \"bodyContent\" element: %s" % fpath)
+		return
+	bodyContent = bodyContent[0]
+
+	# FIXME
+	parts = []
+	if bodyContent.text:
+		parts.append(escapeText(bodyContent.text))
+	for child in bodyContent:
+		parts.append(lxml_html.tostring(child, encoding="unicode"))
+	return "".join(parts)
+
+
+def escapeText(text):
+	return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def parseArticles(items):
+	"""
+	items: list of (word, fpath)
+	returns list of definitions (str or None)
+	"""
+	return [parseArticle(word, fpath) for word, fpath in items]
+
 
 class Reader(object):
-	specialPattern = re.compile(r".*~[^_]")
+	"""
+	paths of article files are listed (sorted) in one walk over articles
+	directory, and the list (manifest) can be cached in a file
+	(`manifest` option), with mtime of every directory, which changes
+	when a file or subdirectory is added to or removed from it
+
+	articles are parsed in a pool of `workers` processes if workers > 1,
+	and entries are yielded in the order of manifest anyway
+	"""
+	parseBatchSize = 100  # number of articles parsed together by a worker
+
 	def __init__(self, glos):
 		self._glos = glos
 		self._rootDir = ""
 		self._articlesDir = ""
-		self._len = None
+		self._workers = 0
+		self._manifestPath = ""
+		self._manifest = None  # list of article paths, relative to articlesDir
 		self._specialCount = 0
+		self._index = 0  # index of the next article in manifest
 		# self._alts = {}
 		# { word => alts }
 		# where alts is str (one word), or list of strs
 		# we can't recognize alternates unless we keep all data in memory
 		# or scan the whole directiry and read all files twice
 
-	def open(self, rootDir):
+	def open(self, rootDir, workers=0, manifest=""):
+		"""
+		manifest: path of manifest file, that is read if it's up to date
+			and (re)written otherwise, empty means listing articles
+			every time
+		"""
 		if not isdir(rootDir):
 			raise IOError("%s is not a directory" % rootDir)
 		self._rootDir = rootDir
 		self._articlesDir = join(self._rootDir, "articles")
+		self._workers = processWorkers(int(workers))
+		self._manifestPath = manifest
 
 	def close(self):
 		self._rootDir = ""
 		self._articlesDir = ""
-		self._len = None
+		self._manifest = None
+		self._index = 0
 		# self._alts = {}
 
+	def readManifestFile(self):
+		"""
+		returns the list of article paths from manifest file,
+		or None if it's missing or outdated
+		"""
+		manifestPath = self._manifestPath
+		if not isfile(manifestPath):
+			return
+		header = manifestHeader % os.path.abspath(self._articlesDir)
+		with open(manifestPath, encoding="utf-8") as manifestFile:
+			if manifestFile.readline() != header:
+				log.info(
+					"Manifest file belongs to another dump: %s" % manifestPath
+				)
+				return
+			manifest = []
+			for line in manifestFile:
+				kind, _, value = line.rstrip("\n").partition("\t")
+				if kind == "f":
+					manifest.append(value)
+					continue
+				mtime, _, dirpathRel = value.partition("\t")
+				dirpath = join(self._articlesDir, dirpathRel)
+				try:
+					dirMtime = os.stat(dirpath).st_mtime_ns
+				except OSError:
+					dirMtime = None
+				if str(dirMtime) != mtime:
+					log.info("Manifest file is outdated: %s" % manifestPath)
+					return
+		return manifest
+
+	def writeManifestFile(self, manifest, dirMtimes):
+		"""
+		dirMtimes: list of (dirpathRel, mtime_ns) of all directories
+		"""
+		try:
+			with open(self._manifestPath, "w", encoding="utf-8") as manifestFile:
+				manifestFile.write(
+					manifestHeader % os.path.abspath(self._articlesDir)
+				)
+				for dirpathRel, mtime in dirMtimes:
+					manifestFile.write("d\t%s\t%s\n" % (mtime, dirpathRel))
+				for fpathRel in manifest:
+					manifestFile.write("f\t%s\n" % fpathRel)
+		except OSError as e:
+			log.error("could not write manifest file: %s" % e)
+
+	def getManifest(self):
+		"""
+		returns sorted list of article paths, relative to articles directory
+		"""
+		if self._manifest is not None:
+			return self._manifest
+		if self._manifestPath:
+			manifest = self.readManifestFile()
+			if manifest is not None:
+				log.info("Found %s articles in manifest" % len(manifest))
+				self._manifest = manifest
+				return manifest
+
+		t0 = now()
+		log.info("Listing articles...")
+		manifest = []
+		dirMtimes = []
+		for dirpath, dirs, files in os.walk(self._articlesDir):
+			dirs.sort()
+			files.sort()
+			dirpathRel = dirpath[len(self._articlesDir):].lstrip(os.sep)
+			dirMtimes.append((dirpathRel, os.stat(dirpath).st_mtime_ns))
+			for fname in files:
+				manifest.append(join(dirpathRel, fname))
+		log.debug("Listing articles took %.2f seconds" % (now() - t0))
+		log.info("Found %s articles" % len(manifest))
+		self._manifest = manifest
+		if self._manifestPath:
+			self.writeManifestFile(manifest, dirMtimes)
+		return manifest
+
 	def __len__(self):
 		if not self._articlesDir:
 			log.error(
 				"WikipediaDump: called len(reader) while it's not open"
 			)
 			return 0
-		if self._len is None:
-			t0 = now()
-			log.info("Counting articles...")
-			self._len = sum(
-				len(files)
-				for _, _, files in os.walk(self._articlesDir)
-			)
-			log.debug("Counting articles took %.2f seconds" % (now() - t0))
-			log.info("Found %s articles" % self._len)
-		return self._len
+		return len(self.getManifest())
+
+	def progressFraction(self):
+		if not self._manifest:
+			return 0.0
+		return self._index / len(self._manifest)
+
+	def articleItems(self):
+		"""
+		yields (word, fpath) of articles, or None for special page files
+		and files with unknown extension
+		"""
+		for fpathRel in self.getManifest():
+			fname, ext = splitext(os.path.basename(fpathRel))
+			if ext != ".html":
+				log.warning("unkown article extention: %s" % ext)
+				yield None
+				continue
+			if isSpecialByPath(fname):
+				# log.debug("Skipping special page file: %s" % fpathRel)
+				self._specialCount += 1
+				yield None  # updates progressbar
+				continue
+			word = fname.replace("_", " ").replace("~", ":")
+			yield word, join(self._articlesDir, fpathRel)
 
 	def __iter__(self):
 		if not self._articlesDir:
@@ -68,121 +282,45 @@ class Reader(object):
 				"WikipediaDump: trying to iterate over reader"
 				" while it's not open"
 			)
-			raise StopIteration
-		for dirpath, dirs, files in os.walk(self._articlesDir):
-			# dirpathRel = dirpath[len(self._articlesDir):].lstrip("/")
-			# dirParts = dirpathRel.split(os.sep)  # test on windows FIXME
-			# prefix = "".join([
-			#	chr(int(x, 16)) if len(x)==2 else x
-			#	for x in dirParts
-			# ])
-			dirs.sort()
-			files.sort()
-			for fname_html in files:
-				fpath = join(dirpath, fname_html)
-				fname, ext = splitext(fname_html)
-				# fpathRel = join(dirpathRel, fname_html)
-				if ext != ".html":
-					log.warning("unkown article extention: %s" % fname_ext)
-					continue
-				if self.isSpecialByPath(fname):  # , prefix
-					# log.debug("Skipping special page file: %s" % fpathRel)
-					self._specialCount += 1
-					yield None  # updates progressbar
-					continue
-				word = fname.replace("_", " ").replace("~", ":")
-				defi = self.parseArticle(word, fpath)
-				if not defi:
-					yield None  # updates progressbar
-					continue
-
-				yield self._glos.newEntry(word, defi)
+			return
+		self._index = 0
+		self._specialCount = 0
+		if self._workers > 1:
+			results = self.parallelParseGen()
+		else:
+			results = (
+				(item, parseArticle(*item) if item else None)
+				for item in self.articleItems()
+			)
+		for item, defi in results:
+			self._index += 1
+			if not defi:
+				yield None  # updates progressbar
+				continue
+			yield self._glos.newEntry(item[0], defi)
 		log.info("Skipped %s special page files" % self._specialCount)
 
-	def isSpecialByPath(self, fname):  # , d_prefix
+	def parallelParseGen(self):
 		"""
-			fname: str
-			d_prefix: str, with length of 3
-				this is the joint string version of directory relative path
+		yields (item, defi) for items of `articleItems`, in the same order,
+		articles are parsed in a pool of `self._workers` processes
 		"""
-		return re.match(self.specialPattern, fname)
-		# assert len(d_prefix) == 3
-		# f_prefix = fname[:3].lower()
-		# if f_prefix == d_prefix:
-		#	return False
-		# if len(f_prefix) < 3:
-		#	if f_prefix == d_prefix.rstrip("_"):
-		#		return False
-		# return True
-		# if "~" not in fname:
-		#	return False
-		# if fname[0] == dirParts[0]:
-		#	return False
-		# if list(fname[:3]) != dirParts:
-		#	log.debug("dirParts=%r, fname=%r" % (dirParts, fname))
-		# l_fname = fname.lower()
-		# for ext in ("png", "jpg", "jpeg", "gif", "svg", "pdf", "js"):
-		#	if "." + ext in l_fname:
-		#		return True
-		# return True
-
-	def parseArticle(self, word, fpath):
-		try:
-			with open(fpath) as fileObj:
-				text = fileObj.read()
-		except UnicodeDecodeError:
-			log.error("error decoding file %r, not UTF-8" % fpath)
-			return
-		except:
-			log.exception("error reading file %r" % fpath)
-			return
-
-		root = BeautifulSoup(text, "lxml")
-		body = root.body
-		if not body:
-			return
-
-#		if body.p and body.p.text.startswith("Redirecting to "):
-#			toWord = body.p.text[len("Redirecting to "):]
-#			try:
-#				fromWords = self._alts[toWord]
-#			except KeyError:
-#				self._alts[toWord] = word
-#			else:
-#				if isinstance(fromWords, str):
-#					self._alts[toWord] = [fromWords, word]
-#				else:
-#					fromWords.append(word)
-#			return
-#		try:
-#			alts = self._alts[word]
-
-		if body.p and body.p.text.startswith("Redirecting to "):
-			toWord = body.p.text[len("Redirecting to "):]
-			return "↳ <a href=\"bword://%s\">%s</a>" % (toWord, toWord)
-			# "↳" does not look good for RTL languages FIXME
+		from itertools import islice
 
-		try:
-			content = body.find(id="column-content").find(id="content")
-		except AttributeError:
-			content = None
-		if not content:
-			log.warning("could not find \"content\" element: %s" % fpath)
-			return
-
-		try:
-			firstHeading = content.find("h1", class_="firstHeading").text
-		except AttributeError:
-			log.warning("could not find \"firstHeading\" element: %s" % fpath)
-			return
-
-		if firstHeading != word:
-			log.debug("word=%r, firstHeading=%r" % (firstHeading, word))
-
-		bodyContent = content.find(id="bodyContent")
-		if not bodyContent:
-			log.warning("could not find \"bodyContent\" element: %s" % fpath)
-			return
+		def tasks():
+			items = self.articleItems()
+			while True:
+				batch = list(islice(items, self.parseBatchSize))
+				if not batch:
+					break
+				yield batch, ([item for item in batch if item],)
 
-		# FIXME
-		return "".join([str(tag) for tag in bodyContent.contents])
+		for batch, defis in orderedApply(
+			newProcessPool(self._workers),
+			parseArticles,
+			tasks(),
+			self._workers,
+		):
+			defis = iter(defis)
+			for item in batch:
+				yield item, next(defis) if item else None
@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+# wikipedia_xml.py
+# Read Wikipedia XML dump (pages-articles-multistream.xml.bz2)
+# This file is part of PyGlossary project, https://github.com/ilius/pyglossary
+#
+# This program is a free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3, or (at your option)
+# any later version.
+
+from formats_common import *
+
+import re
+import bz2
+from array import array
+from tempfile import TemporaryFile
+from lxml import etree
+
+from pyglossary.plugin_lib.process_pool import (
+	processWorkers,
+	newProcessPool,
+	orderedApply,
+)
+
+enable = True
+format = "WikipediaXml"
+description = "Wikipedia XML Dump (multistream bz2)"
+extentions = [".xml.bz2"]
+readOptions = [
+	"index",  # str, path of index file, default: *-index.txt.bz2
+	"workers",  # int, number of processes to decompress and parse streams
+	"renderer",  # str, "text", "html", or "module.name:functionName"
+	"redirectAlternates",  # bool, add redirects as alternates of target
+]
+writeOptions = []
+
+"""
+multistream dump is a concatenation of bz2 streams:
+	first stream: <mediawiki ...> and <siteinfo>
+	next streams: 100 <page> elements each
+	last stream: </mediawiki>
+
+index file (bz2 compressed text) has one line for every page:
+	offset of stream in dump file:page id:page title
+"""
+
+siteinfoPattern = re.compile(
+	b"<(sitename|base)>([^<]*)</\\1>"
+)
+
+
+def renderText(title, wikitext):
+	"""
+	keeps wikitext as it is
+	"""
+	return wikitext, "m"
+
+
+htmlRemovePatterns = [
+	re.compile(r"<!--.*?-->", re.S),
+	re.compile(r"<ref[^>]*/>"),
+	re.compile(r"<ref[^>]*>.*?</ref>", re.S),
+]
+htmlTemplatePattern = re.compile(r"\{\{[^{}]*\}\}")
+htmlTablePattern = re.compile(r"\{\|.*?\|\}", re.S)
+htmlSubs = [
+	(re.compile(r"^(=+)\s*(.*?)\s*\1\s*$", re.M), lambda m: "<h%d>%s</h%d>" % (
+		len(m.group(1)),
+		m.group(2),
+		len(m.group(1)),
+	)),
+	(re.compile(r"'''(.+?)'''"), r"<b>\1</b>"),
+	(re.compile(r"''(.+?)''"), r"<i>\1</i>"),
+	(re.compile(r"\[\[(?:[^|\]]*\|)?([^\]]*)\]\]"), r"\1"),
+	(re.compile(r"\[https?://[^\s\]]+ ([^\]]*)\]"), r"\1"),
+]
+htmlLinkPattern = re.compile(r"\[\[([^|\]]*)(?:\|([^\]]*))?\]\]")
+
+
+def renderHtml(title, wikitext):
+	"""
+	a simple wikitext to html converter: removes templates, tables,
+	comments and references, and converts headings, bold, italic and
+	internal links
+	"""
+	text = wikitext
+	for pattern in htmlRemovePatterns:
+		text = pattern.sub("", text)
+	while True:
+		text, count = htmlTemplatePattern.subn("", text)
+		if not count:
+			break
+	text = htmlTablePattern.sub("", text)
+	text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+	text = htmlLinkPattern.sub(
+		lambda m: "<a href=\"bword://%s\">%s</a>" % (
+			m.group(1),
+			m.group(2) or m.group(1),
+		),
+		text,
+	)
+	for pattern, repl in htmlSubs:
+		text = pattern.sub(repl, text)
+	text = text.strip().replace("\n\n", "<br><br>").replace("\n", " ")
+	return text, "h"
+
+
+renderers = {
+	"text": renderText,
+	"html": renderHtml,
+}
+
+
+def getRenderer(name):
+	"""
+	name: name of a renderer in `renderers`, or "module.name:functionName"
+		of a function that takes (title, wikitext) and returns
+		(definition, definition format)
+	"""
+	try:
+		return renderers[name]
+	except KeyError:
+		pass
+	from importlib import import_module
+	moduleName, _, funcName = name.partition(":")
+	if not funcName:
+		raise ValueError("invalid wikitext renderer %r" % name)
+	return getattr(import_module(moduleName), funcName)
+
+
+def pageFields(page):
+	"""
+	returns (title, redirect, wikitext) of <page> element, or None if it's
+	not an article (namespace 0)
+	redirect is title of the target page, or None
+	"""
+	if page.findtext("{*}ns") not in ("0", None):
+		return
+	title = page.findtext("{*}title")
+	if not title:
+		return
+	redirectElem = page.find("{*}redirect")
+	redirect = None
+	if redirectElem is not None:
+		redirect = redirectElem.get("title")
+	text = page.findtext("{*}revision/{*}text") or ""
+	return title, redirect, text
+
+
+def pageResult(fields, render):
+	"""
+	returns (title, redirect, defi, defiFormat)
+	"""
+	title, redirect, text = fields
+	if redirect:
+		return title, redirect, None, None
+	defi, defiFormat = render(title, text)
+	return title, None, defi, defiFormat
+
+
+def parseStreamData(data, render):
+	"""
+	data: decompressed data (bytes) of one or more streams of <page> elements
+	returns list of results of `pageResult`, or None for non-article pages
+	"""
+	start = data.find(b"<page>")
+	end = data.rfind(b"</page>")
+	if start < 0 or end < 0:
+		return []
+	parser = etree.XMLParser(huge_tree=True)
+	root = etree.fromstring(
+		b"<pages>" + data[start:end + len(b"</page>")] + b"</pages>",
+		parser,
+	)
+	results = []
+	for page in root:
+		fields = pageFields(page)
+		if fields is None:
+			results.append(None)
+			continue
+		results.append(pageResult(fields, render))
+	return results
+
+
+_workerRender = None
+
+
+def initStreamWorker(rendererName):
+	global _workerRender
+	_workerRender = getRenderer(rendererName)
+
+
+def readStreams(filename, start, end):
+	"""
+	decompresses and parses streams of dump file from `start` to `end`
+	(end = -1 means end of file)
+	"""
+	with open(filename, "rb") as dumpFile:
+		dumpFile.seek(start)
+		if end < 0:
+			compressed = dumpFile.read()
+		else:
+			compressed = dumpFile.read(end - start)
+	return parseStreamData(bz2.decompress(compressed), _workerRender)
+
+
+class Reader(object):
+	"""
+	with index file, streams are decompressed and parsed in a pool of
+	`workers` processes, and pages are yielded in the order of dump file
+	without index file, dump file is decompressed and parsed sequentially
+
+	redirects are added as alternates of their target pages (default),
+	that needs all redirects in memory, and articles are kept in a
+	temporary file until the whole dump is parsed.  with
+	redirectAlternates=False, redirects are yielded as entries with a
+	link to their target, and nothing is kept
+	"""
+	# number of streams that are decompressed and parsed by a worker together
+	streamBatchSize = 4
+
+	def __init__(self, glos):
+		self._glos = glos
+		self._filename = ""
+		self._indexPath = ""
+		self._workers = 0
+		self._rendererName = "text"
+		self._redirectAlternates = True
+		self._offsets = array("Q")  # offsets of page streams
+		self._pageCount = 0
+		self._progress = 0.0
+
+	def open(
+		self,
+		filename,
+		index=None,
+		workers=0,
+		renderer="text",
+		redirectAlternates=True,
+	):
+		self._filename = filename
+		self._workers = processWorkers(int(workers))
+		self._rendererName = renderer
+		getRenderer(renderer)  # raise error early if renderer is invalid
+		self._redirectAlternates = bool(redirectAlternates)
+		if index is None:
+			if filename.endswith(".xml.bz2"):
+				index = filename[:-len(".xml.bz2")] + "-index.txt.bz2"
+		if index and isfile(index):
+			self._indexPath = index
+			self.readIndex()
+		else:
+			log.warning(
+				"index file not found, dump will be read sequentially"
+			)
+		self.readSiteinfo()
+
+	def readIndex(self):
+		offsets = array("Q")
+		lastOffset = -1
+		pageCount = 0
+		with bz2.open(self._indexPath, "rb") as indexFile:
+			for line in indexFile:
+				offset = int(line[:line.index(b":")])
+				if offset != lastOffset:
+					offsets.append(offset)
+					lastOffset = offset
+				pageCount += 1
+		self._offsets = offsets
+		self._pageCount = pageCount
+		log.info(
+			"Found %s pages in %s streams in index file" % (
+				pageCount,
+				len(offsets),
+			)
+		)
+
+	def readSiteinfo(self):
+		"""
+		reads <siteinfo> from the first stream
+		"""
+		decomp = bz2.BZ2Decompressor()
+		data = b""
+		with open(self._filename, "rb") as dumpFile:
+			while not decomp.eof and b"</siteinfo>" not in data:
+				chunk = dumpFile.read(64 * 1024)
+				if not chunk:
+					break
+				data += decomp.decompress(chunk)
+		info = dict(siteinfoPattern.findall(data))
+		if info.get(b"sitename"):
+			self._glos.setInfo("name", toStr(info[b"sitename"]))
+		if info.get(b"base"):
+			self._glos.setInfo("website", toStr(info[b"base"]))
+
+	def close(self):
+		self._filename = ""
+		self._offsets = array("Q")
+		self._pageCount = 0
+
+	def __len__(self):
+		return self._pageCount
+
+	def progressFraction(self):
+		return self._progress
+
+	def __iter__(self):
+		if not self._filename:
+			log.error("reader is not open, can not iterate")
+			return
+		self._progress = 0.0
+		if not self._redirectAlternates:
+			for result in self.iterResults(1.0):
+				if result is None:
+					yield None
+					continue
+				title, redirect, defi, defiFormat = result
+				if redirect:
+					defi = "↳ <a href=\"bword://%s\">%s</a>" % (
+						redirect,
+						redirect,
+					)
+					defiFormat = "h"
+				yield self._glos.newEntry(title, defi, defiFormat)
+			return
+		yield from self.iterWithAlternates()
+
+	def iterWithAlternates(self):
+		"""
+		first half of progress: parsing dump, keeping articles in a
+		temporary file and redirects in memory
+		second half: yielding articles with alternates
+		"""
+		redirects = {}  # target title => list of titles
+		articleCount = 0
+		with TemporaryFile(prefix="pyglossary-wikipedia-") as spool:
+			for result in self.iterResults(0.5):
+				if result is None:
+					yield None
+					continue
+				title, redirect, defi, defiFormat = result
+				if redirect:
+					# drop section of target, like "#History"
+					target = redirect.partition("#")[0]
+					redirects.setdefault(target, []).append(title)
+					yield None
+					continue
+				b_record = "\t".join([
+					title,
+					defiFormat,
+					defi.replace("\\", "\\\\").replace("\n", "\\n"),
+				]).encode("utf-8") + b"\n"
+				spool.write(b_record)
+				articleCount += 1
+			spoolSize = spool.tell()
+			spool.seek(0)
+			log.info(
+				"Parsed %s articles and %s redirect targets" % (
+					articleCount,
+					len(redirects),
+				)
+			)
+			for b_record in spool:
+				title, defiFormat, defi = b_record[:-1].decode("utf-8")\
+					.split("\t", 2)
+				defi = unescapeNewline(defi)
+				alts = redirects.pop(title, [])
+				self._progress = 0.5 + 0.5 * spool.tell() / spoolSize
+				yield self._glos.newEntry([title] + alts, defi, defiFormat)
+		if redirects:
+			log.info(
+				"Skipped redirects to %s missing pages" % len(redirects)
+			)
+
+	def iterResults(self, progressScale):
+		"""
+		yields results of `pageResult` (or None) of all pages
+		"""
+		if not self._offsets:
+			yield from self.sequentialResults(progressScale)
+			return
+		batches = self.streamBatches()
+		batchCount = len(batches)
+		if self._workers < 2:
+			render = getRenderer(self._rendererName)
+			with open(self._filename, "rb") as dumpFile:
+				for batchIndex, (start, end) in enumerate(batches):
+					dumpFile.seek(start)
+					compressed = dumpFile.read(end - start) if end >= 0 \
+						else dumpFile.read()
+					yield from parseStreamData(
+						bz2.decompress(compressed),
+						render,
+					)
+					self._progress = progressScale * (batchIndex + 1) / batchCount
+			return
+
+		pool = newProcessPool(
+			self._workers,
+			initializer=initStreamWorker,
+			initargs=(self._rendererName,),
+		)
+		results = orderedApply(
+			pool,
+			readStreams,
+			(
+				(batchIndex, (self._filename, start, end))
+				for batchIndex, (start, end) in enumerate(batches)
+			),
+			self._workers,
+		)
+		for batchIndex, pageResults in results:
+			yield from pageResults
+			self._progress = progressScale * (batchIndex + 1) / batchCount
+
+	def streamBatches(self):
+		"""
+		returns list of (start, end) offsets of batches of page streams
+		end = -1 means end of file
+		"""
+		offsets = self._offsets
+		batches = []
+		for index in range(0, len(offsets), self.streamBatchSize):
+			endIndex = index + self.streamBatchSize
+			end = offsets[endIndex] if endIndex < len(offsets) else -1
+			batches.append((offsets[index], end))
+		return batches
+
+	def sequentialResults(self, progressScale):
+		render = getRenderer(self._rendererName)
+		fileSize = os.path.getsize(self._filename)
+		with open(self._filename, "rb") as rawFile:
+			with bz2.open(rawFile, "rb") as dumpFile:
+				context = etree.iterparse(
+					dumpFile,
+					events=("end",),
+					tag="{*}page",
+					huge_tree=True,
+				)
+				for _, page in context:
+					fields = pageFields(page)
+					page.clear()
+					while page.getprevious() is not None:
+						del page.getparent()[0]
+					self._progress = progressScale * rawFile.tell() / fileSize
+					if fields is None:
+						yield None
+						continue
+					yield pageResult(fields, render)
+
+
+def unescapeNewline(text):
+	"""
+	reverts escaping of newline and backslash in temporary file records
+	"""
+	return re.sub(
+		r"\\(.)",
+		lambda m: "\n" if m.group(1) == "n" else m.group(1),
+		text,
+	)
@@ -0,0 +1,218 @@
+import sys
+import os
+import bz2
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from pyglossary.tests_common import getPlugin
+from pyglossary.glossary import Glossary
+
+wikipedia_xml = getPlugin("WikipediaXml")
+
+siteinfo = """<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">
+<siteinfo>
+<sitename>Testpedia</sitename>
+<base>https://test.wikipedia.org/wiki/Main_Page</base>
+</siteinfo>
+"""
+
+
+def pageXml(pageId, title, text="", ns=0, redirect=None):
+	title = title.replace("&", "&amp;")
+	text = text.replace("&", "&amp;").replace("<", "&lt;")
+	redirectTag = ""
+	if redirect:
+		redirectTag = '<redirect title="%s" />' % redirect
+	return (
+		"<page><title>%s</title><ns>%d</ns><id>%d</id>%s" % (
+			title,
+			ns,
+			pageId,
+			redirectTag,
+		) +
+		"<revision><id>%d</id><text>%s</text></revision></page>\n" % (
+			pageId * 10,
+			text,
+		)
+	)
+
+
+def samplePages(count):
+	"""
+	returns list of (pageId, title, text, ns, redirect)
+	"""
+	pages = []
+	for index in range(count):
+		pageId = len(pages) + 1
+		title = "Article %d" % index
+		text = "'''%s''' is line one.\nline \\ two of [[Article %d]] & more" % (
+			title,
+			(index + 1) % count,
+		)
+		pages.append((pageId, title, text, 0, None))
+		if index % 3 == 0:
+			pages.append((pageId + 1, "Redirect %d" % index, "", 0, title))
+		if index % 5 == 0:
+			pages.append((
+				len(pages) + 1,
+				"Section redirect %d" % index,
+				"",
+				0,
+				title + "#History",
+			))
+		if index % 7 == 0:
+			pages.append((len(pages) + 1, "Talk:%s" % title, "talk", 1, None))
+	pages.append((len(pages) + 1, "Broken redirect", "", 0, "Missing page"))
+	return pages
+
+
+def writeDump(filename, pages, pagesPerStream=3):
+	"""
+	writes a multistream dump, and its index file, returns path of index
+	"""
+	indexLines = []
+	with open(filename, "wb") as dumpFile:
+		dumpFile.write(bz2.compress(siteinfo.encode("utf-8")))
+		for start in range(0, len(pages), pagesPerStream):
+			offset = dumpFile.tell()
+			streamPages = pages[start:start + pagesPerStream]
+			dumpFile.write(bz2.compress("".join(
+				pageXml(*page) for page in streamPages
+			).encode("utf-8")))
+			for page in streamPages:
+				indexLines.append("%d:%d:%s\n" % (offset, page[0], page[1]))
+		dumpFile.write(bz2.compress(b"</mediawiki>\n"))
+	indexPath = filename[:-len(".xml.bz2")] + "-index.txt.bz2"
+	with bz2.open(indexPath, "wt", encoding="utf-8") as indexFile:
+		indexFile.write("".join(indexLines))
+	return indexPath
+
+
+class WikipediaXmlTest(unittest.TestCase):
+	pageCount = 40
+
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+		self.filename = join(
+			self.tmpDir,
+			"testwiki-pages-articles-multistream.xml.bz2",
+		)
+		self.pages = samplePages(self.pageCount)
+		self.indexPath = writeDump(self.filename, self.pages)
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def readEntries(self, **options):
+		"""
+		returns (words, defi) of entries, without entry filters of Glossary
+		"""
+		glos = Glossary()
+		reader = wikipedia_xml.Reader(glos)
+		reader.open(self.filename, **options)
+		try:
+			entries = [
+				(entry.getWords(), entry.getDefi())
+				for entry in reader
+				if entry
+			]
+		finally:
+			reader.close()
+		self.assertEqual(glos.getInfo("name"), "Testpedia")
+		return entries
+
+	def expectedEntries(self, redirectAlternates=True):
+		entries = []
+		redirects = {}
+		for _, title, text, ns, redirect in self.pages:
+			if ns != 0:
+				continue
+			if redirect and redirectAlternates:
+				redirects.setdefault(redirect.partition("#")[0], []).append(title)
+				continue
+			if redirect:
+				text = "↳ <a href=\"bword://%s\">%s</a>" % (
+					redirect,
+					redirect,
+				)
+			entries.append(([title], text))
+		for words, _ in entries:
+			words += redirects.get(words[0], [])
+		return entries
+
+	def test_workers(self):
+		for redirectAlternates in (True, False):
+			expected = self.expectedEntries(redirectAlternates)
+			for workers in (0, 2):
+				with mock.patch.object(
+					wikipedia_xml,
+					"newProcessPool",
+					wraps=wikipedia_xml.newProcessPool,
+				) as newProcessPool:
+					entries = self.readEntries(
+						workers=workers,
+						redirectAlternates=redirectAlternates,
+					)
+				self.assertEqual(newProcessPool.called, workers > 1)
+				self.assertEqual(entries, expected)
+
+	def test_redirect_alternates(self):
+		entries = dict(
+			(words[0], words[1:])
+			for words, _ in self.readEntries()
+		)
+		self.assertEqual(
+			entries["Article 0"],
+			["Redirect 0", "Section redirect 0"],
+		)
+		self.assertEqual(entries["Article 3"], ["Redirect 3"])
+		self.assertEqual(entries["Article 1"], [])
+		self.assertNotIn("Redirect 0", entries)
+		self.assertNotIn("Talk:Article 0", entries)
+		self.assertNotIn("Broken redirect", entries)
+
+	def test_missing_index(self):
+		expected = self.expectedEntries()
+		with self.assertLogs("root", "WARNING"):
+			entries = self.readEntries(
+				index=join(self.tmpDir, "missing-index.txt.bz2"),
+				workers=2,
+			)
+		self.assertEqual(entries, expected)
+		# default index file
+		os.remove(self.indexPath)
+		with self.assertLogs("root", "WARNING"):
+			entries = self.readEntries(redirectAlternates=False)
+		self.assertEqual(entries, self.expectedEntries(False))
+
+	def test_format_detection(self):
+		# .xml.bz2 file is read by plugin, without decompressing it first
+		glos = Glossary()
+		with mock.patch.object(
+			wikipedia_xml.Reader,
+			"open",
+			autospec=True,
+			side_effect=wikipedia_xml.Reader.open,
+		) as readerOpen:
+			self.assertTrue(glos.read(self.filename, progressbar=False))
+		self.assertEqual(readerOpen.call_args[0][1], self.filename)
+		self.assertEqual(
+			len(list(glos)),
+			len(self.expectedEntries()),
+		)
+		self.assertEqual(
+			sorted(os.listdir(self.tmpDir)),
+			sorted([
+				os.path.basename(self.filename),
+				os.path.basename(self.indexPath),
+			]),
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
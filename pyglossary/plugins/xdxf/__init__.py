@@ -20,6 +20,7 @@
 # MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
 # GNU General Public License for more details.
 
+import re
 from os import path
 
 from formats_common import *
@@ -35,6 +36,7 @@ etree = None
 XML = None
 tostring = None
 transform = None
+batch_transform = None
 
 
 def import_xml_stuff():
@@ -45,7 +47,7 @@ def import_xml_stuff():
 	tostring = etree.tostring
 
 
-def read(glos, filename):
+class Reader(object):
 	"""
 	new format
 	<xdxf ...>
@@ -71,21 +73,91 @@ def read(glos, filename):
 		<ar>article 4</ar>
 		...
 	</xdxf>
+
+	file is parsed with `etree.iterparse`, and processed <ar> elements are
+	removed from the tree, so memory usage does not depend on file size
 	"""
 	# <!DOCTYPE xdxf SYSTEM "http://xdxf.sourceforge.net/xdxf_lousy.dtd">
-	import_xml_stuff()
 
+	def __init__(self, glos):
+		self._glos = glos
+		self._filename = ""
+		self._file = None
+		self._fileSize = 0
+		self._len = None
+
+	def open(self, filename):
+		import_xml_stuff()
+		self._filename = filename
+		self.read_metadata()
+		self._file = open(filename, "rb")
+		self._fileSize = os.path.getsize(filename)
+		self._glos.setDefaultDefiFormat("x")
+
+	def read_metadata(self):
+		"""
+		parses the beginning of file, until the first <ar> (or <lexicon>)
+		"""
+		with open(self._filename, "rb") as f:
+			context = etree.iterparse(f, events=("start", "end"))
+			for event, elem in context:
+				if event == "start":
+					if elem.tag in ("ar", "lexicon"):
+						# old format
+						read_metadata_old(self._glos, elem.getparent())
+						return
+				elif elem.tag == "meta_info":
+					# new format
+					read_metadata_new(self._glos, elem.getparent())
+					return
+
+	def close(self):
+		if self._file:
+			self._file.close()
+			self._file = None
+
+	def __len__(self):
+		if self._len is None:
+			log.debug("Try not to use len(reader) as it takes extra time")
+			self._len = count_articles(self._filename)
+		return self._len
+
+	def progressFraction(self):
+		if not (self._file and self._fileSize):
+			return 0.0
+		return self._file.tell() / self._fileSize
+
+	def __iter__(self):
+		if not self._file:
+			log.error("reader is not open, can not iterate")
+			return
+		context = etree.iterparse(self._file, events=("end",), tag="ar")
+		for _, article in context:
+			words, defi = read_article(article)
+			# remove processed elements from the tree
+			article.clear()
+			while article.getprevious() is not None:
+				del article.getparent()[0]
+			yield self._glos.newEntry(words, defi, defiFormat="x")
+
+
+def count_articles(filename):
+	"""
+	counts <ar> tags without parsing xml
+	"""
+	pattern = re.compile(b"<ar[\\s>]")
+	count = 0
+	tail = b""
 	with open(filename, "rb") as f:
-		xdxf = XML(f.read())
-
-	if len(xdxf) == 2:
-		# new format
-		read_metadata_new(glos, xdxf)
-		read_xdxf_new(glos, xdxf)
-	else:
-		# old format
-		read_metadata_old(glos, xdxf)
-		read_xdxf_old(glos, xdxf)
+		while True:
+			chunk = f.read(1024 * 1024)
+			if not chunk:
+				break
+			chunk = tail + chunk
+			count += len(pattern.findall(chunk))
+			# a tag that is split between chunks is found in the next one
+			tail = chunk[-3:]
+	return count
 
 
 def read_metadata_old(glos, xdxf):
@@ -97,10 +169,6 @@ def read_metadata_old(glos, xdxf):
 		glos.setInfo("description", description)
 
 
-def read_xdxf_old(glos, xdxf):
-	add_articles(glos, xdxf.iterfind("ar"))
-
-
 def read_metadata_new(glos, xdxf):
 	meta_info = xdxf.find("meta_info")
 	if meta_info is None:
@@ -117,26 +185,17 @@ def read_metadata_new(glos, xdxf):
 		glos.setInfo("description", description)
 
 
-def read_xdxf_new(glos, xdxf):
-	add_articles(glos, xdxf.find("lexicon").iterfind("ar"))
-
-
-def add_articles(glos, articles):
+def read_article(article):
 	"""
 
-	:param articles: iterator on <ar> tags
-	:return: None
+	:param article: <ar> tag
+	:return: (words (list of str), defi (str))
 	"""
-	glos.setDefaultDefiFormat("x")
-	for article in articles:
-		article.tail = None
-		defi = tostring(article, encoding="utf-8")
-		# <ar>...</ar>
-		defi = defi[4:-5].strip()
-		glos.addEntry(
-			[toStr(w) for w in titles(article)],
-			toStr(defi),
-		)
+	article.tail = None
+	defi = tostring(article, encoding="utf-8")
+	# <ar>...</ar>
+	defi = defi[4:-5].strip()
+	return [toStr(w) for w in titles(article)], toStr(defi)
 
 
 def titles(article):
@@ -185,9 +244,14 @@ def _mktitle(title_element, include_opts=()):
 
 def xdxf_init():
 	"""
-	call this only once, before `xdxf_to_html`.
+	call this only once in every process, before `xdxf_to_html`
+	or `xdxf_to_html_batch`.
+
+	to transform in a pool of worker processes, call it (directly or
+	from another function) as the pool initializer, so every worker
+	compiles the XSLT once, and only send strings to workers.
 	"""
-	global transform
+	global transform, batch_transform
 
 	import_xml_stuff()
 
@@ -198,6 +262,20 @@ def xdxf_init():
 	xslt_root = etree.XML(xslt_root_txt)
 	transform = etree.XSLT(xslt_root)
 
+	# for a batch document <batch><ar>...</ar><ar>...</ar></batch>
+	# the template of "/" is applied to every <ar> instead, and results
+	# are collected in a <batch> element
+	xsl_ns = "http://www.w3.org/1999/XSL/Transform"
+	for template in xslt_root.iterfind("{%s}template" % xsl_ns):
+		if template.get("match") == "/":
+			template.set("match", "ar")
+	xslt_root.append(etree.XML(
+		'<xsl:template match="/" xmlns:xsl="%s">' % xsl_ns +
+		'<batch><xsl:apply-templates select="batch/ar"/></batch>' +
+		'</xsl:template>'
+	))
+	batch_transform = etree.XSLT(xslt_root)
+
 
 def xdxf_to_html(xdxf_text):
 	"""
@@ -212,3 +290,30 @@ def xdxf_to_html(xdxf_text):
 	doc = etree.parse(f)
 	result_tree = transform(doc)
 	return tostring(result_tree, encoding="utf-8")
+
+
+def xdxf_to_html_batch(xdxf_texts):
+	"""
+	make sure to call `xdxf_init()` first.
+
+	transforms all articles in one document, with one XSLT run,
+	if the batch can not be parsed (because of an invalid article),
+	articles are transformed one by one
+
+	:param xdxf_texts: list of xdxf formatted strings
+	:return: list of html formatted strings, same as `xdxf_to_html`
+	"""
+	if not xdxf_texts:
+		return []
+	xdxf_txt = "<batch><ar>%s</ar></batch>" % "</ar><ar>".join(xdxf_texts)
+	try:
+		doc = etree.ElementTree(XML(xdxf_txt))
+	except etree.XMLSyntaxError:
+		return [xdxf_to_html(xdxf_text) for xdxf_text in xdxf_texts]
+	result_root = batch_transform(doc).getroot()
+	if result_root is None or len(result_root) != len(xdxf_texts):
+		return [xdxf_to_html(xdxf_text) for xdxf_text in xdxf_texts]
+	return [
+		tostring(result, encoding="utf-8", with_tail=False)
+		for result in result_root
+	]
@@ -0,0 +1,160 @@
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from os.path import dirname, abspath, join
+
+sys.path.insert(0, dirname(dirname(dirname(abspath(__file__)))))
+
+from pyglossary.tests_common import getPlugin
+from pyglossary.glossary import Glossary
+
+xdxf = getPlugin("Xdxf")
+
+articles = [
+	"<k>hello</k>a greeting",
+	"<k>colo<opt>u</opt>r</k><k>tint</k>the property of <b>light</b>",
+	"<k>world</k><i>n.</i> the earth <kref>globe</kref>",
+	"<k>x&amp;y</k>ampersand &lt; and more",
+	"<k>multi</k><def><def>first</def><def>second</def></def>",
+	"<k>empty</k>",
+]
+
+oldLayout = """<?xml version="1.0" encoding="UTF-8" ?>
+<xdxf lang_from="ENG" lang_to="DEU" format="visual">
+<full_name>Old Dictionary</full_name>
+<description>old layout</description>
+%s
+</xdxf>
+"""
+
+newLayout = """<?xml version="1.0" encoding="UTF-8" ?>
+<xdxf lang_from="ENG" lang_to="DEU" format="logical" revision="033">
+<meta_info>
+<title>New</title>
+<full_title>New Dictionary</full_title>
+<description>new layout</description>
+</meta_info>
+<lexicon>
+%s
+</lexicon>
+</xdxf>
+"""
+
+
+class XdxfReaderTest(unittest.TestCase):
+	def setUp(self):
+		self.tmpDir = tempfile.mkdtemp(prefix="pyglossary-test-")
+
+	def tearDown(self):
+		shutil.rmtree(self.tmpDir)
+
+	def writeXdxf(self, layout, articles, name="test.xdxf"):
+		filename = join(self.tmpDir, name)
+		with open(filename, "w", encoding="utf-8") as fp:
+			fp.write(layout % "\n".join(
+				"<ar>%s</ar>" % article for article in articles
+			))
+		return filename
+
+	def readEntries(self, filename):
+		glos = Glossary()
+		reader = xdxf.Reader(glos)
+		reader.open(filename)
+		try:
+			entries = [
+				(entry.getWords(), entry.getDefi(), entry.getDefiFormat())
+				for entry in reader
+			]
+		finally:
+			reader.close()
+		return glos, entries
+
+	def assertEntries(self, entries):
+		self.assertEqual(len(entries), len(articles))
+		for words, defi, defiFormat in entries:
+			self.assertEqual(defiFormat, "x")
+		self.assertEqual(entries[0][:2], (["hello"], "<k>hello</k>a greeting"))
+		self.assertEqual(entries[1][0], ["color", "colour", "tint"])
+		self.assertEqual(entries[3][0], ["x&y"])
+		self.assertEqual(entries[3][1], articles[3])
+		self.assertEqual(entries[4][1], articles[4])
+
+	def test_old_layout(self):
+		glos, entries = self.readEntries(self.writeXdxf(oldLayout, articles))
+		self.assertEqual(glos.getInfo("name"), "Old Dictionary")
+		self.assertEqual(glos.getInfo("description"), "old layout")
+		self.assertEntries(entries)
+
+	def test_new_layout(self):
+		glos, entries = self.readEntries(self.writeXdxf(newLayout, articles))
+		self.assertEqual(glos.getInfo("name"), "New Dictionary")
+		self.assertEqual(glos.getInfo("description"), "new layout")
+		self.assertEntries(entries)
+
+	def test_new_layout_title(self):
+		layout = newLayout.replace(
+			"<full_title>New Dictionary</full_title>",
+			"<full_title></full_title>",
+		)
+		glos, entries = self.readEntries(self.writeXdxf(layout, articles))
+		self.assertEqual(glos.getInfo("name"), "New")
+
+	def test_len(self):
+		# more than one chunk of count_articles, with tags split
+		# between chunks
+		manyArticles = [
+			"<k>word%d</k>%s" % (index, "d" * (index % 97))
+			for index in range(40000)
+		]
+		for layout in (oldLayout, newLayout):
+			filename = self.writeXdxf(layout, manyArticles)
+			glos = Glossary()
+			reader = xdxf.Reader(glos)
+			reader.open(filename)
+			self.assertEqual(len(reader), len(manyArticles))
+			self.assertEqual(len(list(reader)), len(manyArticles))
+			reader.close()
+		# at every split position of "<ar>" in chunk boundary
+		chunkSize = 1024 * 1024
+		for split in range(5):
+			filename = join(self.tmpDir, "split%d.xdxf" % split)
+			with open(filename, "wb") as fp:
+				fp.write(b" " * (chunkSize - split) + b"<ar>a</ar><ar\n>b</ar>")
+			self.assertEqual(xdxf.count_articles(filename), 2, split)
+
+
+class XdxfToHtmlTest(unittest.TestCase):
+	@classmethod
+	def setUpClass(cls):
+		xdxf.xdxf_init()
+
+	def test_batch(self):
+		texts = articles * 3
+		self.assertEqual(
+			xdxf.xdxf_to_html_batch(texts),
+			[xdxf.xdxf_to_html(text) for text in texts],
+		)
+		self.assertEqual(xdxf.xdxf_to_html_batch([]), [])
+
+	def test_batch_invalid(self):
+		# an invalid article makes the batch fall back to one by one
+		texts = articles[:2] + ["<k>broken</k><b>unclosed", articles[2]]
+		with mock.patch.object(
+			xdxf,
+			"xdxf_to_html",
+			wraps=xdxf.xdxf_to_html,
+		) as xdxf_to_html:
+			with self.assertRaises(xdxf.etree.XMLSyntaxError):
+				xdxf.xdxf_to_html_batch(texts)
+		self.assertEqual(xdxf_to_html.call_count, 3)
+		validTexts = articles[:2] + [articles[2]]
+		self.assertEqual(
+			xdxf.xdxf_to_html_batch(validTexts),
+			[xdxf.xdxf_to_html(text) for text in validTexts],
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
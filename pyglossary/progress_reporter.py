@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import json
+from time import time as now
+
+import logging
+log = logging.getLogger("root")
+
+
+def formatDuration(seconds):
+	seconds = int(seconds)
+	return "%d:%.2d:%.2d" % (
+		seconds // 3600,
+		seconds // 60 % 60,
+		seconds % 60,
+	)
+
+
+def formatProgressStat(stat):
+	"""
+	returns a short human-readable text for the progress bar
+	"""
+	parts = []
+	if stat["total"]:
+		parts.append("%d / %d" % (stat["count"], stat["total"]))
+	else:
+		parts.append("%d" % stat["count"])
+	parts.append("%d entries/s" % stat["entriesPerSec"])
+	if stat["bytesPerSec"] is not None:
+		parts.append("%.2f MB/s" % (stat["bytesPerSec"] / 1024 ** 2))
+	if stat["eta"] is not None:
+		parts.append("ETA: %s" % formatDuration(stat["eta"]))
+	return ", ".join(parts)
+
+
+class ProgressReporter(object):
+	"""
+	Reports progress of a long running loop (reading, converting or
+	writing entries) without slowing down the loop itself.
+
+	The loop only sets `reporter.count` (number of processed entries),
+	and calls `reporter.flush()` when `reporter.pending` is True.
+	A separate thread samples the counter every `interval` seconds,
+	and publishes entries/s, MB/s, ETA and the current stage to the UI
+	and to `jsonFile` (if given) as JSON lines, one object per sample.
+
+	UI is updated from the sampling thread only if `ui.progressThreadSafe`
+	is True, otherwise (GUI toolkits) the update is deferred to the loop's
+	thread through `reporter.flush()`.
+	"""
+	def __init__(self, ui=None, jsonFile=None, interval=0.5):
+		self.ui = ui
+		self.jsonFile = jsonFile
+		self.interval = interval
+		self.count = 0
+		self.pending = False
+		self._uiThreadSafe = getattr(ui, "progressThreadSafe", False)
+		self._stage = ""
+		self._total = 0
+		self._fractionFunc = None
+		self._totalBytes = 0
+		self._startTime = 0
+		self._stat = None
+		self._thread = None
+		self._stopEvent = threading.Event()
+
+	def start(self, stage, total=0, fractionFunc=None, totalBytes=0):
+		"""
+		stage (str): title of current stage, like "Reading" or "Writing"
+		total (int): total number of entries, or 0 if not known
+		fractionFunc (callable or None): returns the fraction of work
+			done (a float between 0 and 1), like `reader.progressFraction`
+			if not given, `count / total` is used
+		totalBytes (int): size of input in bytes, or 0 if not known
+			used together with `fractionFunc` to calculate MB/s
+		"""
+		self._stage = stage
+		self._total = total
+		self._fractionFunc = fractionFunc
+		self._totalBytes = totalBytes
+		self._stat = None
+		self.count = 0
+		self.pending = False
+		self._startTime = now()
+		if self.ui:
+			self.ui.progressInit(stage)
+		self._writeJson("start", self.sample())
+		self._stopEvent.clear()
+		self._thread = threading.Thread(
+			target=self._run,
+			name="ProgressReporter",
+		)
+		self._thread.daemon = True
+		self._thread.start()
+
+	def stop(self):
+		if self._thread is None:
+			return
+		self._stopEvent.set()
+		self._thread.join()
+		self._thread = None
+		self.pending = False
+		stat = self.sample()
+		self._writeJson("end", stat)
+		if self.ui:
+			self._updateUI(stat)
+			self.ui.progressEnd()
+
+	def _run(self):
+		while not self._stopEvent.wait(self.interval):
+			self._publish(self.sample())
+
+	def sample(self):
+		"""
+		returns a dict with current statistics
+		"""
+		count = self.count
+		elapsed = now() - self._startTime
+		fraction = None
+		if self._fractionFunc is not None:
+			try:
+				fraction = min(self._fractionFunc(), 1.0)
+			except Exception:
+				# file can be closed before we are stopped
+				fraction = None
+		elif self._total:
+			fraction = min(count / self._total, 1.0)
+		stat = {
+			"stage": self._stage,
+			"count": count,
+			"total": self._total or None,
+			"fraction": fraction,
+			"elapsed": elapsed,
+			"entriesPerSec": count / elapsed if elapsed > 0 else 0.0,
+			"bytesPerSec": None,
+			"eta": None,
+		}
+		if fraction is not None:
+			if self._totalBytes and elapsed > 0:
+				stat["bytesPerSec"] = fraction * self._totalBytes / elapsed
+			if fraction > 0:
+				stat["eta"] = elapsed * (1 - fraction) / fraction
+		return stat
+
+	def _publish(self, stat):
+		self._writeJson("progress", stat)
+		if not self.ui:
+			return
+		if self._uiThreadSafe:
+			self._updateUI(stat)
+		else:
+			self._stat = stat
+			self.pending = True
+
+	def flush(self):
+		"""
+		update UI with the last sample
+		must be called from the thread that runs the UI
+		"""
+		self.pending = False
+		stat = self._stat
+		if stat is not None:
+			self._updateUI(stat)
+
+	def _updateUI(self, stat):
+		if stat["fraction"] is None:
+			return
+		self.ui.progress(stat["fraction"], formatProgressStat(stat))
+
+	def _writeJson(self, event, stat):
+		if not self.jsonFile:
+			return
+		record = {"event": event, "time": now()}
+		record.update(stat)
+		try:
+			self.jsonFile.write(json.dumps(record) + "\n")
+			self.jsonFile.flush()
+		except Exception:
+			log.exception("error while writing progress to JSON stream")
+			self.jsonFile = None
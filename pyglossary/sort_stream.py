@@ -2,10 +2,16 @@
 
 from heapq import heappush, heappop
 from heapq import merge
+from tempfile import TemporaryFile
+import pickle
 
 import logging
 log = logging.getLogger('root')
 
+# default maximum (estimated) size of items that externalSortStream keeps
+# in memory, in bytes, more items are sorted in chunks in temporary files
+defaultChunkBytes = 128 * 1024 ** 2
+
 
 def hsortStream(stream, maxHeapSize, key=None):
 	"""
@@ -49,6 +55,65 @@ def hsortStreamList(streams, *args, **kwargs):
 	return merge(*tuple(streams))
 
 
+def _readSortedChunk(fp):
+	fp.seek(0)
+	while True:
+		try:
+			yield pickle.load(fp)
+		except EOFError:
+			break
+	fp.close()
+
+
+def externalSortStream(stream, maxChunkBytes, key=None, sizeFunc=len):
+	"""
+		stream: a generator or iterable
+		maxChunkBytes: int, maximum (estimated) size of items that are
+			kept in memory, in bytes
+		key: a key function, as in `list.sort` method, or `sorted` function
+		sizeFunc: a function that returns the (estimated) size of an item
+
+		sorts `stream` completely (unlike hsortStream) with bounded memory:
+		sorted chunks of items are pickled into temporary files, and merged
+		items must be picklable
+
+		the sort is Stable, like hsortStream
+	"""
+	if key is None:
+		key = lambda item: item
+	chunkFiles = []
+	chunk = []
+	chunkBytes = 0
+	for index, item in enumerate(stream):
+		chunk.append((
+			key(item),  # for sorting order
+			index,  # for sort being Stable
+			item,  # for fetching result
+		))
+		chunkBytes += sizeFunc(item)
+		if chunkBytes >= maxChunkBytes:
+			chunk.sort()
+			fp = TemporaryFile(prefix="pyglossary-sort-")
+			# every row is pickled separately, a shared Pickler would keep
+			# references to all dumped objects in its memo, and clearing
+			# the memo breaks unpickling of rows that contain shared objects
+			for row in chunk:
+				pickle.dump(row, fp, pickle.HIGHEST_PROTOCOL)
+			chunkFiles.append(fp)
+			chunk = []
+			chunkBytes = 0
+	chunk.sort()
+	if chunkFiles:
+		log.info(
+			"External sort: merging %s sorted chunks" % (len(chunkFiles) + 1)
+		)
+	for row in merge(
+		iter(chunk),
+		*[_readSortedChunk(fp) for fp in chunkFiles]
+	):
+		yield row[2]
+
+
 def stdinIntegerStream():
 	while True:
 		line = input(' Input item: ')
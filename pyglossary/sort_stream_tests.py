@@ -0,0 +1,53 @@
+import sys
+import unittest
+import random
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from pyglossary.sort_stream import externalSortStream
+
+
+class ExternalSortStreamTest(unittest.TestCase):
+	def test_many_chunks(self):
+		random.seed(0)
+		items = [random.randrange(1000) for _ in range(5000)]
+		self.assertEqual(
+			list(externalSortStream(items, 100, sizeFunc=lambda item: 1)),
+			sorted(items),
+		)
+
+	def test_stable(self):
+		items = [(index % 7, index) for index in range(1000)]
+		self.assertEqual(
+			list(externalSortStream(
+				items,
+				50,
+				key=lambda item: item[0],
+				sizeFunc=lambda item: 1,
+			)),
+			sorted(items, key=lambda item: item[0]),
+		)
+
+	def test_shared_objects(self):
+		"""
+		rows where key and item (or parts of item) are the same object
+		must be decoded correctly from every chunk
+		"""
+		words = ["word%03d" % index for index in range(300)]
+		random.seed(1)
+		random.shuffle(words)
+		items = [(word, word, [word]) for word in words]
+		self.assertEqual(
+			list(externalSortStream(
+				items,
+				20,
+				key=lambda item: item[0],
+				sizeFunc=lambda item: 1,
+			)),
+			sorted(items),
+		)
+
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,23 @@
+"""
+setup that is shared by test modules (*_tests.py) of pyglossary
+and its plugins
+"""
+
+import logging
+
+from pyglossary import core
+from pyglossary.glossary import Glossary
+
+# since Python 3.9, logging.getLogger("root") returns the root logger,
+# which is not an instance of core.MyLogger
+if not hasattr(logging.getLogger("root"), "pretty"):
+	logging.RootLogger.pretty = core.MyLogger.pretty
+	logging.RootLogger.isDebug = core.MyLogger.isDebug
+
+
+def getPlugin(format):
+	"""
+	returns the module of plugin `format`, the same module that
+	Glossary uses for reading and writing (loaded by Glossary.loadPlugins)
+	"""
+	return Glossary.plugins[format]
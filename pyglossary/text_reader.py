@@ -1,3 +1,5 @@
+import os
+
 from pyglossary.file_utils import fileCountLines
 from pyglossary.entry import Entry
 
@@ -10,6 +12,7 @@ class TextGlossaryReader(object):
 		self._glos = glos
 		self._filename = ''
 		self._file = None
+		self._fileSize = 0
 		self._hasInfo = True
 		self._leadingLinesCount = 0
 		self._pendingEntries = []
@@ -19,6 +22,7 @@ class TextGlossaryReader(object):
 	def open(self, filename, encoding='utf-8'):
 		self._filename = filename
 		self._file = open(filename, 'r', encoding=encoding)
+		self._fileSize = os.path.getsize(filename)
 		if self._hasInfo:
 			self.loadInfo()
 
@@ -79,6 +83,28 @@ class TextGlossaryReader(object):
 	def __iter__(self):
 		return self
 
+	def progressFraction(self):
+		"""
+		returns the fraction of input file bytes consumed so far
+		"""
+		if not (self._file and self._fileSize):
+			return 0.0
+		return self._file.buffer.tell() / self._fileSize
+
+	def checkpointState(self):
+		"""
+		returns position of reader, to be given to `resumeFrom` later
+		"""
+		return {'offset': self._file.tell()}
+
+	def resumeFrom(self, state):
+		"""
+		continue reading after the entry that `checkpointState` was called
+		must be called before iterating over reader
+		"""
+		self._pendingEntries = []
+		self._file.seek(state['offset'])
+
 	def isInfoWord(self, word):
 		raise NotImplementedError
 
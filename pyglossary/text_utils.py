@@ -161,7 +161,7 @@ def replacePostSpaceChar(st, ch):
 	return st.replace(" "+ch, ch).replace(ch, ch+" ").replace(ch+"  ", ch+" ")
 
 
-def runDictzip(filename):
+def runDictzip(filename, ext=".dict"):
 	import subprocess
 	dictzipCmd = "/usr/bin/dictzip"  # Save in pref FIXME
 	if not os.path.isfile(dictzipCmd):
@@ -169,7 +169,7 @@ def runDictzip(filename):
 	if filename[-4:] == ".ifo":
 		filename = filename[:-4]
 	(out, err) = subprocess.Popen(
-		[dictzipCmd, filename+".dict"],
+		[dictzipCmd, filename+ext],
 		stdout=subprocess.PIPE
 	).communicate()
 #	out = p3[1].read()
@@ -118,12 +118,6 @@ if py2exe:
 		("doc/pyglossary/non-gui_examples",
 			glob.glob("doc/non-gui_examples/*")),
 	]
-	for pyVer in ("34", "35", "36"):
-		relPath = "plugin_lib/py%s" % pyVer
-		data_files.append((
-			relPath,
-			glob.glob("pyglossary/" + relPath + "/*.py",
-		)))
 else:
 	py2exeoptions = {}
 
@@ -149,7 +143,6 @@ setup(
 		"pyglossary": [
 			"plugins/*.py",
 			"plugin_lib/*.py",
-			"plugin_lib/py*/*.py",
 		] + [
 			# safest way found so far to include every resource of plugins
 			# producing plugins/pkg/*, plugins/pkg/sub1/*, ... except .pyc/.pyo
@@ -40,6 +40,8 @@ authors = fread(join(dataDir, 'AUTHORS')).split('\n')
 
 
 class UIBase(object):
+	# True if progress methods can be called from a non-UI thread
+	progressThreadSafe = False
 	prefKeys = (
 		'noProgressBar',## command line
 		'ui_autoSetFormat',
@@ -158,6 +158,9 @@ class NullObj(object):
 
 
 class UI(UIBase):
+	# progressbar only writes to terminal
+	progressThreadSafe = True
+
 	def __init__(self, **options):
 		self.pref = {}
 		# log.debug(self.pref)
@@ -78,3 +78,19 @@ class UI(qt.QWidget, UIBase):
 		######################
 		vbox = qt.QVBoxLayout()
 		self.setLayout(vbox)
+		######################
+		self.progressTitle = ''
+		self.progressBar = qt.QProgressBar()
+		self.progressBar.setRange(0, 1000)
+		vbox.addWidget(self.progressBar)
+
+	def progressInit(self, title):
+		self.progressTitle = title
+
+	def progress(self, rat, text=''):
+		if not text:
+			text = '%%%d' % (rat*100)
+		text += ' - %s' % self.progressTitle
+		self.progressBar.setValue(int(rat*1000))
+		self.progressBar.setFormat(text)
+		qt.QApplication.processEvents()